@@ -0,0 +1,165 @@
+# analysis_cache.py
+
+import hashlib
+import logging
+import sys
+import threading
+import unicodedata
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from db import LazyCollection
+
+# Logger setup
+logger = logging.getLogger("AnalysisCache")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+ANALYSIS_CACHE_COLLECTION = 'analysis_cache'
+
+# Bump a version whenever the model or its thresholds change; entries cached
+# under another version are ignored and can be purged.
+TOXICITY_MODEL_VERSION = 'moderatehatespeech-v1:conf>0.9'
+SENTIMENT_MODEL_VERSION = 'vader-compound-v1'
+
+# MongoDB collection, connected on first use
+analysis_cache_collection = LazyCollection(ANALYSIS_CACHE_COLLECTION)
+
+def normalize_text(text):
+    """
+    Normalizes text before hashing: Unicode NFC and collapsed whitespace.
+
+    Case is kept because VADER scores capitalization.
+    """
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+def text_hash(text):
+    """Returns the SHA-256 hex digest of the normalized text."""
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+class AnalysisCache:
+    """
+    Persistent cache of per-text analysis results, keyed by a hash of the normalized text.
+
+    Re-crawled posts, reposted copy-pasta and boilerplate comments are looked up
+    instead of being re-scored. Entries are tagged with `kind` and `model_version`.
+    MongoDB errors degrade to cache misses and never fail a crawl.
+    """
+
+    def __init__(self, collection, kind, model_version):
+        self.collection = collection
+        self.kind = kind
+        self.model_version = model_version
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, digest):
+        return f"{self.kind}:{self.model_version}:{digest}"
+
+    def _load(self, digests):
+        try:
+            cursor = self.collection.find(
+                {'_id': {'$in': [self._key(digest) for digest in digests]}},
+                {'value': 1}
+            )
+            return {doc['_id'].rsplit(':', 1)[1]: doc['value'] for doc in cursor}
+        except PyMongoError as e:
+            logger.error(f"Failed to read {self.kind} cache: {e}")
+            return {}
+
+    def _store(self, results):
+        now = datetime.utcnow()
+        ops = [
+            UpdateOne(
+                {'_id': self._key(digest)},
+                {'$setOnInsert': {'kind': self.kind, 'model': self.model_version, 'value': value, 'created_at': now}},
+                upsert=True
+            )
+            for digest, value in results.items()
+        ]
+        if not ops:
+            return
+        try:
+            self.collection.bulk_write(ops, ordered=False)
+        except PyMongoError as e:
+            logger.error(f"Failed to write {self.kind} cache: {e}")
+
+    def lookup(self, texts, compute_many):
+        """
+        Returns one result per text, computing only the texts not cached yet.
+
+        Parameters:
+            texts (iterable): Texts to analyse; empty texts are passed through to compute_many.
+            compute_many (callable): Computes results for a list of texts. None results
+                                     (e.g. API failures) are returned but not cached.
+
+        Returns:
+            list: One result per text, in input order.
+        """
+        texts = list(texts)
+        digests = [text_hash(text) if text else None for text in texts]
+        unique = {digest for digest in digests if digest}
+        cached = self._load(unique) if unique else {}
+
+        # Compute each distinct missing text once
+        missing = {}
+        for text, digest in zip(texts, digests):
+            if digest and digest not in cached and digest not in missing:
+                missing[digest] = text
+        if missing:
+            computed = dict(zip(missing, compute_many(list(missing.values()))))
+            self._store({digest: value for digest, value in computed.items() if value is not None})
+            cached.update(computed)
+
+        with self.lock:
+            self.hits += len(unique) - len(missing)
+            self.misses += len(missing)
+            lookups = self.hits + self.misses
+            hit_rate = self.hits / lookups if lookups else 0.0
+        if unique:
+            logger.info(f"{self.kind} cache: {len(unique) - len(missing)} hits, {len(missing)} misses (process hit rate {hit_rate:.1%})")
+
+        empty = [text for text, digest in zip(texts, digests) if not digest]
+        empty_results = iter(compute_many(empty)) if empty else iter(())
+        return [cached.get(digest) if digest else next(empty_results) for digest in digests]
+
+    def stats(self):
+        """Returns this process's hit/miss counters."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'kind': self.kind,
+                'model': self.model_version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+toxicity_cache = AnalysisCache(analysis_cache_collection, 'toxicity', TOXICITY_MODEL_VERSION)
+sentiment_cache = AnalysisCache(analysis_cache_collection, 'sentiment', SENTIMENT_MODEL_VERSION)
+
+def purge_stale_entries(collection=analysis_cache_collection):
+    """Deletes entries cached under a model version other than the current ones."""
+    result = collection.delete_many({'$or': [
+        {'kind': 'toxicity', 'model': {'$ne': TOXICITY_MODEL_VERSION}},
+        {'kind': 'sentiment', 'model': {'$ne': SENTIMENT_MODEL_VERSION}},
+    ]})
+    logger.info(f"Purged {result.deleted_count} stale analysis cache entries")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ('stats', 'purge'):
+        print("Usage: python analysis_cache.py stats|purge")
+        sys.exit(1)
+
+    if sys.argv[1] == 'purge':
+        purge_stale_entries()
+    else:
+        for row in analysis_cache_collection.aggregate([
+            {'$group': {'_id': {'kind': '$kind', 'model': '$model'}, 'entries': {'$sum': 1}}},
+            {'$sort': {'_id.kind': 1, '_id.model': 1}}
+        ]):
+            logger.info(f"{row['_id']['kind']} ({row['_id']['model']}): {row['entries']} entries")
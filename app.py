@@ -1,20 +1,34 @@
 
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from flask_cors import CORS
+from pymongo.errors import PyMongoError
 from utils import (
-    fetch_reddit_data,
-    fetch_4chan_sentiment,
-    calculate_sentiment_trend,
-    calculate_toxicity_distribution,
-    calculate_average_scores,
-    calculate_sentiment_score_trend,
+    iter_reddit_data,
+    iter_4chan_data,
+    fetch_reddit_columns,
+    fetch_4chan_columns,
+    fetch_reddit_snapshot_columns,
+    fetch_4chan_snapshot_columns,
+    calculate_source_metrics,
+    calculate_columnar_metrics,
+    aggregate_reddit_metrics,
+    aggregate_4chan_metrics,
+    rollup_metrics,
     get_available_subreddits,
     get_available_boards,
-    calculate_keyword_counts
+    calculate_keyword_counts,
+    KEYWORD_PROJECTION,
+    source_versions
 )
+from response_cache import ResponseCache
+from crawl_cadence import cadence_stats
+from export import EXPORT_FORMATS, export_stream
+from keyword_matcher import get_matcher
 from datetime import datetime
+import itertools
 import logging
+import os
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -22,16 +36,58 @@ logging.basicConfig(level=logging.DEBUG)
 app = Flask(__name__)
 CORS(app)
 
-# Synonyms for positive and negative phrases
-POSITIVE_SYNONYMS = [
-    "i got a job", "offer letter", "new position", "hired", "accepted",
-    "secure a job", "started a new job", "job secured", "job offer", "employment secured"
-]
+# How /api/*/data computes its metrics: 'aggregate' (MongoDB pipeline),
+# 'rollup' (daily_rollups maintained by the crawlers), 'columnar' (NumPy), 'python',
+# or 'snapshot' (NumPy over the Arrow snapshot files, without touching MongoDB).
+# Can be overridden per request with ?mode=...
+METRICS_MODE = os.getenv('METRICS_MODE', 'aggregate')
 
-NEGATIVE_SYNONYMS = [
-    "i was rejected", "laid off", "unemployed", "terminated", "fired",
-    "job loss", "facing unemployment", "jobless", "dismissed", "let go"
-]
+# LRU cache for /api/* responses, invalidated when the crawlers write to a source
+response_cache = ResponseCache(
+    source_versions,
+    max_bytes=int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+)
+
+def get_metrics_mode():
+    """Returns the metrics mode requested for this call, falling back to METRICS_MODE."""
+    return request.args.get('mode', METRICS_MODE)
+
+def compute_metrics(platform, start_date, end_date, sources):
+    """
+    Computes the /api/*/data response for one platform using the requested metrics mode.
+
+    Rollups or snapshot files are read when requested. Otherwise the aggregation pipeline is preferred;
+    the Python path is used when requested or when the server rejects the pipeline
+    (e.g. MongoDB older than 5.0).
+
+    Returns:
+        dict or None: Dashboard response, or None if no data matched.
+    """
+    if platform == 'reddit':
+        aggregate, iterate, fetch_columns, source_field = aggregate_reddit_metrics, iter_reddit_data, fetch_reddit_columns, 'subreddit'
+        fetch_snapshot = fetch_reddit_snapshot_columns
+    else:
+        aggregate, iterate, fetch_columns, source_field = aggregate_4chan_metrics, iter_4chan_data, fetch_4chan_columns, 'board'
+        fetch_snapshot = fetch_4chan_snapshot_columns
+
+    mode = get_metrics_mode()
+    if mode == 'rollup':
+        return rollup_metrics(platform, start_date, end_date, sources)
+
+    if mode == 'snapshot':
+        return calculate_columnar_metrics(fetch_snapshot(start_date, end_date, sources), sources, platform=platform)
+
+    if mode == 'columnar':
+        return calculate_columnar_metrics(fetch_columns(start_date, end_date, sources), sources, platform=platform)
+
+    if mode == 'aggregate':
+        try:
+            return aggregate(start_date, end_date, sources)
+        except PyMongoError as e:
+            logging.warning(f"Aggregation failed, falling back to Python metrics: {str(e)}")
+
+    # Stream the cursor through a single-pass accumulator instead of loading every document
+    return calculate_source_metrics(iterate(start_date, end_date, sources), sources, source_field, platform=platform)
 
 @app.route('/')
 def index():
@@ -59,51 +115,15 @@ def reddit_data():
             logging.warning("No subreddits selected.")
             return jsonify({'error': 'No subreddits selected.'}), 400
 
-        # Fetch combined Reddit posts and comments
-        data = fetch_reddit_data(start_date, end_date, selected_subreddits)
-        if not data:
+        # Calculate metrics for each subreddit from combined Reddit posts and comments
+        response = response_cache.get_or_compute(
+            f"{request.path}?mode={get_metrics_mode()}", start_date, end_date, {'reddit': selected_subreddits},
+            lambda: compute_metrics('reddit', start_date, end_date, selected_subreddits)
+        )
+        if not response:
             logging.warning("No Reddit data found for the selected criteria.")
             return jsonify({'error': 'No Reddit data found for the selected criteria.'}), 404
 
-        # Calculate metrics for each subreddit
-        sentiment_trend = {}
-        toxicity_distribution = {}
-        average_scores = {}
-        sentiment_score_trend = {}
-
-        for subreddit in selected_subreddits:
-            # Filter data for the current subreddit
-            subreddit_data = [doc for doc in data if doc.get('subreddit') == subreddit]
-            if not subreddit_data:
-                logging.warning(f"No data found for subreddit: {subreddit}")
-                continue
-
-            # Calculate metrics
-            dates, avg_sentiments = calculate_sentiment_trend(subreddit_data)
-            toxicity = calculate_toxicity_distribution(subreddit_data, platform='reddit')
-            avg_score = calculate_average_scores(subreddit_data, platform='reddit')
-            dates_ss, avg_sentiment_scores = calculate_sentiment_score_trend(subreddit_data, platform='reddit')
-
-            # Populate response dictionaries
-            sentiment_trend[subreddit] = {
-                'dates': [date.strftime('%Y-%m-%d') for date in dates],
-                'values': avg_sentiments
-            }
-            toxicity_distribution[subreddit] = toxicity
-            average_scores[subreddit] = avg_score
-            sentiment_score_trend[subreddit] = {
-                'dates': [date.strftime('%Y-%m-%d') for date in dates_ss],
-                'values': avg_sentiment_scores
-            }
-
-        # Prepare response
-        response = {
-            'sentiment_trend': sentiment_trend,
-            'toxicity_distribution': toxicity_distribution,
-            'average_scores': average_scores,
-            'sentiment_score_trend': sentiment_score_trend
-        }
-
         logging.debug(f"Responding with Reddit data: {response}")
 
         return jsonify(response)
@@ -129,51 +149,15 @@ def chan_data():
             logging.warning("No boards selected.")
             return jsonify({'error': 'No boards selected.'}), 400
 
-        # Fetch 4chan posts
-        data = fetch_4chan_sentiment(start_date, end_date, selected_boards)
-        if not data:
+        # Calculate metrics for each board from 4chan posts
+        response = response_cache.get_or_compute(
+            f"{request.path}?mode={get_metrics_mode()}", start_date, end_date, {'4chan': selected_boards},
+            lambda: compute_metrics('4chan', start_date, end_date, selected_boards)
+        )
+        if not response:
             logging.warning("No 4chan data found for the selected criteria.")
             return jsonify({'error': 'No 4chan data found for the selected criteria.'}), 404
 
-        # Calculate metrics for each board
-        sentiment_trend = {}
-        toxicity_distribution = {}
-        average_scores = {}
-        sentiment_score_trend = {}
-
-        for board in selected_boards:
-            # Filter data for the current board
-            board_data = [doc for doc in data if doc.get('board') == board]
-            if not board_data:
-                logging.warning(f"No data found for board: {board}")
-                continue
-
-            # Calculate metrics
-            dates, avg_sentiments = calculate_sentiment_trend(board_data)
-            toxicity = calculate_toxicity_distribution(board_data, platform='4chan')
-            avg_score = calculate_average_scores(board_data, platform='4chan')
-            dates_ss, avg_sentiment_scores = calculate_sentiment_score_trend(board_data, platform='4chan')
-
-            # Populate response dictionaries
-            sentiment_trend[board] = {
-                'dates': [date.strftime('%Y-%m-%d') for date in dates],
-                'values': avg_sentiments
-            }
-            toxicity_distribution[board] = toxicity
-            average_scores[board] = avg_score
-            sentiment_score_trend[board] = {
-                'dates': [date.strftime('%Y-%m-%d') for date in dates_ss],
-                'values': avg_sentiment_scores
-            }
-
-        # Prepare response
-        response = {
-            'sentiment_trend': sentiment_trend,
-            'toxicity_distribution': toxicity_distribution,
-            'average_scores': average_scores,
-            'sentiment_score_trend': sentiment_score_trend
-        }
-
         logging.debug(f"Responding with 4chan data: {response}")
 
         return jsonify(response)
@@ -199,38 +183,42 @@ def word_counts():
             logging.warning("Invalid platform selected.")
             return jsonify({'error': 'Invalid platform selected. Choose from "reddit", "4chan", or "all".'}), 400
 
-        combined_data = []
+        selections = {}
 
         if platform in ['reddit', 'all']:
-            # Fetch Reddit data
-            selected_subreddits = request.args.getlist('subreddits')
-            if selected_subreddits:
-                reddit_data = fetch_reddit_data(start_date, end_date, selected_subreddits)
-                combined_data.extend(reddit_data)
-            else:
+            selections['reddit'] = request.args.getlist('subreddits')
+            if not selections['reddit']:
                 logging.warning("No subreddits selected for Reddit data.")
 
         if platform in ['4chan', 'all']:
-            # Fetch 4chan data
-            selected_boards = request.args.getlist('boards')
-            if selected_boards:
-                chan_data = fetch_4chan_sentiment(start_date, end_date, selected_boards)
-                combined_data.extend(chan_data)
-            else:
+            selections['4chan'] = request.args.getlist('boards')
+            if not selections['4chan']:
                 logging.warning("No boards selected for 4chan data.")
 
-        if not combined_data:
+        def compute_keyword_response():
+            streams = []
+            if selections.get('reddit'):
+                # Stream Reddit posts and comments
+                streams.append(iter_reddit_data(start_date, end_date, selections['reddit'], projection=KEYWORD_PROJECTION))
+            if selections.get('4chan'):
+                # Stream 4chan posts
+                streams.append(iter_4chan_data(start_date, end_date, selections['4chan'], projection=KEYWORD_PROJECTION))
+
+            # Calculate keyword counts for every lexicon category
+            keyword_counts = calculate_keyword_counts(itertools.chain.from_iterable(streams))
+            if not keyword_counts:
+                return None
+            return {
+                'keyword_counts': keyword_counts
+            }
+
+        # Responses computed with an edited lexicon config are not reused
+        endpoint = f"{request.path}?lexicons={get_matcher().fingerprint}"
+        response = response_cache.get_or_compute(endpoint, start_date, end_date, selections, compute_keyword_response)
+        if not response:
             logging.warning("No data found for the selected criteria.")
             return jsonify({'error': 'No data found for the selected criteria.'}), 404
 
-        # Calculate keyword counts
-        keyword_counts = calculate_keyword_counts(combined_data, POSITIVE_SYNONYMS, NEGATIVE_SYNONYMS)
-
-        # Prepare response
-        response = {
-            'keyword_counts': keyword_counts
-        }
-
         logging.debug(f"Responding with keyword counts: {response}")
 
         return jsonify(response)
@@ -239,5 +227,49 @@ def word_counts():
         logging.error(f"Error in /api/word_counts: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/export', methods=['GET'])
+def export_data():
+    """
+    Streams raw documents for offline analysis.
+
+    Query parameters: dataset (reddit_posts, reddit_comments or chan_posts),
+    start_date and end_date (YYYY-MM-DD, both included), sources (repeatable,
+    subreddits or boards; all by default), fields (comma-separated; all by
+    default), format (ndjson or csv) and gzip=1.
+    """
+    try:
+        dataset = request.args.get('dataset', '')
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f"Unknown format '{export_format}', expected ndjson or csv."}), 400
+        start_date = datetime.strptime(request.args.get('start_date', ''), '%Y-%m-%d')
+        end_date = datetime.strptime(request.args.get('end_date', ''), '%Y-%m-%d')
+        fields = [field for field in request.args.get('fields', '').split(',') if field]
+        compress = request.args.get('gzip') == '1'
+        body = export_stream(dataset, export_format, start_date, end_date,
+                             sources=request.args.getlist('sources'), fields=fields, compress=compress)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    logging.debug(f"Exporting {dataset} as {export_format} from {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d}")
+    filename = f"{dataset}_{start_date:%Y%m%d}_{end_date:%Y%m%d}.{export_format}"
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(body), mimetype=EXPORT_FORMATS[export_format], headers=headers)
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+@app.route('/api/crawl/cadence', methods=['GET'])
+def crawl_cadence():
+    """Polling interval and yield per subreddit/board; ?platform=reddit|4chan to filter."""
+    try:
+        return jsonify(cadence_stats(request.args.get('platform')))
+    except PyMongoError as e:
+        logging.error(f"Error in /api/crawl/cadence: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     app.run(debug=True, port=5019)
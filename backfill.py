@@ -0,0 +1,311 @@
+# backfill.py
+
+import calendar
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from db import LazyCollection
+from reddit_client import RateLimitExceeded, RedditClient, credential_pool, load_credentials
+
+# Logger setup
+logger = logging.getLogger("Backfill")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+BACKFILL_UNITS_COLLECTION = 'backfill_units'
+
+# A running unit whose worker has not renewed its lease for this long is handed to another worker
+UNIT_LEASE_MINUTES = float(os.getenv("BACKFILL_UNIT_LEASE_MINUTES", 10))
+# Attempts before a failing unit is left for manual inspection
+MAX_ATTEMPTS = int(os.getenv("BACKFILL_MAX_ATTEMPTS", 3))
+# Wait before retrying a failed unit, multiplied by its attempts so far
+RETRY_DELAY_MINUTES = float(os.getenv("BACKFILL_RETRY_DELAY_MINUTES", 5))
+# Search result pages fetched per (subreddit, day), 100 posts each; a day with more is marked 'partial'
+MAX_PAGES_PER_UNIT = int(os.getenv("BACKFILL_MAX_PAGES", 10))
+
+# MongoDB collection, connected on first use
+units_collection = LazyCollection(BACKFILL_UNITS_COLLECTION, indexed=True)
+
+def day_range(start_date, end_date):
+    """Yields every day from start_date to end_date, both included."""
+    day = datetime(start_date.year, start_date.month, start_date.day)
+    while day <= end_date:
+        yield day
+        day += timedelta(days=1)
+
+def plan_units(subreddits, start_date, end_date):
+    """
+    Creates one pending unit per (subreddit, day) of the range.
+
+    Existing units keep their status, so re-planning an overlapping range never
+    re-fetches completed days.
+
+    Returns:
+        int: Number of units added.
+    """
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {'subreddit': subreddit, 'day': day},
+            {'$setOnInsert': {'status': 'pending', 'attempts': 0, 'planned_at': now}},
+            upsert=True
+        )
+        for subreddit in subreddits
+        for day in day_range(start_date, end_date)
+    ]
+    if not operations:
+        return 0
+    result = units_collection.bulk_write(operations, ordered=False)
+    logger.info(f"Planned {result.upserted_count} new units ({len(operations) - result.upserted_count} already planned)")
+    return result.upserted_count
+
+def claim_unit(worker, now=None, resume_partial=False):
+    """
+    Takes the oldest unit that is pending, failed with attempts left and due for
+    a retry, or held by a worker whose lease expired (crashed). With
+    `resume_partial`, units truncated at MAX_PAGES_PER_UNIT are taken as well.
+
+    Returns:
+        dict or None: The claimed unit, None if no unit is left.
+    """
+    now = now or datetime.utcnow()
+    claimable = [
+        {'status': 'pending'},
+        {'status': 'failed', 'attempts': {'$lt': MAX_ATTEMPTS}, 'retry_at': {'$lte': now}},
+        {'status': 'running', 'lease_expires_at': {'$lt': now}},
+    ]
+    if resume_partial:
+        claimable.append({'status': 'partial'})
+    return units_collection.find_one_and_update(
+        {'$or': claimable},
+        {
+            '$set': {
+                'status': 'running',
+                'worker': worker,
+                'started_at': now,
+                'lease_expires_at': now + timedelta(minutes=UNIT_LEASE_MINUTES)
+            },
+            '$inc': {'attempts': 1}
+        },
+        sort=[('day', ASCENDING), ('subreddit', ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def renew_lease(unit, worker):
+    """Extends a running unit's lease; returns False if another worker took the unit over."""
+    result = units_collection.update_one(
+        {'_id': unit['_id'], 'status': 'running', 'worker': worker},
+        {'$set': {'lease_expires_at': datetime.utcnow() + timedelta(minutes=UNIT_LEASE_MINUTES)}}
+    )
+    return result.matched_count == 1
+
+def release_unit(unit, worker):
+    """Puts a unit back as pending without counting the attempt (e.g. its credential ran out of budget)."""
+    units_collection.update_one(
+        {'_id': unit['_id'], 'worker': worker},
+        {'$set': {'status': 'pending'}, '$inc': {'attempts': -1}, '$unset': {'worker': '', 'lease_expires_at': ''}}
+    )
+
+def finish_unit(unit, worker, status, **fields):
+    """Records the outcome ('done', 'partial' or 'failed') of a unit."""
+    now = datetime.utcnow()
+    fields.update({'status': status, 'completed_at': now})
+    unset = {'lease_expires_at': ''}
+    if status == 'failed':
+        fields['retry_at'] = now + timedelta(minutes=RETRY_DELAY_MINUTES * unit['attempts'])
+    elif status == 'done':
+        # A resumed day that reached its end has no cursor left
+        unset['next_page'] = ''
+    units_collection.update_one(
+        {'_id': unit['_id'], 'worker': worker},
+        {'$set': fields, '$unset': unset}
+    )
+
+def fetch_unit(reddit_client, unit, worker):
+    """
+    Fetches and stores every post of one (subreddit, day).
+
+    A unit that stopped at a next_page cursor (partial, or failed after being
+    resumed) continues from it, and its previous counts are carried over.
+
+    Returns:
+        dict: pages, posts and inserted counts, plus the listing's next_page cursor if
+              MAX_PAGES_PER_UNIT was reached (in this run) before the end of the day;
+              None if a page could not be fetched.
+    """
+    from reddit_past import store_historical_data
+
+    subreddit = unit['subreddit']
+    after = calendar.timegm(unit['day'].timetuple())  # Days are UTC
+    before = after + 24 * 3600 - 1  # End of the day
+    page = unit.get('next_page')
+    counts = {key: unit.get(key, 0) if page else 0 for key in ('pages', 'posts', 'inserted')}
+    fetched = 0
+    while fetched < MAX_PAGES_PER_UNIT:
+        data = reddit_client.fetch_posts_by_date(subreddit, after, before, limit=100, page=page)
+        if data is None:
+            return None
+        fetched += 1
+        counts['pages'] += 1
+        counts['posts'] += len(data['data']['children'])
+        counts['inserted'] += store_historical_data(data, subreddit)
+        page = data['data'].get('after')
+        if not page or not renew_lease(unit, worker):
+            break
+    if page and fetched >= MAX_PAGES_PER_UNIT:
+        counts['next_page'] = page
+    return counts
+
+def run_worker(credential, stop_event=None, resume_partial=False):
+    """
+    Works through units with a single credential until none is left
+    (including partial units when `resume_partial` is set).
+
+    When the credential runs out of budget the unit is released and the worker
+    waits for the reset, so every worker stays within its own rate limit.
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}:{credential['username']}"
+    reddit_client = RedditClient(credentials=[credential])
+    while not (stop_event and stop_event.is_set()):
+        unit = claim_unit(worker, resume_partial=resume_partial)
+        if unit is None:
+            logger.info(f"{worker}: no units left")
+            return
+        label = f"r/{unit['subreddit']} {unit['day']:%Y-%m-%d}"
+        started = time.monotonic()
+        try:
+            counts = fetch_unit(reddit_client, unit, worker)
+        except RateLimitExceeded as e:
+            release_unit(unit, worker)
+            logger.info(f"{worker}: {e}; waiting {e.delay_minutes:.1f} minutes")
+            time.sleep(e.delay_minutes * 60)
+            continue
+        except Exception as e:
+            logger.error(f"{worker}: {label} failed: {e}")
+            finish_unit(unit, worker, 'failed', error=str(e))
+            continue
+
+        if counts is None:
+            logger.error(f"{worker}: {label} failed (attempt {unit['attempts']})")
+            finish_unit(unit, worker, 'failed', error='fetch failed')
+        elif 'next_page' in counts:
+            # More posts than MAX_PAGES_PER_UNIT pages hold: kept out of 'done' so the gap is visible
+            finish_unit(unit, worker, 'partial', duration=time.monotonic() - started, **counts)
+            logger.warning(f"{worker}: {label} truncated: {counts['posts']} posts ({counts['inserted']} new) "
+                           f"in {counts['pages']} pages, more left after page {counts['next_page']}")
+        else:
+            finish_unit(unit, worker, 'done', duration=time.monotonic() - started, **counts)
+            logger.info(f"{worker}: {label} done: {counts['posts']} posts ({counts['inserted']} new) "
+                        f"in {counts['pages']} pages")
+
+def run_backfill(credentials=None, resume_partial=False):
+    """
+    Runs one worker thread per configured Reddit credential until every unit is
+    done (or failed MAX_ATTEMPTS times). Safe to run again after a crash or on
+    several machines at once. With `resume_partial`, days truncated by an
+    earlier run continue from their stored next_page cursor.
+    """
+    credentials = load_credentials() if credentials is None else credentials
+    if not credentials:
+        raise ValueError("API credentials are missing.")
+    stop_event = threading.Event()
+    threads = [
+        threading.Thread(target=run_worker, args=(credential, stop_event, resume_partial), name=f"backfill-{credential['username']}")
+        for credential in credentials
+    ]
+    logger.info(f"Starting {len(threads)} backfill workers")
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        # Units in progress are finished; their leases let another run resume anything cut short
+        logger.info("Stopping backfill workers after their current unit")
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+    credential_pool.log_utilization()
+
+def backfill_report(window_hours=1, now=None):
+    """
+    Summarizes the backfill.
+
+    Units marked 'partial' hit MAX_PAGES_PER_UNIT with posts left; their stored
+    posts are counted, but they are not done until resumed with `run --resume-partial`.
+
+    Returns:
+        dict: Units per status (and failed units out of attempts), posts stored, throughput over the last
+              `window_hours` (units/hour, posts/minute) and the estimated time
+              left at that rate, plus per-subreddit progress.
+    """
+    now = now or datetime.utcnow()
+    status_counts = {
+        row['_id']: row['units']
+        for row in units_collection.aggregate([{'$group': {'_id': '$status', 'units': {'$sum': 1}}}])
+    }
+    totals = next(units_collection.aggregate([
+        {'$match': {'status': {'$in': ['done', 'partial']}}},
+        {'$group': {'_id': None, 'posts': {'$sum': '$posts'}, 'inserted': {'$sum': '$inserted'}}}
+    ]), {'posts': 0, 'inserted': 0})
+    recent = next(units_collection.aggregate([
+        {'$match': {'status': {'$in': ['done', 'partial']}, 'completed_at': {'$gte': now - timedelta(hours=window_hours)}}},
+        {'$group': {'_id': None, 'units': {'$sum': 1}, 'posts': {'$sum': '$posts'}}}
+    ]), {'units': 0, 'posts': 0})
+    subreddits = list(units_collection.aggregate([
+        {'$group': {
+            '_id': '$subreddit',
+            'units': {'$sum': 1},
+            'done': {'$sum': {'$cond': [{'$eq': ['$status', 'done']}, 1, 0]}},
+            'partial': {'$sum': {'$cond': [{'$eq': ['$status', 'partial']}, 1, 0]}}
+        }},
+        {'$sort': {'_id': 1}}
+    ]))
+
+    given_up = units_collection.count_documents({'status': 'failed', 'attempts': {'$gte': MAX_ATTEMPTS}})
+    remaining = sum(status_counts.get(status, 0) for status in ('pending', 'running', 'failed')) - given_up
+    units_per_hour = recent['units'] / window_hours
+    return {
+        'status': status_counts,
+        'given_up': given_up,
+        'partial': status_counts.get('partial', 0),
+        'posts': totals['posts'],
+        'inserted': totals['inserted'],
+        'units_per_hour': units_per_hour,
+        'posts_per_minute': recent['posts'] / (window_hours * 60),
+        'hours_left': remaining / units_per_hour if units_per_hour else None,
+        'subreddits': {row['_id']: (row['done'], row['partial'], row['units']) for row in subreddits}
+    }
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ('plan', 'run', 'report') or (sys.argv[1] == 'plan' and len(sys.argv) < 4) \
+            or (sys.argv[1] == 'run' and sys.argv[2:] not in ([], ['--resume-partial'])):
+        print("Usage: python backfill.py plan <start YYYY-MM-DD> <end YYYY-MM-DD> [subreddit ...] | run [--resume-partial] | report")
+        sys.exit(1)
+
+    if sys.argv[1] == 'plan':
+        from reddit_past import SUBREDDITS
+
+        start_date = datetime.strptime(sys.argv[2], '%Y-%m-%d')
+        end_date = datetime.strptime(sys.argv[3], '%Y-%m-%d')
+        plan_units(sys.argv[4:] or SUBREDDITS, start_date, end_date)
+    elif sys.argv[1] == 'run':
+        run_backfill(resume_partial='--resume-partial' in sys.argv[2:])
+    else:
+        report = backfill_report()
+        logger.info(f"Units: {report['status']} ({report['given_up']} failed {MAX_ATTEMPTS} times, "
+                    f"{report['partial']} truncated at {MAX_PAGES_PER_UNIT} pages)")
+        logger.info(f"Stored {report['posts']} posts ({report['inserted']} new)")
+        hours_left = f"{report['hours_left']:.1f} h" if report['hours_left'] is not None else 'unknown'
+        logger.info(f"Last hour: {report['units_per_hour']:.0f} units/h, {report['posts_per_minute']:.1f} posts/min; "
+                    f"time left: {hours_left}")
+        for subreddit, (done, partial, units) in report['subreddits'].items():
+            logger.info(f"r/{subreddit}: {done}/{units} days done" + (f", {partial} truncated" if partial else ""))
@@ -0,0 +1,315 @@
+# benchmarks.py
+
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pymongo import MongoClient, monitoring
+from db import DEFAULT_MONGO_URI
+from indexes import ensure_indexes
+from rollups import ROLLUP_COLLECTION, bulk_upsert_with_rollup, upsert_with_rollup
+
+# Logger setup
+logger = logging.getLogger("Benchmarks")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Benchmarks write to a scratch database on the MONGO_URI server, never to the crawler database
+BENCHMARK_DB = 'crawler_benchmark'
+
+def synthetic_chan_posts(count, board='biz'):
+    """Builds `count` chan_posts documents shaped like the ones store_data_4chan writes."""
+    start = datetime(2024, 12, 1)
+    return [
+        {
+            'board': board,
+            'thread_no': 1000 + i // 150,
+            'post_no': 1000 + i,
+            'created_at': start + timedelta(minutes=i),
+            'name': 'Anonymous',
+            'comment': f"benchmark post {i}",
+            'replies': 0,
+            'images': 0,
+            'is_toxic': i % 7 == 0,
+            'sentiment': (i % 21 - 10) / 10
+        }
+        for i in range(count)
+    ]
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the commands (round trips) a MongoClient sends."""
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def benchmark_writes(db, count=5000, batch_size=150, commands=None):
+    """
+    Compares per-document upserts with unordered bulk upserts, in documents per second.
+
+    Documents are written in thread-sized batches of `batch_size`, once as inserts
+    (empty collection), once as re-crawls of the same documents and once as
+    re-crawls where every tenth document's sentiment changed. With a
+    CommandCounter registered on the client, round trips per document are reported too.
+    """
+    docs = synthetic_chan_posts(count)
+    changed = [{**doc, 'sentiment': -doc['sentiment'] - 0.05} if i % 10 == 0 else doc for i, doc in enumerate(docs)]
+    phases = (('insert', docs), ('re-crawl', docs), ('update', changed))
+    results = {}
+
+    def per_document(batch):
+        for doc in batch:
+            upsert_with_rollup(db['chan_posts'], 'post_no', doc, '4chan', db[ROLLUP_COLLECTION])
+
+    def bulk(batch):
+        bulk_upsert_with_rollup(db['chan_posts'], 'post_no', batch, '4chan', db[ROLLUP_COLLECTION])
+
+    for label, store in (('per-document', per_document), ('bulk', bulk)):
+        db['chan_posts'].drop()
+        db[ROLLUP_COLLECTION].drop()
+        ensure_indexes(db, ['chan_posts', ROLLUP_COLLECTION])
+        for phase, phase_docs in phases:
+            sent = commands.count if commands else 0
+            started = time.perf_counter()
+            for i in range(0, count, batch_size):
+                store(phase_docs[i:i + batch_size])
+            elapsed = time.perf_counter() - started
+            results[(label, phase)] = count / elapsed
+            round_trips = f", {(commands.count - sent) / count:.2f} round trips/doc" if commands else ""
+            logger.info(f"{label:>12} {phase:>8}: {count / elapsed:,.0f} docs/s ({elapsed:.2f}s for {count} docs{round_trips})")
+    return results
+
+def benchmark_chan_fetch(board, limit=100, workers=5):
+    """
+    Compares thread fetch throughput of the per-thread job mode (synchronous
+    ChanClient on `workers` consumer threads, like chan_crawler.start_consumer)
+    with the async sweep engine, in threads per second.
+
+    Only fetching is measured: both modes store through the same code path, and
+    the per-job Faktory overhead is not included, so this understates the gap.
+    The async engine keeps its per-host politeness limit (CHAN_MIN_REQUEST_INTERVAL).
+    """
+    from chan_client import ChanClient
+    from chan_async_crawler import AsyncChanClient
+
+    pages = ChanClient().get_threads(board)
+    thread_numbers = [thread['no'] for page in pages or [] for thread in page.get('threads', [])][:limit]
+    if not thread_numbers:
+        logger.error(f"No threads found on /{board}/")
+        return {}
+    results = {}
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        fetched = sum(1 for data in executor.map(lambda no: ChanClient().get_thread(board, no), thread_numbers) if data)
+    elapsed = time.perf_counter() - started
+    results['per-thread jobs'] = len(thread_numbers) / elapsed
+    logger.info(f"per-thread jobs: {len(thread_numbers) / elapsed:.1f} threads/s ({fetched}/{len(thread_numbers)} fetched in {elapsed:.2f}s)")
+
+    async def sweep():
+        async with AsyncChanClient() as client:
+            outcomes = await asyncio.gather(*(client.get_thread(board, no) for no in thread_numbers))
+            return sum(1 for data, _ in outcomes if data)
+
+    started = time.perf_counter()
+    fetched = asyncio.run(sweep())
+    elapsed = time.perf_counter() - started
+    results['async sweep'] = len(thread_numbers) / elapsed
+    logger.info(f"    async sweep: {len(thread_numbers) / elapsed:.1f} threads/s ({fetched}/{len(thread_numbers)} fetched in {elapsed:.2f}s)")
+    return results
+
+def synthetic_texts(count):
+    """Builds `count` distinct comment-length texts with mixed sentiment."""
+    fragments = [
+        "Got laid off today after six years, honestly devastated.",
+        "The new job is great and the team is amazing!",
+        "Recruiters ghosting me again, this market is terrible.",
+        "Not bad, not great, the interview was fine I guess.",
+        "HUGE win: finally got an offer :)",
+        "Management keeps lying about the restructuring.",
+    ]
+    return [
+        " ".join(fragments[(i + j) % len(fragments)] for j in range(1 + i % 4)) + f" #{i}"
+        for i in range(count)
+    ]
+
+def benchmark_sentiment(count=20000):
+    """
+    Compares inline VADER scoring with the process pool in sentiment.score_batch,
+    in texts per second. The analysis cache is bypassed.
+    """
+    import sentiment
+
+    texts = synthetic_texts(count)
+    started = time.perf_counter()
+    inline = [sentiment.compute_sentiment(text) for text in texts]
+    elapsed = time.perf_counter() - started
+    results = {'inline': count / elapsed}
+    logger.info(f"       inline: {count / elapsed:,.0f} texts/s ({elapsed:.2f}s for {count} texts)")
+
+    sentiment.score_batch(texts[:sentiment.PARALLEL_MIN_BATCH])  # start the pool outside the timing
+    started = time.perf_counter()
+    pooled = sentiment.score_batch(texts)
+    elapsed = time.perf_counter() - started
+    results['process pool'] = count / elapsed
+    logger.info(f" process pool: {count / elapsed:,.0f} texts/s ({elapsed:.2f}s for {count} texts, "
+                f"{sentiment.SENTIMENT_WORKERS} workers)")
+    if pooled != inline:
+        logger.error("Process pool scores differ from inline scores")
+    return results
+
+def synthetic_lexicons(phrase_count, categories=10):
+    """Builds the configured lexicons plus generated two-word phrases, `phrase_count` in total."""
+    import random
+    from keyword_matcher import load_lexicons
+
+    words = ("remote contract hiring budget freeze offer team salary severance startup manager "
+             "recruiter layoff payroll equity market interview bonus office pivot").split()
+    generator = random.Random(0)
+    lexicons = {category: list(phrases) for category, phrases in load_lexicons().items()}
+    phrases = {phrase for category in lexicons.values() for phrase in category}
+    while sum(len(category) for category in lexicons.values()) < phrase_count:
+        phrase = f"{generator.choice(words)} {generator.choice(words)}{generator.randrange(100)}"
+        if phrase not in phrases:
+            phrases.add(phrase)
+            lexicons.setdefault(f"generated_{len(phrases) % categories}", []).append(phrase)
+    return lexicons
+
+def benchmark_keywords(count=1000000, phrase_count=1200):
+    """
+    Compares one alternation regex per lexicon category (the former
+    calculate_keyword_counts) with the KeywordMatcher automaton, in documents
+    per second, on every text field of synthetic documents.
+    """
+    import random
+    import re
+    from keyword_matcher import KeywordMatcher
+
+    lexicons = synthetic_lexicons(phrase_count)
+    generated = [phrase for category, phrases in lexicons.items() if category.startswith('generated_') for phrase in phrases]
+    generator = random.Random(1)
+    texts = synthetic_texts(count)
+    docs = [
+        {'title': f"{generator.choice(generated)} update", 'content': text} if i % 2 else {'comment': f"{text} {generator.choice(generated)}"}
+        for i, text in enumerate(texts)
+    ]
+    fields = ('title', 'content', 'body', 'comment', 'text')
+    logger.info(f"{count:,} documents, {sum(len(phrases) for phrases in lexicons.values())} phrases in {len(lexicons)} categories")
+
+    started = time.perf_counter()
+    patterns = [
+        re.compile(r'\b(' + '|'.join(re.escape(phrase) for phrase in phrases) + r')\b', re.IGNORECASE)
+        for phrases in lexicons.values()
+    ]
+    regex_counts = []
+    for doc in docs:
+        counts = [0] * len(patterns)
+        for field in fields:
+            text = doc.get(field)
+            if text:
+                for index, pattern in enumerate(patterns):
+                    counts[index] += len(pattern.findall(text))
+        regex_counts.append(counts)
+    elapsed = time.perf_counter() - started
+    results = {'regex': count / elapsed}
+    logger.info(f"    regex: {count / elapsed:,.0f} docs/s ({elapsed:.2f}s)")
+
+    started = time.perf_counter()
+    matcher = KeywordMatcher(lexicons)
+    matcher_counts = []
+    for doc in docs:
+        counts = [0] * len(matcher.categories)
+        for field in fields:
+            text = doc.get(field)
+            if text:
+                matcher.count(text, counts)
+        matcher_counts.append(counts)
+    elapsed = time.perf_counter() - started
+    results['automaton'] = count / elapsed
+    logger.info(f"automaton: {count / elapsed:,.0f} docs/s ({elapsed:.2f}s, {len(matcher.goto)} states)")
+
+    differing = sum(1 for regex, automaton in zip(regex_counts, matcher_counts) if regex != automaton)
+    if differing:
+        logger.error(f"Counts differ for {differing} documents")
+    return results
+
+# Entry-point modules whose import must stay fast and must not touch the network
+STARTUP_MODULES = ['app', 'utils', 'faktory_worker', 'reddit_crawler', 'chan_crawler', 'chan_async_crawler', 'reddit_past']
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", 3.0))
+
+# Runs in a fresh interpreter: any socket connection during the import fails it
+IMPORT_PROBE = """
+import socket, sys, time
+def refuse(*args, **kwargs):
+    raise OSError("network access during import")
+socket.socket.connect = refuse
+socket.create_connection = refuse
+started = time.perf_counter()
+__import__(sys.argv[1])
+print(time.perf_counter() - started)
+"""
+
+def benchmark_imports(modules=STARTUP_MODULES, budget=IMPORT_BUDGET_SECONDS):
+    """
+    Imports each entry-point module in a fresh interpreter with networking disabled
+    and reports its import time.
+
+    Returns:
+        list: Modules that failed to import offline or exceeded `budget` seconds.
+    """
+    failures = []
+    for module in modules:
+        result = subprocess.run(
+            [sys.executable, '-c', IMPORT_PROBE, module],
+            capture_output=True, text=True, timeout=60,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if result.returncode != 0:
+            error = [line for line in result.stderr.splitlines() if line.strip('* ')][-1:]
+            logger.error(f"{module:>20}: import failed offline: {error}")
+            failures.append(module)
+            continue
+        elapsed = float(result.stdout.strip().splitlines()[-1])
+        if elapsed > budget:
+            logger.error(f"{module:>20}: {elapsed:.2f}s (budget {budget:.2f}s)")
+            failures.append(module)
+        else:
+            logger.info(f"{module:>20}: {elapsed:.2f}s")
+    return failures
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ('writes', 'chan', 'sentiment', 'keywords', 'imports'):
+        print("Usage: python benchmarks.py writes [count] | chan <board> [threads] | sentiment [count] | keywords [count] [phrases] | imports")
+        sys.exit(1)
+
+    if sys.argv[1] == 'imports':
+        # Exits non-zero on a regression, so it can run in CI
+        sys.exit(1 if benchmark_imports() else 0)
+    elif sys.argv[1] == 'sentiment':
+        benchmark_sentiment(count=int(sys.argv[2]) if len(sys.argv) > 2 else 20000)
+    elif sys.argv[1] == 'keywords':
+        benchmark_keywords(count=int(sys.argv[2]) if len(sys.argv) > 2 else 1000000,
+                           phrase_count=int(sys.argv[3]) if len(sys.argv) > 3 else 1200)
+    elif sys.argv[1] == 'chan':
+        benchmark_chan_fetch(sys.argv[2], limit=int(sys.argv[3]) if len(sys.argv) > 3 else 100)
+    else:
+        commands = CommandCounter()
+        mongo_client = MongoClient(os.getenv("MONGO_URI", DEFAULT_MONGO_URI), event_listeners=[commands])
+        db = mongo_client[BENCHMARK_DB]
+        benchmark_writes(db, count=int(sys.argv[2]) if len(sys.argv) > 2 else 5000, commands=commands)
+        mongo_client.drop_database(BENCHMARK_DB)
@@ -0,0 +1,225 @@
+# chan_async_crawler.py
+
+import asyncio
+import functools
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+import aiohttp
+from pyfaktory import Client, Consumer, Job
+from chan_client import ChanClient, NOT_MODIFIED
+from chan_crawler import chain_token, diff_catalog, load_catalog_state, load_thread_state, save_catalog_state, store_thread
+from crawl_cadence import next_interval
+from crawl_leases import claim_job, hand_off, watch_expired_chains
+from faktory_producer import get_producer
+
+# Logger setup
+logger = logging.getLogger("ChanAsyncCrawler")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Requests in flight for a whole sweep, and per host
+MAX_CONCURRENCY = int(os.getenv("CHAN_MAX_CONCURRENCY", 8))
+PER_HOST_CONCURRENCY = int(os.getenv("CHAN_PER_HOST_CONCURRENCY", 4))
+# Minimum spacing between two request starts to the same host (4chan asks for at most 1 request per second)
+MIN_REQUEST_INTERVAL = float(os.getenv("CHAN_MIN_REQUEST_INTERVAL", 1.0))
+# Threads stored at the same time (scoring and MongoDB writes run in worker threads)
+STORE_CONCURRENCY = int(os.getenv("CHAN_STORE_CONCURRENCY", 4))
+
+class HostLimiter:
+    """Per-host politeness: bounded concurrency plus a minimum interval between request starts."""
+
+    def __init__(self, per_host=PER_HOST_CONCURRENCY, min_interval=MIN_REQUEST_INTERVAL):
+        self.per_host = per_host
+        self.min_interval = min_interval
+        self.hosts = {}  # host -> [semaphore, lock, next allowed start]
+
+    async def __call__(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = [asyncio.Semaphore(self.per_host), asyncio.Lock(), 0.0]
+        semaphore, lock, _ = self.hosts[host]
+        await semaphore.acquire()
+        async with lock:
+            wait = self.hosts[host][2] - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.hosts[host][2] = time.monotonic() + self.min_interval
+        return semaphore
+
+class AsyncChanClient:
+    """aiohttp counterpart of ChanClient, for fetching many threads of a board at once."""
+
+    API_BASE = ChanClient.API_BASE
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, per_host=PER_HOST_CONCURRENCY, min_interval=MIN_REQUEST_INTERVAL):
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.host_limiter = HostLimiter(per_host, min_interval)
+        self.session = None
+        self.requests = 0
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.per_host)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=10))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def execute_request(self, url, if_modified_since=None):
+        """
+        Fetches JSON, conditionally on `if_modified_since`.
+
+        Returns:
+            tuple: (JSON, or NOT_MODIFIED, or None on failure; Last-Modified header)
+        """
+        headers = {'If-Modified-Since': if_modified_since} if if_modified_since else {}
+        semaphore = await self.host_limiter(urlparse(url).hostname)
+        try:
+            self.requests += 1
+            async with self.session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    return NOT_MODIFIED, if_modified_since
+                response.raise_for_status()
+                return await response.json(), response.headers.get('Last-Modified')
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.error(f"Failed to fetch data from {url}: {e}")
+            return None, None
+        finally:
+            semaphore.release()
+
+    async def get_thread(self, board, thread_number, if_modified_since=None):
+        return await self.execute_request(f'{self.API_BASE}/{board}/thread/{thread_number}.json', if_modified_since)
+
+    async def get_threads(self, board, if_modified_since=None):
+        return await self.execute_request(f'{self.API_BASE}/{board}/threads.json', if_modified_since)
+
+async def run_in_thread(func, *args):
+    """Runs blocking storage code (MongoDB, scoring) in the default executor."""
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
+
+async def crawl_thread_async(client, board, thread_no, store_semaphore):
+    """Async counterpart of chan_crawler.crawl_thread; storage goes through chan_crawler.store_thread."""
+    state = await run_in_thread(load_thread_state, board, thread_no)
+    thread_data, last_modified = await client.get_thread(board, thread_no, if_modified_since=state.get('last_modified'))
+    if thread_data is NOT_MODIFIED:
+        return 'unchanged'
+    if thread_data is None:
+        return 'failed'
+    async with store_semaphore:
+        try:
+            await run_in_thread(store_thread, board, thread_no, state, thread_data, last_modified)
+        except Exception as e:
+            logger.error(f"Error storing thread {thread_no} from /{board}/: {e}")
+            return 'failed'
+    return 'stored'
+
+async def sweep_board(board, client=None):
+    """
+    Sweeps a whole board in one go: polls threads.json, then fetches and stores
+    every new or changed thread concurrently.
+
+    Uses the same catalog/thread state as the per-thread job mode, so the two can
+    be switched between without re-crawling.
+
+    Returns:
+        dict: Number of threads per outcome ('stored', 'unchanged', 'failed').
+    """
+    if client is None:
+        async with AsyncChanClient() as client:
+            return await sweep_board(board, client)
+
+    started = time.monotonic()
+    state = await run_in_thread(load_catalog_state, board)
+    pages, last_modified = await client.get_threads(board, if_modified_since=state.get('last_modified'))
+    if pages is NOT_MODIFIED:
+        logger.info(f"No thread changed on /{board}/")
+        return {}
+    if pages is None:
+        logger.error(f"Failed to fetch thread list for /{board}/")
+        return {}
+
+    changed_threads, current_threads = diff_catalog(state, pages)
+    store_semaphore = asyncio.Semaphore(STORE_CONCURRENCY)
+    outcomes = await asyncio.gather(*(
+        crawl_thread_async(client, board, thread_no, store_semaphore) for thread_no in changed_threads
+    ))
+
+    # Failed threads keep their previous entry (or none), so the next sweep sees them as changed again.
+    # The board's Last-Modified is kept too, otherwise that sweep would get a 304 and never look.
+    failed_threads = [str(thread_no) for thread_no, outcome in zip(changed_threads, outcomes) if outcome == 'failed']
+    if failed_threads:
+        previous_threads = state.get('threads', {})
+        for thread_no in failed_threads:
+            if thread_no in previous_threads:
+                current_threads[thread_no] = previous_threads[thread_no]
+            else:
+                del current_threads[thread_no]
+        last_modified = state.get('last_modified')
+    await run_in_thread(save_catalog_state, board, current_threads, last_modified)
+
+    counts = {outcome: outcomes.count(outcome) for outcome in set(outcomes)}
+    elapsed = time.monotonic() - started
+    logger.info(f"Swept /{board}/: {len(changed_threads)} of {len(current_threads)} threads changed {counts} in {elapsed:.1f}s")
+    return counts
+
+def handle_crawl_board_sweep(*args):
+    """
+    Handler function for Faktory worker.
+    Expects args: [board, chain]
+    """
+    if not args:
+        logger.error("No arguments provided for crawl-board-sweep job.")
+        return
+    board = args[0]
+    chain = claim_job('4chan', board, 'crawl-board-sweep', chain_token(args))
+    if chain is None:
+        logger.info(f"Dropping duplicate crawl-board-sweep job for /{board}/")
+        return
+    logger.info(f"Starting board sweep for /{board}/")
+    try:
+        asyncio.run(sweep_board(board))
+    except Exception as e:
+        logger.error(f"Board sweep for /{board}/ failed: {e}")
+
+    # Schedule next sweep after the board's adaptive interval, even if this one failed
+    delay_minutes = next_interval('4chan', board)
+    next_chain = hand_off('4chan', board, chain, delay_minutes)
+    if next_chain:
+        schedule_crawl_board_sweep(board, delay_minutes=delay_minutes, chain=next_chain)
+    get_producer().flush()
+
+def schedule_crawl_board_sweep(board, delay_minutes=None, chain=None):
+    logger.info(f"Scheduling crawl-board-sweep job for /{board}/")
+    job = Job(
+        jobtype="crawl-board-sweep",
+        args=[board, chain],
+        queue="crawl-board-sweep",
+        retry=3,
+        backtrace=True
+    )
+    if delay_minutes:
+        run_at = datetime.utcnow() + timedelta(minutes=delay_minutes)
+        job.at = run_at.isoformat() + "Z"
+    get_producer().push(job)
+
+def start_consumer():
+    with Client(faktory_url="tcp://:password@localhost:7419", role="consumer") as client:
+        consumer = Consumer(
+            client=client,
+            queues=["crawl-board-sweep"],
+            concurrency=2  # Each job already fetches many threads concurrently
+        )
+        # Restart board sweep chains whose job was given up on
+        watch_expired_chains("crawl-board-sweep", schedule_crawl_board_sweep)
+        consumer.register("crawl-board-sweep", handle_crawl_board_sweep)
+        consumer.run()
+
+if __name__ == "__main__":
+    # Start the Faktory consumer
+    start_consumer()
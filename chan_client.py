@@ -9,24 +9,41 @@ formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(messag
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
+# Returned instead of JSON when a conditional request finds nothing new (HTTP 304)
+NOT_MODIFIED = object()
+
 class ChanClient:
     API_BASE = "https://a.4cdn.org"
 
-    def get_thread(self, board, thread_number):
+    def __init__(self):
+        # Last-Modified header of the most recent successful response
+        self.last_modified = None
+
+    def get_thread(self, board, thread_number, if_modified_since=None):
         url = f'{self.API_BASE}/{board}/thread/{thread_number}.json'
-        return self.execute_request(url)
+        return self.execute_request(url, if_modified_since)
 
     def get_catalog(self, board):
         url = f'{self.API_BASE}/{board}/catalog.json'
         return self.execute_request(url)
 
-    def execute_request(self, url):
+    def get_threads(self, board, if_modified_since=None):
+        # Thread numbers with last_modified and reply counts only, much smaller than catalog.json
+        url = f'{self.API_BASE}/{board}/threads.json'
+        return self.execute_request(url, if_modified_since)
+
+    def execute_request(self, url, if_modified_since=None):
+        headers = {'If-Modified-Since': if_modified_since} if if_modified_since else {}
         try:
-            response = requests.get(url, timeout=10)
+            response = requests.get(url, headers=headers, timeout=10)
+            if response.status_code == 304:
+                logger.info(f"Not modified since {if_modified_since}: {url}")
+                return NOT_MODIFIED
             response.raise_for_status()
             json_data = response.json()
+            self.last_modified = response.headers.get('Last-Modified')
             logger.info(f"Fetched data from {url}")
             return json_data
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to fetch data from {url}: {e}")
-            return None
\ No newline at end of file
+            return None
@@ -1,20 +1,17 @@
 # chan_crawler.py
 
 import logging
-import os
-import requests
 from datetime import datetime, timedelta
-from pyfaktory import Client, Consumer, Job, Producer
-from chan_client import ChanClient
-from pymongo import MongoClient
-import nltk
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-
-
-nltk.download('vader_lexicon')
-
-# Initialize Sentiment Analyzer
-sia = SentimentIntensityAnalyzer()
+from pyfaktory import Client, Consumer, Job
+from faktory_producer import get_producer
+from chan_client import ChanClient, NOT_MODIFIED
+from db import LazyCollection
+from crawl_cadence import next_interval, record_new_items
+from crawl_leases import claim_job, hand_off, watch_expired_chains
+from rollups import ROLLUP_COLLECTION, bulk_upsert_with_rollup
+from response_cache import SOURCE_VERSIONS_COLLECTION, record_source_write
+from toxicity_client import classify_texts
+from sentiment import score_texts
 
 # Logger setup
 logger = logging.getLogger("ChanCrawler")
@@ -26,58 +23,31 @@ formatter = logging.Formatter(
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-# MongoDB setup
-mongo_client = MongoClient('mongodb://localhost:27017/')
-db = mongo_client['new_crawler_db']
-chan_collection = db['chan_posts']
-chan_collection.create_index([("post_no", 1)], unique=True)
-
-# Hate Speech Check Function
-def hs_check_comment(comment):
-    CONF_THRESHOLD = 0.9
-    api_token = os.getenv("MODERATEHATESPEECH_TOKEN")
-    if not api_token:
-        logger.error("ModerateHatespeech API token not set.")
-        return False
-
-    data = {
-        "token": api_token,
-        "text": comment
-    }
+# MongoDB collections, connected on first use. Unique keys (to avoid duplicates)
+# and the dashboard query indexes are ensured before the first write.
+chan_collection = LazyCollection('chan_posts', indexed=True)
+rollups_collection = LazyCollection(ROLLUP_COLLECTION, indexed=True)
+source_versions_collection = LazyCollection(SOURCE_VERSIONS_COLLECTION, indexed=True)
+thread_state_collection = LazyCollection('chan_thread_state', indexed=True)
+catalog_state_collection = LazyCollection('chan_catalog_state', indexed=True)
 
-    try:
-        response = requests.post(
-            "https://api.moderatehatespeech.com/api/v1/moderate/",
-            json=data,
-            timeout=10
-        )
-        response.raise_for_status()
-        result = response.json()
-        if result.get("class") == "flag" and float(result.get("confidence", 0)) > CONF_THRESHOLD:
-            return True
-    except requests.exceptions.RequestException as e:
-        logger.error(f"ModerateHatespeech API error: {e}")
-    
-    return False
-
-# Sentiment Analysis Function
-def compute_sentiment(text):
-    """
-    Compute the compound sentiment score for a given text.
-    Returns a float between -1 (most negative) and +1 (most positive).
-    """
-    if not text or not isinstance(text, str):
-        return None
-    sentiment = sia.polarity_scores(text)
-    return sentiment['compound']
-
-def store_data_4chan(data, board):
-    posts = data.get("posts", [])
-    for post in posts:
-        comment = post.get('com', '')
-        sentiment_score = compute_sentiment(comment) if comment else None  # Compute sentiment
-
-        post_data = {
+def store_data_4chan(data, board, posts=None):
+    """
+    Store the posts of a thread. Defaults to every post of `data`; pass `posts`
+    to store only a subset (e.g. the ones not stored yet).
+    Returns the post numbers that could not be stored.
+    """
+    if posts is None:
+        posts = data.get("posts", [])
+
+    # Compute sentiment and perform Toxicity Check on the whole thread at once
+    comments = [post.get('com', '') for post in posts]
+    sentiment_scores = score_texts(comments)
+    toxic_flags = classify_texts(comments)
+
+    post_docs = []
+    for post, comment, sentiment_score, is_toxic in zip(posts, comments, sentiment_scores, toxic_flags):
+        post_docs.append({
             'board': board,
             'thread_no': data['posts'][0]['no'],
             'post_no': post['no'],
@@ -86,65 +56,165 @@ def store_data_4chan(data, board):
             'comment': comment,
             'replies': post.get('replies', 0),
             'images': post.get('images', 0),
-            'is_toxic': False,  # Default value
+            'is_toxic': is_toxic,
             'sentiment': sentiment_score  # Add sentiment score
-        }
-        
-        # Perform Toxicity Check on Comment
-        if comment:
-            is_toxic = hs_check_comment(comment)
-            post_data['is_toxic'] = is_toxic
-        
-        try:
-            logger.info(f"Storing post No: {post_data['post_no']} from thread {post_data['thread_no']} on /{board}/")
-            chan_collection.update_one(
-                {'post_no': post_data['post_no']},
-                {'$set': post_data},
-                upsert=True
-            )
-        except Exception as e:
-            logger.error(f"Error storing post {post_data['post_no']} in MongoDB: {e}")
+        })
+
+    # Write the whole thread in one unordered bulk write
+    inserted, failed = bulk_upsert_with_rollup(chan_collection, 'post_no', post_docs, '4chan', rollups_collection)
+    logger.info(f"Stored {len(post_docs) - len(failed)} posts from thread {data['posts'][0]['no']} on /{board}/ ({inserted} new, {len(failed)} failed)")
+    record_new_items('4chan', board, inserted)
+
+    if posts:
+        record_source_write(source_versions_collection, '4chan', board)
+    return failed
+
+def load_thread_state(board, thread_no):
+    """Returns the stored Last-Modified header and highest stored post_no of a thread (empty dict if never crawled)."""
+    return thread_state_collection.find_one({'board': board, 'thread_no': thread_no}) or {}
+
+def store_thread(board, thread_no, state, thread_data, last_modified):
+    """
+    Store the posts of a fetched thread that are not stored yet and advance its state.
+
+    Only replies newer than the highest stored post_no are processed; the OP is
+    always refreshed because its reply/image counts change as the thread grows.
+    """
+    posts = thread_data.get('posts', [])
+    if not posts:
+        return
+    max_post_no = state.get('max_post_no', 0)
+    new_posts = [posts[0]] + [post for post in posts[1:] if post['no'] > max_post_no]
+    logger.info(f"Thread {thread_no} on /{board}/: {len(new_posts) - 1} new of {len(posts) - 1} replies")
+    failed = store_data_4chan(thread_data, board, posts=new_posts)
+
+    # Only advance past posts that were stored, and re-fetch unconditionally after a failure
+    stored_post_nos = [post['no'] for post in new_posts if post['no'] not in failed]
+    if failed:
+        max_post_no = min(failed) - 1
+    else:
+        max_post_no = max(stored_post_nos + [max_post_no])
+    thread_state_collection.update_one(
+        {'board': board, 'thread_no': thread_no},
+        {'$set': {
+            'last_modified': None if failed else last_modified,
+            'max_post_no': max_post_no,
+            'updated_at': datetime.utcnow()
+        }},
+        upsert=True
+    )
 
 def crawl_thread(board, thread_no):
+    """
+    Crawl a thread incrementally.
+
+    The request is conditional on the thread's last Last-Modified header, so an
+    unchanged thread costs a single 304. If the thread cannot be fetched or
+    stored, it is dropped from the saved catalog poll and the error is raised,
+    so Faktory retries the job and the next catalog poll sees the thread as changed.
+    """
+    state = load_thread_state(board, thread_no)
     chan_client = ChanClient()
-    thread_data = chan_client.get_thread(board, thread_no)
-    if thread_data is None:
-        logger.error(f"Failed to fetch thread {thread_no} from /{board}/")
+    thread_data = chan_client.get_thread(board, thread_no, if_modified_since=state.get('last_modified'))
+    if thread_data is NOT_MODIFIED:
+        logger.info(f"Thread {thread_no} on /{board}/ unchanged since {state['last_modified']}")
         return
-    store_data_4chan(thread_data, board)
+    try:
+        if thread_data is None:
+            raise ConnectionError(f"Failed to fetch thread {thread_no} from /{board}/")
+        store_thread(board, thread_no, state, thread_data, chan_client.last_modified)
+    except Exception:
+        forget_catalog_thread(board, thread_no)
+        raise
+
+def load_catalog_state(board):
+    """Returns the last threads.json poll of a board (empty dict if never polled)."""
+    return catalog_state_collection.find_one({'board': board}) or {}
 
-def crawl_catalog(board, previous_thread_numbers=None):
+def diff_catalog(state, pages):
+    """
+    Compares a threads.json response with the previous poll.
+
+    Returns:
+        tuple: (thread numbers that are new or whose last_modified changed,
+                current {thread_no: {'last_modified', 'replies'}} to save)
+    """
+    previous_threads = state.get('threads', {})
+    current_threads = {}
+    for page in pages:
+        for thread in page.get('threads', []):
+            current_threads[str(thread['no'])] = {
+                'last_modified': thread.get('last_modified'),
+                'replies': thread.get('replies', 0)
+            }
+
+    # New threads, and threads bumped or edited since the last poll
+    changed_threads = [
+        int(thread_no) for thread_no, thread in current_threads.items()
+        if previous_threads.get(thread_no, {}).get('last_modified') != thread['last_modified']
+    ]
+    return changed_threads, current_threads
+
+def save_catalog_state(board, current_threads, last_modified):
+    # Threads that fell off the board are dropped from the state
+    catalog_state_collection.update_one(
+        {'board': board},
+        {'$set': {
+            'threads': current_threads,
+            'last_modified': last_modified,
+            'updated_at': datetime.utcnow()
+        }},
+        upsert=True
+    )
+
+def forget_catalog_thread(board, thread_no):
+    """
+    Drops a thread that failed to crawl from the saved catalog poll.
+
+    The board's Last-Modified goes with it, otherwise the next poll would get a
+    304 and never see the thread as changed again.
+    """
+    catalog_state_collection.update_one(
+        {'board': board},
+        {'$unset': {f'threads.{thread_no}': '', 'last_modified': ''}}
+    )
+
+def crawl_catalog(board):
+    """
+    Poll threads.json and enqueue crawl-thread jobs for threads that are new or changed.
+
+    The previous poll (thread_no -> last_modified, replies) is kept in
+    chan_catalog_state rather than in the job payload, and the poll itself is
+    conditional on the board's Last-Modified header. The poll is only saved once
+    its crawl-thread jobs are on the Faktory server; otherwise the error is
+    raised and the job retried against the previous poll.
+    """
+    state = load_catalog_state(board)
     chan_client = ChanClient()
-    catalog = chan_client.get_catalog(board)
-    if catalog is None:
-        logger.error(f"Failed to fetch catalog for /{board}/")
+    pages = chan_client.get_threads(board, if_modified_since=state.get('last_modified'))
+    if pages is NOT_MODIFIED:
+        logger.info(f"No thread changed on /{board}/")
+        return
+    if pages is None:
+        logger.error(f"Failed to fetch thread list for /{board}/")
         return
 
-    current_thread_numbers = []
-    for page in catalog:
-        for thread in page.get('threads', []):
-            thread_no = thread['no']
-            current_thread_numbers.append(thread_no)
+    changed_threads, current_threads = diff_catalog(state, pages)
+    logger.info(f"/{board}/: {len(changed_threads)} of {len(current_threads)} threads new or changed")
 
-    # Find new threads
-    if previous_thread_numbers:
-        new_threads = set(current_thread_numbers) - set(previous_thread_numbers)
-    else:
-        new_threads = set(current_thread_numbers)
-
-    # Schedule crawl-thread jobs for new threads
-    with Client(faktory_url="tcp://:password@localhost:7419", role="producer") as client:
-        producer = Producer(client=client)
-        for thread_no in new_threads:
-            job = Job(
-                jobtype="crawl-thread",
-                args=[board, thread_no],
-                queue="crawl-thread"
-            )
-            producer.push(job)
-
-    # Schedule next crawl-catalog job after delay
-    schedule_crawl_catalog(board, current_thread_numbers, delay_minutes=5)
+    # Schedule crawl-thread jobs for them, sent together in one batch push
+    producer = get_producer()
+    producer.push_many([
+        Job(
+            jobtype="crawl-thread",
+            args=[board, thread_no],
+            queue="crawl-thread"
+        )
+        for thread_no in changed_threads
+    ])
+    if not producer.flush():
+        raise ConnectionError(f"Could not send {len(changed_threads)} crawl-thread jobs for /{board}/ to Faktory")
+    save_catalog_state(board, current_threads, chan_client.last_modified)
 
 def handle_crawl_thread(*args):
     """
@@ -158,34 +228,52 @@ def handle_crawl_thread(*args):
     logger.info(f"Starting crawl for thread {thread_no} on /{board}/")
     crawl_thread(board, thread_no)
 
+def chain_token(args):
+    """Returns the chain token of a board job's args ([board, chain]), None for jobs queued before crawl chains had a lease."""
+    # Older crawl-catalog jobs carry the previous thread numbers in this position
+    return args[1] if len(args) > 1 and isinstance(args[1], str) else None
+
 def handle_crawl_catalog(*args):
     """
     Handler function for Faktory worker.
-    Expects args: [board, previous_thread_numbers]
+    Expects args: [board, chain]
+    (jobs queued before the catalog state moved to MongoDB also carry the previous thread numbers, which are ignored)
     """
     if not args:
         logger.error("No arguments provided for crawl-catalog job.")
         return
     board = args[0]
-    previous_thread_numbers = args[1] if len(args) > 1 else None
+    chain = claim_job('4chan', board, 'crawl-catalog', chain_token(args))
+    if chain is None:
+        logger.info(f"Dropping duplicate crawl-catalog job for /{board}/")
+        return
     logger.info(f"Starting crawl catalog for /{board}/")
-    crawl_catalog(board, previous_thread_numbers)
+    crawl_catalog(board)
+
+    # Schedule the next crawl-catalog job after the board's adaptive interval, even if this poll failed
+    delay_minutes = next_interval('4chan', board)
+    next_chain = hand_off('4chan', board, chain, delay_minutes)
+    if next_chain:
+        schedule_crawl_catalog(board, delay_minutes=delay_minutes, chain=next_chain)
 
-def schedule_crawl_catalog(board, previous_thread_numbers, delay_minutes=None):
+    # Send the follow-up job before the job is acknowledged. The lease has moved to it, so a
+    # retry of this job would be dropped; the producer keeps retrying the buffered job instead.
+    if not get_producer().flush():
+        logger.error(f"Could not send the next crawl-catalog job for /{board}/ yet; it stays buffered")
+
+def schedule_crawl_catalog(board, delay_minutes=None, chain=None):
     logger.info(f"Scheduling crawl-catalog job for /{board}/")
-    with Client(faktory_url="tcp://:password@localhost:7419", role="producer") as client:
-        producer = Producer(client=client)
-        job = Job(
-            jobtype="crawl-catalog",
-            args=[board, previous_thread_numbers],
-            queue="crawl-catalog",
-            retry=3,
-            backtrace=True
-        )
-        if delay_minutes:
-            run_at = datetime.utcnow() + timedelta(minutes=delay_minutes)
-            job.at = run_at.isoformat() + "Z"
-        producer.push(job)
+    job = Job(
+        jobtype="crawl-catalog",
+        args=[board, chain],
+        queue="crawl-catalog",
+        retry=3,
+        backtrace=True
+    )
+    if delay_minutes:
+        run_at = datetime.utcnow() + timedelta(minutes=delay_minutes)
+        job.at = run_at.isoformat() + "Z"
+    get_producer().push(job)
 
 def start_consumer():
     with Client(faktory_url="tcp://:password@localhost:7419", role="consumer") as client:
@@ -194,6 +282,8 @@ def start_consumer():
             queues=["crawl-catalog", "crawl-thread"],
             concurrency=5
         )
+        # Restart board chains whose job was given up on
+        watch_expired_chains("crawl-catalog", schedule_crawl_catalog)
         consumer.register("crawl-catalog", handle_crawl_catalog)
         consumer.register("crawl-thread", handle_crawl_thread)
         consumer.run()
@@ -1,6 +1,7 @@
 import logging
 from pyfaktory import Client, Job, Producer
 import sys
+from crawl_leases import start_chain
 
 # Logger setup
 logger = logging.getLogger("ColdStartBoard")
@@ -11,13 +12,25 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python cold_start_board.py <board>")
+    if len(sys.argv) < 2 or sys.argv[2:] not in ([], ['sweep']):
+        print("Usage: python cold_start_board.py <board> [sweep]")
         sys.exit(1)
     board = sys.argv[1]
-    logger.info(f"Cold starting crawl catalog for board /{board}/")
+    queue = 'crawl-board-sweep' if sys.argv[2:] == ['sweep'] else 'crawl-catalog'
+
+    # At most one crawl chain per board, whichever engine runs it
+    chain = start_chain('4chan', board, queue)
+    if chain is None:
+        logger.info(f"Board /{board}/ already has a live crawl chain, not starting another")
+        sys.exit(0)
 
     with Client(faktory_url="tcp://:password@localhost:7419", role="producer") as client:
         producer = Producer(client=client)
-        job = Job(jobtype="crawl-catalog", args=[board, None], queue="crawl-catalog")
+        if queue == 'crawl-board-sweep':
+            # Async engine: one job sweeps the whole board (chan_async_crawler.py)
+            logger.info(f"Cold starting board sweeps for board /{board}/")
+            job = Job(jobtype="crawl-board-sweep", args=[board, chain], queue="crawl-board-sweep")
+        else:
+            logger.info(f"Cold starting crawl catalog for board /{board}/")
+            job = Job(jobtype="crawl-catalog", args=[board, chain], queue="crawl-catalog")
         producer.push(job)
\ No newline at end of file
@@ -1,6 +1,7 @@
 import logging
 from pyfaktory import Client, Job, Producer
 import sys
+from crawl_leases import start_chain
 
 # Logger setup
 logger = logging.getLogger("ColdStartSubreddit")
@@ -15,9 +16,14 @@ if __name__ == "__main__":
         print("Usage: python cold_start_subreddit.py <subreddit>")
         sys.exit(1)
     subreddit = sys.argv[1]
+    # At most one crawl chain per subreddit
+    chain = start_chain('reddit', subreddit, 'crawl-subreddit')
+    if chain is None:
+        logger.info(f"Subreddit {subreddit} already has a live crawl chain, not starting another")
+        sys.exit(0)
     logger.info(f"Cold starting crawl for subreddit {subreddit}")
 
     with Client(faktory_url="tcp://:password@localhost:7419", role="producer") as client:
         producer = Producer(client=client)
-        job = Job(jobtype="crawl-subreddit", args=[subreddit, None], queue="crawl-subreddit")
+        job = Job(jobtype="crawl-subreddit", args=[subreddit, None, chain], queue="crawl-subreddit")
         producer.push(job)
\ No newline at end of file
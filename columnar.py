@@ -0,0 +1,131 @@
+# columnar.py
+
+import logging
+from array import array
+from datetime import datetime, timedelta
+import numpy as np
+from metrics import coerce_float, normalize_toxic, parse_date
+
+EPOCH = datetime(1970, 1, 1)
+NAT = np.iinfo(np.int64).min  # datetime64 NaT as int64
+
+class ColumnarBatch:
+    """
+    Compact columnar view of analytics documents.
+
+    Holds one NumPy array per metric input instead of a list of dicts:
+    timestamps (datetime64[ms], NaT when missing/invalid), sentiment and score
+    (float64, already coerced to 0.0 when missing/invalid), is_toxic (bool) and
+    source codes (int32 indexes into `source_names`).
+    """
+
+    def __init__(self, source_names, source_codes, timestamps, sentiment, score, is_toxic):
+        self.source_names = list(source_names)
+        self.source_codes = source_codes
+        self.timestamps = timestamps
+        self.sentiment = sentiment
+        self.score = score
+        self.is_toxic = is_toxic
+
+    def __len__(self):
+        return len(self.sentiment)
+
+    @classmethod
+    def from_documents(cls, docs, source_field):
+        """
+        Decodes documents (e.g. a projected cursor) straight into columns, one document at a time.
+
+        Parameters:
+            docs (iterable): Documents with the source, date, sentiment, score and is_toxic fields.
+            source_field (str): 'subreddit' or 'board'.
+        """
+        source_index = {}
+        codes = array('i')
+        timestamps = array('q')
+        sentiment = array('d')
+        score = array('d')
+        toxic = array('b')
+
+        for doc in docs:
+            source = doc.get(source_field)
+            code = source_index.get(source)
+            if code is None:
+                code = source_index[source] = len(source_index)
+            codes.append(code)
+
+            date = parse_date(doc.get('created_utc') or doc.get('created_at'))
+            timestamps.append(NAT if date is None else (date.replace(tzinfo=None) - EPOCH) // timedelta(milliseconds=1))
+            sentiment.append(coerce_float(doc.get('sentiment')))
+            score.append(coerce_float(doc.get('score')))
+            toxic.append(normalize_toxic(doc.get('is_toxic', False)))
+
+        return cls(
+            source_index,
+            np.frombuffer(codes, dtype=np.int32),
+            np.frombuffer(timestamps, dtype=np.int64).view('datetime64[ms]'),
+            np.frombuffer(sentiment, dtype=np.float64),
+            np.frombuffer(score, dtype=np.float64),
+            np.frombuffer(toxic, dtype=np.int8).astype(bool)
+        )
+
+    def select(self, source):
+        """Returns the sub-batch of a single source (empty if the source is absent)."""
+        if source not in self.source_names:
+            mask = np.zeros(len(self), dtype=bool)
+        else:
+            mask = self.source_codes == self.source_names.index(source)
+        return ColumnarBatch(
+            self.source_names, self.source_codes[mask], self.timestamps[mask],
+            self.sentiment[mask], self.score[mask], self.is_toxic[mask]
+        )
+
+    def _daily_means(self, values):
+        """Averages `values` per UTC day, skipping rows without a valid timestamp."""
+        valid = ~np.isnat(self.timestamps)
+        if not valid.any():
+            return [], []
+        days, inverse = np.unique(self.timestamps[valid].astype('datetime64[D]'), return_inverse=True)
+        sums = np.bincount(inverse, weights=values[valid])
+        counts = np.bincount(inverse)
+        return [day.item() for day in days], (sums / counts).tolist()
+
+    def sentiment_trend(self):
+        """Vectorized equivalent of calculate_sentiment_trend."""
+        return self._daily_means(self.sentiment)
+
+    def sentiment_score_trend(self):
+        """Vectorized equivalent of calculate_sentiment_score_trend."""
+        sentiment_score = self.sentiment * self.score
+        both_negative = (self.sentiment < 0) & (self.score < 0)
+        sentiment_score[both_negative] = -sentiment_score[both_negative]
+        return self._daily_means(sentiment_score)
+
+    def toxicity_distribution(self):
+        """Vectorized equivalent of calculate_toxicity_distribution."""
+        toxic = int(np.count_nonzero(self.is_toxic))
+        return {'toxic': toxic, 'non_toxic': len(self) - toxic}
+
+    def average_score(self):
+        """Vectorized equivalent of calculate_average_scores."""
+        return float(self.score.mean()) if len(self) else 0.0
+
+def concat_batches(batches):
+    """Concatenates batches (e.g. posts and comments), re-mapping their source codes."""
+    source_index = {}
+    codes = []
+    for batch in batches:
+        mapping = np.array(
+            [source_index.setdefault(name, len(source_index)) for name in batch.source_names],
+            dtype=np.int32
+        )
+        codes.append(mapping[batch.source_codes] if len(mapping) else batch.source_codes)
+    batch = ColumnarBatch(
+        source_index,
+        np.concatenate(codes),
+        np.concatenate([b.timestamps for b in batches]),
+        np.concatenate([b.sentiment for b in batches]),
+        np.concatenate([b.score for b in batches]),
+        np.concatenate([b.is_toxic for b in batches])
+    )
+    logging.debug(f"Decoded {len(batch)} documents into columnar arrays")
+    return batch
@@ -0,0 +1,88 @@
+# comment_scheduler.py
+
+import logging
+import os
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from db import LazyCollection
+
+# Logger setup
+logger = logging.getLogger("CommentScheduler")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+COMMENT_CRAWL_STATE_COLLECTION = 'comment_crawl_state'
+
+# Posts younger than this are re-crawled every pass (at most every COMMENT_MIN_INTERVAL_MINUTES)
+HOT_WINDOW = timedelta(hours=float(os.getenv("COMMENT_HOT_WINDOW_HOURS", 6)))
+MIN_INTERVAL = timedelta(minutes=float(os.getenv("COMMENT_MIN_INTERVAL_MINUTES", 5)))
+# Upper bound of the age backoff
+MAX_INTERVAL = timedelta(hours=float(os.getenv("COMMENT_MAX_INTERVAL_HOURS", 24)))
+
+comment_state_collection = LazyCollection(COMMENT_CRAWL_STATE_COLLECTION, indexed=True)
+
+def refresh_interval(age):
+    """
+    Minimum time between two comment crawls of a post of the given age.
+
+    MIN_INTERVAL inside the hot window, then doubled for every further hot window
+    of age, capped at MAX_INTERVAL.
+    """
+    if age < HOT_WINDOW:
+        return MIN_INTERVAL
+    doublings = min(int(age / HOT_WINDOW), 32)
+    return min(MIN_INTERVAL * 2 ** doublings, MAX_INTERVAL)
+
+def is_due(post, state, now):
+    """
+    Decides whether a post's comments should be crawled now.
+
+    Parameters:
+        post (dict): Stored post (post_id, created_utc, comments_count).
+        state (dict or None): Its comment_crawl_state entry.
+        now (datetime): Current UTC time.
+    """
+    if state is None:
+        return True
+    age = now - post['created_utc']
+    changed = post.get('comments_count', 0) != state.get('comments_count')
+    if not changed and age >= HOT_WINDOW:
+        return False
+    return now - state['last_crawled_at'] >= refresh_interval(age)
+
+def due_comment_crawls(posts, now=None):
+    """
+    Returns the post_ids among a stored page whose comments should be crawled, and
+    records them as crawled with their current comment count.
+
+    Old posts whose comment count did not change are skipped; others are re-crawled
+    at most once per refresh_interval(age).
+    """
+    now = now or datetime.utcnow()
+    posts = list({post['post_id']: post for post in posts}.values())
+    post_ids = [post['post_id'] for post in posts]
+    states = {
+        state['post_id']: state
+        for state in comment_state_collection.find({'post_id': {'$in': post_ids}})
+    }
+
+    due = [post for post in posts if is_due(post, states.get(post['post_id']), now)]
+    if due:
+        comment_state_collection.bulk_write([
+            UpdateOne(
+                {'post_id': post['post_id']},
+                {'$set': {
+                    'subreddit': post['subreddit'],
+                    'created_utc': post['created_utc'],
+                    'comments_count': post.get('comments_count', 0),
+                    'last_crawled_at': now
+                }},
+                upsert=True
+            )
+            for post in due
+        ], ordered=False)
+    logger.info(f"{len(due)} of {len(posts)} posts due for a comment crawl")
+    return [post['post_id'] for post in due]
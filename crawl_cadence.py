@@ -0,0 +1,154 @@
+# crawl_cadence.py
+
+import logging
+import os
+import sys
+from datetime import datetime
+from pymongo.errors import PyMongoError
+from db import LazyCollection
+
+# Logger setup
+logger = logging.getLogger("CrawlCadence")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+CRAWL_CADENCE_COLLECTION = 'crawl_cadence'
+
+# Bounds of the polling interval of a subreddit or board, in minutes
+MIN_INTERVAL_MINUTES = float(os.getenv("CRAWL_MIN_INTERVAL_MINUTES", 1))
+MAX_INTERVAL_MINUTES = float(os.getenv("CRAWL_MAX_INTERVAL_MINUTES", 60))
+# Interval of a source until its rate is known (the former fixed delay)
+DEFAULT_INTERVAL_MINUTES = float(os.getenv("CRAWL_DEFAULT_INTERVAL_MINUTES", 5))
+# New items a poll should find on average; well below a Reddit listing page (100)
+TARGET_ITEMS_PER_POLL = float(os.getenv("CRAWL_TARGET_ITEMS_PER_POLL", 25))
+# Largest factor by which the interval of a quieting source grows from one poll to the next
+MAX_BACKOFF = float(os.getenv("CRAWL_MAX_BACKOFF", 2))
+# Age after which an observed rate counts half in the moving average
+RATE_HALF_LIFE_MINUTES = float(os.getenv("CRAWL_RATE_HALF_LIFE_MINUTES", 60))
+
+# MongoDB collection, connected on first use
+cadence_collection = LazyCollection(CRAWL_CADENCE_COLLECTION, indexed=True)
+
+def record_new_items(platform, source, count):
+    """Counts items stored for the first time since the source's last poll was scheduled."""
+    if not count:
+        return
+    try:
+        cadence_collection.update_one(
+            {'platform': platform, 'source': source},
+            {'$inc': {'pending_items': count}},
+            upsert=True
+        )
+    except PyMongoError as e:
+        logger.error(f"Failed to record {count} new items for {platform}/{source}: {e}")
+
+def update_rate(rate, items, elapsed_minutes):
+    """
+    Folds the items found over `elapsed_minutes` into a time-weighted moving
+    average of the arrival rate (items per minute).
+
+    Parameters:
+        rate (float or None): Previous average, None for the first observation.
+        items (int): New items since the previous poll.
+        elapsed_minutes (float): Time since the previous poll.
+
+    Returns:
+        float: Updated arrival rate.
+    """
+    observed = items / elapsed_minutes
+    if rate is None:
+        return observed
+    weight = 1 - 0.5 ** (elapsed_minutes / RATE_HALF_LIFE_MINUTES)
+    return rate + weight * (observed - rate)
+
+def interval_for_rate(rate):
+    """Returns the polling interval (minutes) that finds TARGET_ITEMS_PER_POLL items at `rate`, within bounds."""
+    if not rate:
+        return MAX_INTERVAL_MINUTES
+    return min(max(TARGET_ITEMS_PER_POLL / rate, MIN_INTERVAL_MINUTES), MAX_INTERVAL_MINUTES)
+
+def next_interval(platform, source, now=None):
+    """
+    Updates the source's arrival rate with the items stored since its last poll
+    and returns the delay (minutes) before polling it again.
+
+    Quiet sources back off towards MAX_INTERVAL_MINUTES and busy ones speed up
+    towards MIN_INTERVAL_MINUTES. Falls back to DEFAULT_INTERVAL_MINUTES when the
+    state cannot be read, so a source is never left unscheduled.
+    """
+    now = now or datetime.utcnow()
+    key = {'platform': platform, 'source': source}
+    try:
+        state = cadence_collection.find_one(key) or {}
+        last_polled_at = state.get('last_polled_at')
+        pending = state.get('pending_items', 0)
+
+        if last_polled_at is None:
+            # First poll: nothing to measure against yet
+            cadence_collection.update_one(key, {
+                '$set': {'last_polled_at': now, 'interval_minutes': DEFAULT_INTERVAL_MINUTES},
+                '$inc': {'pending_items': -pending}
+            }, upsert=True)
+            return DEFAULT_INTERVAL_MINUTES
+
+        elapsed = (now - last_polled_at).total_seconds() / 60
+        if elapsed < MIN_INTERVAL_MINUTES:
+            # Too short a window to measure (e.g. a retry right after a poll); keep the current cadence
+            return state.get('interval_minutes', DEFAULT_INTERVAL_MINUTES)
+
+        rate = update_rate(state.get('rate_per_minute'), pending, elapsed)
+        # Speed up at once, but back off at most MAX_BACKOFF times per poll
+        previous = state.get('interval_minutes', DEFAULT_INTERVAL_MINUTES)
+        interval = min(interval_for_rate(rate), previous * MAX_BACKOFF)
+        cadence_collection.update_one(key, {
+            '$set': {'last_polled_at': now, 'rate_per_minute': rate, 'interval_minutes': interval},
+            # Items stored while this poll was being evaluated stay pending for the next one
+            '$inc': {'pending_items': -pending, 'polls': 1, 'items': pending, 'empty_polls': 0 if pending else 1}
+        })
+    except PyMongoError as e:
+        logger.error(f"Failed to update the crawl cadence of {platform}/{source}: {e}")
+        return DEFAULT_INTERVAL_MINUTES
+
+    logger.info(f"{platform}/{source}: {pending} new items in {elapsed:.1f} min, "
+                f"{rate * 60:.1f}/h on average, next poll in {interval:.1f} min")
+    return interval
+
+def cadence_stats(platform=None):
+    """
+    Returns the current polling interval and yield of every source, busiest first.
+
+    Parameters:
+        platform (str, optional): 'reddit' or '4chan'; all platforms by default.
+
+    Returns:
+        list: One dict per source (interval, arrival rate per hour, polls, items per poll, share of empty polls).
+    """
+    query = {'platform': platform} if platform else {}
+    stats = []
+    for state in cadence_collection.find(query, {'_id': 0}):
+        polls = state.get('polls', 0)
+        stats.append({
+            'platform': state['platform'],
+            'source': state['source'],
+            'interval_minutes': round(state.get('interval_minutes', DEFAULT_INTERVAL_MINUTES), 2),
+            'rate_per_hour': round((state.get('rate_per_minute') or 0) * 60, 2),
+            'polls': polls,
+            'items': state.get('items', 0),
+            'items_per_poll': round(state.get('items', 0) / polls, 2) if polls else None,
+            'empty_poll_ratio': round(state.get('empty_polls', 0) / polls, 3) if polls else None,
+            'last_polled_at': state.get('last_polled_at')
+        })
+    return sorted(stats, key=lambda s: s['rate_per_hour'], reverse=True)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != 'stats':
+        print("Usage: python crawl_cadence.py stats [reddit|4chan]")
+        sys.exit(1)
+
+    for s in cadence_stats(sys.argv[2] if len(sys.argv) > 2 else None):
+        logger.info(f"{s['platform']}/{s['source']}: every {s['interval_minutes']} min, "
+                    f"{s['rate_per_hour']}/h, {s['items_per_poll']} items/poll over {s['polls']} polls "
+                    f"({s['empty_poll_ratio']} empty)")
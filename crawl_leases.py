@@ -0,0 +1,233 @@
+# crawl_leases.py
+
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from db import LazyCollection
+
+# Logger setup
+logger = logging.getLogger("CrawlLeases")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+CRAWL_LEASE_COLLECTION = 'crawl_leases'
+
+# How long past its scheduled run time a chain job may sit in the queue before the
+# chain is considered dead and a cold start may replace it
+LEASE_GRACE_MINUTES = float(os.getenv("CRAWL_LEASE_GRACE_MINUTES", 30))
+
+# Minutes between two checks of a consumer for chains whose lease expired
+LEASE_CHECK_MINUTES = float(os.getenv("CRAWL_LEASE_CHECK_MINUTES", 5))
+
+# Queues of the per-source crawl chains
+CHAIN_QUEUES = ['crawl-subreddit', 'crawl-catalog', 'crawl-board-sweep']
+
+# MongoDB collection, connected on first use
+lease_collection = LazyCollection(CRAWL_LEASE_COLLECTION, indexed=True)
+
+def start_chain(platform, source, queue, now=None):
+    """
+    Takes the lease of a source for a new crawl chain.
+
+    Succeeds if the source has no chain yet or its chain died (lease expired).
+    `queue` is the chain's Faktory queue (a board is crawled through either
+    crawl-catalog or crawl-board-sweep).
+
+    Returns:
+        str or None: Token to pass to the chain's first job, None if a live chain holds the lease.
+    """
+    now = now or datetime.utcnow()
+    token = uuid.uuid4().hex
+    try:
+        # Matches an expired lease; otherwise inserts one, which the unique index rejects if a live lease exists
+        lease_collection.update_one(
+            {'platform': platform, 'source': source, 'expires_at': {'$lt': now}},
+            {'$set': {
+                'token': token,
+                'queue': queue,
+                'chain_started_at': now,
+                'next_run_at': now,
+                'expires_at': now + timedelta(minutes=LEASE_GRACE_MINUTES)
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return None
+    logger.info(f"Started crawl chain {token} for {platform}/{source}")
+    return token
+
+def claim_job(platform, source, queue, token):
+    """
+    Checks that a chain job belongs to the source's current chain.
+
+    Jobs queued before chains carried a token (`token` None) start a chain if
+    the source has none. Jobs of any other chain are duplicates: they are
+    counted on the lease and must be dropped without scheduling a successor.
+
+    Returns:
+        str or None: The token the job runs under, None if it is a duplicate.
+    """
+    if token is None:
+        token = start_chain(platform, source, queue)
+    elif lease_collection.find_one({'platform': platform, 'source': source, 'token': token}, {'_id': 1}) is None:
+        token = None
+    if token is None:
+        lease_collection.update_one(
+            {'platform': platform, 'source': source},
+            {'$inc': {'duplicates_dropped': 1}, '$set': {'last_duplicate_at': datetime.utcnow()}}
+        )
+    return token
+
+def hand_off(platform, source, token, delay_minutes=None, now=None):
+    """
+    Passes the lease from the running job to its successor.
+
+    The token is swapped atomically, so of two jobs of the same chain (e.g. a
+    Faktory retry of a job that already scheduled its successor) only one
+    schedules a successor.
+
+    Returns:
+        str or None: Token for the successor job, None if `token` no longer holds the lease.
+    """
+    now = now or datetime.utcnow()
+    next_token = uuid.uuid4().hex
+    run_at = now + timedelta(minutes=delay_minutes or 0)
+    result = lease_collection.update_one(
+        {'platform': platform, 'source': source, 'token': token},
+        {'$set': {
+            'token': next_token,
+            'next_run_at': run_at,
+            'expires_at': run_at + timedelta(minutes=LEASE_GRACE_MINUTES)
+        }}
+    )
+    if not result.modified_count:
+        logger.warning(f"Crawl chain {token} of {platform}/{source} lost its lease; not scheduling a successor")
+        return None
+    return next_token
+
+def restart_expired_chains(queue, schedule, now=None):
+    """
+    Restarts the chains of `queue` whose lease expired, e.g. because Faktory gave
+    up retrying their job or the job was lost.
+
+    Each expired lease is taken over through start_chain, so when several
+    consumers check at once only one of them restarts a given chain.
+
+    Parameters:
+        queue (str): Chain queue ('crawl-subreddit', 'crawl-catalog', 'crawl-board-sweep').
+        schedule (callable): Queues a chain's first job, called as schedule(source, chain=token).
+
+    Returns:
+        list: (platform, source) of every restarted chain.
+    """
+    now = now or datetime.utcnow()
+    restarted = []
+    for lease in lease_collection.find({'queue': queue, 'expires_at': {'$lt': now}}, {'platform': 1, 'source': 1}):
+        token = start_chain(lease['platform'], lease['source'], queue, now=now)
+        if token is None:
+            continue  # restarted by another consumer
+        logger.warning(f"Crawl chain of {lease['platform']}/{lease['source']} had expired; restarted it")
+        schedule(lease['source'], chain=token)
+        restarted.append((lease['platform'], lease['source']))
+    return restarted
+
+def watch_expired_chains(queue, schedule, interval_minutes=LEASE_CHECK_MINUTES):
+    """
+    Starts a daemon thread running restart_expired_chains for `queue` every
+    `interval_minutes`. Consumers start one per chain queue they serve.
+    """
+    def watch():
+        while True:
+            try:
+                restart_expired_chains(queue, schedule)
+            except Exception as e:
+                logger.error(f"Could not check the {queue} chains for expired leases: {e}")
+            time.sleep(interval_minutes * 60)
+
+    thread = threading.Thread(target=watch, name=f"lease-watch-{queue}", daemon=True)
+    thread.start()
+    return thread
+
+def lease_status(now=None):
+    """
+    Returns the crawl chain of every source.
+
+    Returns:
+        list: One dict per source (next run, lease expiry, whether the chain is alive, duplicate jobs dropped).
+    """
+    now = now or datetime.utcnow()
+    return [
+        {
+            'platform': lease['platform'],
+            'source': lease['source'],
+            'next_run_at': lease.get('next_run_at'),
+            'expires_at': lease.get('expires_at'),
+            'alive': bool(lease.get('expires_at')) and lease['expires_at'] >= now,
+            'duplicates_dropped': lease.get('duplicates_dropped', 0),
+            'last_duplicate_at': lease.get('last_duplicate_at')
+        }
+        for lease in lease_collection.find({}, {'_id': 0}).sort([('platform', 1), ('source', 1)])
+    ]
+
+def queued_duplicates(faktory_url, now=None):
+    """
+    Estimates the duplicate chain jobs waiting in Faktory.
+
+    Faktory does not list queued jobs, so the ready jobs of each chain queue are
+    compared with the live chains whose next job is due: a live chain has exactly
+    one job queued, anything beyond that belongs to a duplicate (or pre-lease) chain.
+
+    Returns:
+        dict: queue -> {'ready': jobs in the queue, 'expected': due live chains, 'duplicates': excess}
+    """
+    from pyfaktory import Client
+
+    now = now or datetime.utcnow()
+    with Client(faktory_url=faktory_url, role="producer") as client:
+        queues = client.info().get('faktory', {}).get('queues', {})
+
+    due = {}
+    for lease in lease_collection.find({'expires_at': {'$gte': now}, 'next_run_at': {'$lte': now}}):
+        due[lease['queue']] = due.get(lease['queue'], 0) + 1
+
+    report = {}
+    for queue in CHAIN_QUEUES:
+        ready = queues.get(queue, 0)
+        expected = due.get(queue, 0)
+        report[queue] = {'ready': ready, 'expected': expected, 'duplicates': max(ready - expected, 0)}
+    return report
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ('status', 'duplicates'):
+        print("Usage: python crawl_leases.py status|duplicates")
+        sys.exit(1)
+
+    if sys.argv[1] == 'status':
+        for lease in lease_status():
+            state = 'alive' if lease['alive'] else 'DEAD (the next consumer check restarts it)'
+            logger.info(f"{lease['platform']}/{lease['source']}: {state}, next run {lease['next_run_at']}, "
+                        f"{lease['duplicates_dropped']} duplicate jobs dropped (last {lease['last_duplicate_at']})")
+    else:
+        from faktory_producer import FAKTORY_URL
+
+        try:
+            report = queued_duplicates(FAKTORY_URL)
+        except (OSError, PyMongoError) as e:
+            logger.error(f"Could not inspect the queues: {e}")
+            sys.exit(1)
+        for queue, counts in report.items():
+            logger.info(f"{queue}: {counts['ready']} jobs ready for {counts['expected']} due chains, "
+                        f"{counts['duplicates']} duplicates")
+        for lease in lease_status():
+            if lease['duplicates_dropped']:
+                logger.info(f"{lease['platform']}/{lease['source']}: {lease['duplicates_dropped']} duplicate jobs "
+                            f"dropped so far (last {lease['last_duplicate_at']})")
+        sys.exit(1 if any(counts['duplicates'] for counts in report.values()) else 0)
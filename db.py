@@ -0,0 +1,64 @@
+# db.py
+
+import os
+import threading
+from pymongo import MongoClient
+
+# Defaults; MONGO_URI / MONGO_DB are read when connecting, after .env has been loaded
+DEFAULT_MONGO_URI = "mongodb://localhost:27017/"
+DEFAULT_DB_NAME = "new_crawler_db"
+
+_client = None
+_client_pid = None
+_indexed = set()
+_lock = threading.Lock()
+
+def get_db():
+    """
+    Returns the crawler database, connecting on first use.
+
+    One MongoClient per process: a client inherited through fork (Faktory
+    consumers fork their worker processes) is replaced, as pymongo clients are
+    not fork-safe.
+    """
+    global _client, _client_pid
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = MongoClient(os.getenv("MONGO_URI", DEFAULT_MONGO_URI))
+            _client_pid = os.getpid()
+            _indexed.clear()
+        return _client[os.getenv("MONGO_DB", DEFAULT_DB_NAME)]
+
+def ensure_indexes_once(names):
+    """Builds the declared indexes of `names` the first time this process uses them."""
+    from indexes import ensure_indexes
+
+    db = get_db()
+    with _lock:
+        missing = [name for name in names if name not in _indexed]
+        if missing:
+            ensure_indexes(db, missing)
+            _indexed.update(missing)
+
+class LazyCollection:
+    """
+    Module-level collection handle that connects on first use instead of at import.
+
+    Behaves like the pymongo Collection it resolves to. With `indexed=True` the
+    collection's declared indexes (indexes.INDEXES) are built before its first use.
+    """
+
+    def __init__(self, name, indexed=False):
+        self.name = name
+        self.indexed = indexed
+
+    def resolve(self):
+        if self.indexed:
+            ensure_indexes_once([self.name])
+        return get_db()[self.name]
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
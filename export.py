@@ -0,0 +1,172 @@
+# export.py
+
+import csv
+import io
+import json
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta
+from pymongo.errors import PyMongoError
+from db import LazyCollection
+
+# Logger setup
+logger = logging.getLogger("Export")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Raw collections that can be exported: date field, source field and exportable fields
+EXPORT_DATASETS = {
+    'reddit_posts': {
+        'date_field': 'created_utc',
+        'source_field': 'subreddit',
+        'fields': ['subreddit', 'post_id', 'title', 'author', 'created_utc', 'content',
+                   'comments_count', 'score', 'url', 'is_toxic', 'sentiment']
+    },
+    'reddit_comments': {
+        'date_field': 'created_utc',
+        'source_field': 'subreddit',
+        'fields': ['subreddit', 'post_id', 'comment_id', 'author', 'created_utc', 'body',
+                   'score', 'is_toxic', 'sentiment']
+    },
+    'chan_posts': {
+        'date_field': 'created_at',
+        'source_field': 'board',
+        'fields': ['board', 'thread_no', 'post_no', 'created_at', 'name', 'comment',
+                   'replies', 'images', 'is_toxic', 'sentiment']
+    },
+}
+
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+# Documents per cursor round trip, and bytes buffered before a chunk is sent
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", 64 * 1024))
+
+# MongoDB collections, connected on first use
+export_collections = {dataset: LazyCollection(dataset) for dataset in EXPORT_DATASETS}
+
+def select_fields(dataset, requested=None):
+    """
+    Validates a field selection against the dataset's exportable fields.
+
+    Parameters:
+        dataset (str): Key of EXPORT_DATASETS.
+        requested (list, optional): Field names; all exportable fields by default.
+
+    Returns:
+        list: Fields to export, in the requested order.
+
+    Raises:
+        ValueError: Unknown dataset or field.
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise ValueError(f"Unknown dataset '{dataset}', expected one of {sorted(EXPORT_DATASETS)}")
+    available = EXPORT_DATASETS[dataset]['fields']
+    if not requested:
+        return list(available)
+    unknown = [field for field in requested if field not in available]
+    if unknown:
+        raise ValueError(f"Unknown fields for {dataset}: {unknown}")
+    return list(dict.fromkeys(requested))
+
+def iter_export_documents(dataset, start_date, end_date, sources=None, fields=None, collection=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Streams the documents of a dataset created between start_date and end_date
+    (whole days, both included), in natural order, with only `fields` returned.
+
+    Yields:
+        dict: Projected documents, one cursor batch in memory at a time.
+    """
+    spec = EXPORT_DATASETS[dataset]
+    query = {spec['date_field']: {'$gte': start_date, '$lt': end_date + timedelta(days=1)}}
+    if sources and "all" not in sources:
+        query[spec['source_field']] = {'$in': sources}
+    projection = dict.fromkeys(fields, 1)
+    projection['_id'] = 0
+    collection = collection if collection is not None else export_collections[dataset]
+    yield from collection.find(query, projection, batch_size=batch_size)
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def encode_ndjson(docs, fields):
+    """Yields one JSON line per document, keys in `fields` order."""
+    for doc in docs:
+        yield json.dumps({field: _export_value(doc.get(field)) for field in fields}, ensure_ascii=False) + '\n'
+
+def encode_csv(docs, fields):
+    """Yields the header row, then one CSV row per document (missing values empty)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield buffer.getvalue()
+    for doc in docs:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([_export_value(doc.get(field)) for field in fields])
+        yield buffer.getvalue()
+
+def chunk_lines(lines, chunk_bytes=EXPORT_CHUNK_BYTES):
+    """
+    Groups encoded lines into byte chunks of about `chunk_bytes`.
+
+    The first line is sent on its own so the client receives bytes as soon as
+    the first document (or CSV header) is available.
+    """
+    chunk, size, first = [], 0, True
+    for line in lines:
+        data = line.encode('utf-8')
+        if first:
+            yield data
+            first = False
+            continue
+        chunk.append(data)
+        size += len(data)
+        if size >= chunk_bytes:
+            yield b''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b''.join(chunk)
+
+def gzip_chunks(chunks, level=6):
+    """
+    Compresses a chunk stream into one gzip stream.
+
+    Every chunk is sync-flushed, so what the client has received so far can
+    always be decompressed.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+def export_stream(dataset, export_format, start_date, end_date, sources=None, fields=None, compress=False, collection=None):
+    """
+    Streams a dataset export as NDJSON or CSV byte chunks, optionally gzipped.
+
+    Memory stays bounded by one cursor batch and one chunk, whatever the date range.
+    A database error ends the stream early (the status line is already sent).
+    The dataset and fields are validated before anything is streamed.
+
+    Returns:
+        generator: Response body chunks (bytes).
+
+    Raises:
+        ValueError: Unknown dataset or field.
+    """
+    fields = select_fields(dataset, fields)
+    docs = iter_export_documents(dataset, start_date, end_date, sources, fields, collection=collection)
+    encode = encode_csv if export_format == 'csv' else encode_ndjson
+
+    def guarded(lines):
+        try:
+            yield from lines
+        except PyMongoError as e:
+            logger.error(f"Export of {dataset} aborted: {e}")
+
+    chunks = chunk_lines(guarded(encode(docs, fields)))
+    return gzip_chunks(chunks) if compress else chunks
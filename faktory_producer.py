@@ -0,0 +1,210 @@
+# faktory_producer.py
+
+import atexit
+import logging
+import os
+import threading
+import time
+from pyfaktory import Client, Producer
+
+# Logger setup
+logger = logging.getLogger("FaktoryProducer")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+FAKTORY_URL = os.getenv("FAKTORY_URL", "tcp://:password@localhost:7419")
+
+class FaktoryProducer:
+    """
+    Long-lived Faktory producer shared by every thread of a worker process.
+
+    push() only appends the job to an in-memory buffer. The buffer is sent with
+    one PUSHB per `max_batch` jobs, either by flush() or by a background thread
+    at most `flush_interval` seconds after the first buffered job. A single
+    connection is kept open and re-established when a send fails; jobs that could
+    not be sent stay buffered for the next attempt.
+    """
+
+    def __init__(self, faktory_url=FAKTORY_URL, max_batch=100, flush_interval=0.5, stats_interval=60):
+        self.faktory_url = faktory_url
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.stats_interval = stats_interval
+        self.client = None
+        self.producer = None
+        self.buffer = []  # (job, buffered_at)
+        self.buffer_lock = threading.Condition()
+        self.send_lock = threading.Lock()
+        self.closed = False
+
+        # Metrics
+        self.jobs_sent = 0
+        self.jobs_failed = 0
+        self.batches = 0
+        self.max_batch_size = 0
+        self.latency_sum = 0.0
+        self.max_latency = 0.0
+        self.reconnects = 0
+        self.last_stats_log = time.monotonic()
+
+        self.flusher = threading.Thread(target=self._flush_loop, name="faktory-producer", daemon=True)
+        self.flusher.start()
+
+    def push(self, job):
+        """Buffers a job for the next batch push; returns immediately."""
+        with self.buffer_lock:
+            self.buffer.append((job, time.monotonic()))
+            if len(self.buffer) == 1 or len(self.buffer) >= self.max_batch:
+                self.buffer_lock.notify()
+
+    def push_many(self, jobs):
+        """Buffers several jobs at once (e.g. every thread of a catalog)."""
+        now = time.monotonic()
+        with self.buffer_lock:
+            self.buffer.extend((job, now) for job in jobs)
+            self.buffer_lock.notify()
+
+    def flush(self):
+        """
+        Sends every buffered job now.
+
+        Job handlers call this before returning, so a job is only acknowledged
+        once the jobs it scheduled are on the server.
+
+        Returns:
+            bool: True if the buffer was fully sent.
+        """
+        while True:
+            with self.buffer_lock:
+                if not self.buffer:
+                    return True
+                batch, self.buffer = self.buffer[:self.max_batch], self.buffer[self.max_batch:]
+            if not self._send(batch):
+                with self.buffer_lock:
+                    self.buffer[:0] = batch
+                return False
+
+    def _flush_loop(self):
+        while not self.closed:
+            if time.monotonic() - self.last_stats_log >= self.stats_interval:
+                self.last_stats_log = time.monotonic()
+                self.log_stats()
+            with self.buffer_lock:
+                if not self.buffer:
+                    self.buffer_lock.wait(timeout=self.stats_interval)
+                    continue
+                # Let concurrent pushes accumulate into the same batch
+                deadline = self.buffer[0][1] + self.flush_interval
+                if len(self.buffer) < self.max_batch and time.monotonic() < deadline:
+                    self.buffer_lock.wait(timeout=deadline - time.monotonic())
+                    continue
+            if not self.flush():
+                time.sleep(self.flush_interval)
+
+    def _connect(self):
+        self.client = Client(faktory_url=self.faktory_url, role="producer")
+        self.client.connect()
+        self.producer = Producer(client=self.client)
+
+    def _disconnect(self):
+        if self.client is not None:
+            try:
+                self.client.disconnect()
+            except Exception:
+                pass
+        self.client = None
+        self.producer = None
+
+    def _send(self, batch):
+        """PUSHBs one batch, reconnecting once if the connection is broken."""
+        jobs = [job for job, _ in batch]
+        with self.send_lock:
+            for attempt in range(2):
+                try:
+                    if self.producer is None:
+                        if attempt or self.batches:
+                            self.reconnects += 1
+                        self._connect()
+                    errors = self.producer.push_bulk(jobs)
+                    break
+                except Exception as e:
+                    logger.warning(f"Failed to push {len(jobs)} jobs to Faktory (attempt {attempt + 1}): {e}")
+                    self._disconnect()
+            else:
+                logger.error(f"Could not reach Faktory; keeping {len(jobs)} jobs buffered")
+                return False
+
+            now = time.monotonic()
+            for jid, error in (errors or {}).items():
+                logger.error(f"Faktory rejected job {jid}: {error}")
+            self.jobs_failed += len(errors or {})
+            self.jobs_sent += len(jobs) - len(errors or {})
+            self.batches += 1
+            self.max_batch_size = max(self.max_batch_size, len(jobs))
+            for _, buffered_at in batch:
+                self.latency_sum += now - buffered_at
+                self.max_latency = max(self.max_latency, now - buffered_at)
+            logger.debug(f"Pushed batch of {len(jobs)} jobs")
+            return True
+
+    def stats(self):
+        """Returns enqueue latency (buffered -> acknowledged by Faktory) and batch size metrics."""
+        with self.send_lock:
+            jobs = self.jobs_sent + self.jobs_failed
+            return {
+                'jobs_sent': self.jobs_sent,
+                'jobs_failed': self.jobs_failed,
+                'jobs_buffered': len(self.buffer),
+                'batches': self.batches,
+                'avg_batch_size': jobs / self.batches if self.batches else 0.0,
+                'max_batch_size': self.max_batch_size,
+                'avg_enqueue_latency_ms': 1000 * self.latency_sum / jobs if jobs else 0.0,
+                'max_enqueue_latency_ms': 1000 * self.max_latency,
+                'reconnects': self.reconnects
+            }
+
+    def log_stats(self):
+        stats = self.stats()
+        if stats['batches']:
+            logger.info(
+                f"Faktory producer: {stats['jobs_sent']} jobs in {stats['batches']} batches "
+                f"(avg {stats['avg_batch_size']:.1f}, max {stats['max_batch_size']}), "
+                f"enqueue latency avg {stats['avg_enqueue_latency_ms']:.1f} ms / max {stats['max_enqueue_latency_ms']:.1f} ms, "
+                f"{stats['jobs_failed']} rejected, {stats['reconnects']} reconnects"
+            )
+
+    def close(self):
+        """Flushes the buffer and closes the connection."""
+        self.closed = True
+        with self.buffer_lock:
+            self.buffer_lock.notify()
+        self.flush()
+        with self.send_lock:
+            self._disconnect()
+
+_producers = {}
+_producers_lock = threading.Lock()
+
+def get_producer(faktory_url=FAKTORY_URL):
+    """
+    Returns this process's producer for `faktory_url`, creating it on first use.
+
+    Faktory consumers run handlers in forked worker processes; a producer inherited
+    from the parent is never reused, since its connection and flusher thread belong
+    to the parent.
+    """
+    with _producers_lock:
+        entry = _producers.get(faktory_url)
+        if entry is None or entry[0] != os.getpid():
+            entry = _producers[faktory_url] = (os.getpid(), FaktoryProducer(faktory_url))
+        return entry[1]
+
+@atexit.register
+def _close_producers():
+    for pid, producer in list(_producers.values()):
+        if pid == os.getpid():
+            producer.close()
+            producer.log_stats()
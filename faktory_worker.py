@@ -1,7 +1,8 @@
 import logging
 from pyfaktory import Client, Consumer
-from reddit_crawler import handle_crawl_subreddit
-from chan_crawler import handle_crawl_catalog, handle_crawl_thread
+from reddit_crawler import handle_crawl_subreddit, schedule_crawl_subreddit
+from chan_crawler import handle_crawl_catalog, handle_crawl_thread, schedule_crawl_catalog
+from crawl_leases import watch_expired_chains
 
 # Logger setup
 logger = logging.getLogger("FaktoryWorker")
@@ -18,6 +19,9 @@ def start_worker():
             queues=["crawl-subreddit", "crawl-catalog", "crawl-thread"],
             concurrency=10  
         )
+        # Restart chains whose job was given up on
+        watch_expired_chains("crawl-subreddit", schedule_crawl_subreddit)
+        watch_expired_chains("crawl-catalog", schedule_crawl_catalog)
         # Register Reddit handlers
         consumer.register("crawl-subreddit", handle_crawl_subreddit)
         # Register 4chan handlers
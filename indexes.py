@@ -0,0 +1,175 @@
+# indexes.py
+
+import logging
+import sys
+from datetime import datetime, timedelta
+from pymongo import ASCENDING
+from db import get_db
+from rollups import ROLLUP_COLLECTION
+from response_cache import SOURCE_VERSIONS_COLLECTION
+
+# Logger setup
+logger = logging.getLogger("Indexes")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# collection -> [(keys, options)]
+# Compound indexes lead with the equality field (subreddit/board/platform) and end
+# with the range field, so both the filtered queries and distinct() use them.
+INDEXES = {
+    'reddit_posts': [
+        ([("post_id", ASCENDING)], {'unique': True}),
+        ([("subreddit", ASCENDING), ("created_utc", ASCENDING)], {}),
+        ([("created_utc", ASCENDING)], {}),
+    ],
+    'reddit_comments': [
+        ([("comment_id", ASCENDING)], {'unique': True}),
+        ([("subreddit", ASCENDING), ("created_utc", ASCENDING)], {}),
+        ([("created_utc", ASCENDING)], {}),
+    ],
+    'chan_posts': [
+        ([("post_no", ASCENDING)], {'unique': True}),
+        ([("board", ASCENDING), ("created_at", ASCENDING)], {}),
+        ([("created_at", ASCENDING)], {}),
+    ],
+    'chan_thread_state': [
+        ([("board", ASCENDING), ("thread_no", ASCENDING)], {'unique': True}),
+    ],
+    'chan_catalog_state': [
+        ([("board", ASCENDING)], {'unique': True}),
+    ],
+    'backfill_units': [
+        ([("subreddit", ASCENDING), ("day", ASCENDING)], {'unique': True}),
+        ([("status", ASCENDING), ("day", ASCENDING)], {}),
+    ],
+    'crawl_leases': [
+        ([("platform", ASCENDING), ("source", ASCENDING)], {'unique': True}),
+    ],
+    'crawl_cadence': [
+        ([("platform", ASCENDING), ("source", ASCENDING)], {'unique': True}),
+    ],
+    'comment_crawl_state': [
+        ([("post_id", ASCENDING)], {'unique': True}),
+    ],
+    ROLLUP_COLLECTION: [
+        ([("platform", ASCENDING), ("source", ASCENDING), ("day", ASCENDING)], {'unique': True}),
+        ([("platform", ASCENDING), ("day", ASCENDING)], {}),
+    ],
+    SOURCE_VERSIONS_COLLECTION: [
+        ([("platform", ASCENDING), ("source", ASCENDING)], {'unique': True}),
+    ],
+}
+
+def ensure_indexes(db, collections=None):
+    """
+    Builds the declared indexes. Safe to call repeatedly: existing indexes are left as they are.
+
+    Parameters:
+        db (Database): Crawler database.
+        collections (list, optional): Collections to index. Defaults to all declared collections.
+    """
+    for name in collections or INDEXES:
+        for keys, options in INDEXES[name]:
+            index_name = db[name].create_index(keys, **options)
+            logger.debug(f"Ensured index {index_name} on {name}")
+
+def _query_shapes(db):
+    """
+    Returns (description, explain function) for every query shape issued by utils.py.
+
+    Sample filter values are used; the plan only depends on the shape of the query.
+    """
+    from utils import _chan_query, _metrics_pipeline, _reddit_query
+
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=7)
+    subreddits = ['jobs', 'layoffs']
+    boards = ['biz']
+
+    def explain_find(name, query):
+        return lambda: db[name].find(query).explain()
+
+    def explain_aggregate(name, pipeline):
+        return lambda: db.command('aggregate', name, pipeline=pipeline, explain=True)
+
+    def explain_distinct(name, key):
+        return lambda: db.command('explain', {'distinct': name, 'key': key})
+
+    shapes = []
+    for label, sources in (('selected', subreddits), ('all', ['all'])):
+        query = _reddit_query(start_date, end_date, sources)
+        shapes.append((f"reddit_posts find ({label} subreddits)", explain_find('reddit_posts', query)))
+        shapes.append((f"reddit_comments find ({label} subreddits)", explain_find('reddit_comments', query)))
+        shapes.append((f"reddit metrics aggregate ({label} subreddits)", explain_aggregate(
+            'reddit_posts', _metrics_pipeline(query, 'created_utc', 'subreddit', union_with='reddit_comments'))))
+    for label, sources in (('selected', boards), ('all', ['all'])):
+        query = _chan_query(start_date, end_date, sources)
+        shapes.append((f"chan_posts find ({label} boards)", explain_find('chan_posts', query)))
+        shapes.append((f"4chan metrics aggregate ({label} boards)", explain_aggregate(
+            'chan_posts', _metrics_pipeline(query, 'created_at', 'board'))))
+    shapes.append(("daily_rollups find (selected sources)", explain_find(ROLLUP_COLLECTION, {
+        'platform': 'reddit', 'day': {'$gte': start_date, '$lte': end_date}, 'source': {'$in': subreddits}})))
+    shapes.append(("daily_rollups find (all sources)", explain_find(ROLLUP_COLLECTION, {
+        'platform': 'reddit', 'day': {'$gte': start_date, '$lte': end_date}})))
+    shapes.append(("reddit_posts distinct subreddit", explain_distinct('reddit_posts', 'subreddit')))
+    shapes.append(("chan_posts distinct board", explain_distinct('chan_posts', 'board')))
+    return shapes
+
+def _winning_stages(explain):
+    """Yields every stage name found in the winning plans of an explain() result, including sub-pipelines."""
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == 'winningPlan':
+                yield from _plan_stages(value)
+            else:
+                yield from _winning_stages(value)
+    elif isinstance(explain, list):
+        for item in explain:
+            yield from _winning_stages(item)
+
+def _plan_stages(plan):
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+def check_query_plans(db):
+    """
+    Runs explain() on every dashboard query shape and reports the ones that fall back to COLLSCAN.
+
+    Returns:
+        list: Descriptions of the query shapes using a collection scan.
+    """
+    collscans = []
+    for description, explain in _query_shapes(db):
+        stages = set(_winning_stages(explain()))
+        if 'COLLSCAN' in stages:
+            logger.error(f"COLLSCAN: {description} (stages: {sorted(stages)})")
+            collscans.append(description)
+        else:
+            logger.info(f"OK: {description} (stages: {sorted(stages)})")
+    return collscans
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ('build', 'check'):
+        print("Usage: python indexes.py build|check")
+        sys.exit(1)
+
+    db = get_db()
+
+    if sys.argv[1] == 'build':
+        ensure_indexes(db)
+        logger.info("All indexes are in place.")
+    else:
+        collscans = check_query_plans(db)
+        if collscans:
+            logger.error(f"{len(collscans)} query shape(s) fall back to COLLSCAN.")
+            sys.exit(1)
+        logger.info("No query shape falls back to COLLSCAN.")
@@ -0,0 +1,145 @@
+# keyword_matcher.py
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+
+# Logger setup
+logger = logging.getLogger("KeywordMatcher")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Lexicon config: {"category": ["phrase", ...], ...}
+LEXICONS_PATH = os.getenv("KEYWORD_LEXICONS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicons.json"))
+
+# Words, and single punctuation characters, of lowercased text
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def tokenize(text):
+    """Lowercases and splits text into word and punctuation tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over word tokens, matching every phrase of every
+    lexicon category in one pass over a text.
+
+    Matching on tokens gives the word boundaries of the former \\b...\\b regexes
+    ("fired" never matches inside "fireduck"), case-insensitively, and phrases
+    match across any run of whitespace. Within a category, matches do not
+    overlap: at each position the longest phrase ending there counts, unless it
+    overlaps a match already counted.
+    """
+
+    def __init__(self, lexicons):
+        self.categories = list(lexicons)
+        # Identifies the lexicons, e.g. in cache keys of responses computed with them
+        self.fingerprint = hashlib.sha1(json.dumps(lexicons, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]  # state -> [(category index, phrase length in tokens)], longest first
+
+        for index, category in enumerate(self.categories):
+            for phrase in lexicons[category]:
+                tokens = tokenize(phrase)
+                if not tokens:
+                    continue
+                state = 0
+                for token in tokens:
+                    next_state = self.goto[state].get(token)
+                    if next_state is None:
+                        next_state = self.goto[state][token] = len(self.goto)
+                        self.goto.append({})
+                        self.fail.append(0)
+                        self.outputs.append([])
+                    state = next_state
+                if (index, len(tokens)) not in self.outputs[state]:
+                    self.outputs[state].append((index, len(tokens)))
+
+        # Breadth-first failure links; each state also reports the phrases of its failure state
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(token, 0)
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+        for outputs in self.outputs:
+            outputs.sort(key=lambda output: -output[1])
+
+        # Tokens that appear in no phrase send the automaton back to the root
+        self.vocabulary = frozenset(token for transitions in self.goto for token in transitions)
+
+    def count(self, text, counts=None):
+        """
+        Counts the matches of each category in `text`.
+
+        Parameters:
+            text (str): Text to scan.
+            counts (list, optional): Per-category counts to add to (in `categories` order).
+
+        Returns:
+            list: Per-category counts.
+        """
+        if counts is None:
+            counts = [0] * len(self.categories)
+        goto, fail, outputs, vocabulary = self.goto, self.fail, self.outputs, self.vocabulary
+        last_end = [-1] * len(self.categories)
+        state = 0
+        for position, token in enumerate(TOKEN_PATTERN.findall(text.lower())):
+            if token not in vocabulary:
+                state = 0
+                continue
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            for category, length in outputs[state]:
+                if position - length >= last_end[category]:
+                    counts[category] += 1
+                    last_end[category] = position
+        return counts
+
+def load_lexicons(path=LEXICONS_PATH):
+    """Reads a lexicon config file; returns {category: [phrases]}."""
+    with open(path, encoding='utf-8') as f:
+        lexicons = json.load(f)
+    if not isinstance(lexicons, dict) or not all(isinstance(phrases, list) for phrases in lexicons.values()):
+        raise ValueError(f"{path} must map each category to a list of phrases")
+    return lexicons
+
+_file_matchers = {}  # path -> (mtime, matcher)
+_lexicon_matchers = {}  # frozen lexicons -> matcher
+_matchers_lock = threading.Lock()
+
+def get_matcher(lexicons=None, path=LEXICONS_PATH):
+    """
+    Returns a compiled KeywordMatcher, building it only once.
+
+    Without `lexicons`, the config file at `path` is used and recompiled when
+    the file changes. Explicit lexicons are cached by content.
+    """
+    with _matchers_lock:
+        if lexicons is not None:
+            key = tuple((category, tuple(phrases)) for category, phrases in lexicons.items())
+            if key not in _lexicon_matchers:
+                _lexicon_matchers[key] = KeywordMatcher(lexicons)
+            return _lexicon_matchers[key]
+
+        mtime = os.path.getmtime(path)
+        cached = _file_matchers.get(path)
+        if cached is None or cached[0] != mtime:
+            lexicons = load_lexicons(path)
+            cached = _file_matchers[path] = (mtime, KeywordMatcher(lexicons))
+            logger.info(f"Compiled {sum(len(phrases) for phrases in lexicons.values())} phrases "
+                        f"in {len(lexicons)} categories from {path}")
+        return cached[1]
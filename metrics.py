@@ -0,0 +1,159 @@
+# metrics.py
+
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+def coerce_float(value):
+    """
+    Coerces a sentiment or score value to float, defaulting to 0.0 if None or invalid.
+    """
+    if value is None:
+        return 0.0
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+def normalize_toxic(value):
+    """
+    Normalizes the different representations of is_toxic to a bool.
+    """
+    if isinstance(value, str):
+        return value.lower() in ['true', '1', 'yes']
+    if isinstance(value, (int, float)):
+        return bool(value)
+    return False  # Default to False if unknown type
+
+def parse_date(value):
+    """
+    Parses a document date (datetime, Unix timestamp or ISO/'%Y-%m-%d' string).
+
+    Returns:
+        datetime or None: None if the date is missing or invalid.
+    """
+    if not value:
+        logging.warning("Skipping document due to missing date")
+        return None
+    try:
+        if isinstance(value, (int, float)):
+            return datetime.utcfromtimestamp(value)
+        if isinstance(value, str):
+            # Attempt to parse ISO format first
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                return datetime.strptime(value, '%Y-%m-%d')
+        return value
+    except Exception as date_e:
+        logging.warning(f"Invalid date format: {value}. Error: {str(date_e)}")
+        return None
+
+def sentiment_score_product(sentiment, score):
+    """
+    Returns sentiment * score, negated when both are negative so the sign follows the sentiment.
+    """
+    sentiment_score = sentiment * score
+    if sentiment < 0 and score < 0:
+        sentiment_score = -sentiment_score
+    return sentiment_score
+
+class MetricsAccumulator:
+    """
+    Single-pass accumulator for the dashboard metrics.
+
+    Documents are consumed one at a time (e.g. straight from a MongoDB cursor) and
+    folded into running sums per (source, day) and per source, so memory grows with
+    the number of sources and days rather than with the number of documents.
+    """
+
+    def __init__(self, source_field, platform='reddit'):
+        self.source_field = source_field
+        self.platform = platform
+        self.documents = 0
+        # (source, day) -> [sentiment_sum, sentiment_score_sum, count]
+        self.daily = defaultdict(lambda: [0.0, 0.0, 0])
+        # source -> [toxic, non_toxic, score_sum, count]
+        self.totals = defaultdict(lambda: [0, 0, 0.0, 0])
+
+    def add(self, doc):
+        """Folds a single post/comment document into the running sums."""
+        source = doc.get(self.source_field)
+        sentiment = coerce_float(doc.get('sentiment'))
+        score = coerce_float(doc.get('score'))
+        toxic = int(normalize_toxic(doc.get('is_toxic', False)))
+        self.add_totals(source, toxic, 1 - toxic, score)
+
+        date = parse_date(doc.get('created_utc') or doc.get('created_at'))
+        if date is not None:
+            self.add_daily(source, date.date(), sentiment, sentiment_score_product(sentiment, score))
+
+    def add_daily(self, source, day, sentiment_sum, sentiment_score_sum, count=1):
+        """Adds pre-aggregated per-day sums for a source."""
+        bucket = self.daily[(source, day)]
+        bucket[0] += sentiment_sum
+        bucket[1] += sentiment_score_sum
+        bucket[2] += count
+
+    def add_totals(self, source, toxic, non_toxic, score_sum):
+        """Adds pre-aggregated per-source toxicity counts and score sum."""
+        bucket = self.totals[source]
+        bucket[0] += toxic
+        bucket[1] += non_toxic
+        bucket[2] += score_sum
+        bucket[3] += toxic + non_toxic
+        self.documents += toxic + non_toxic
+
+    def consume(self, docs):
+        """Folds every document of an iterable (list or cursor) into the running sums."""
+        for doc in docs:
+            self.add(doc)
+        return self
+
+    def to_response(self, sources):
+        """
+        Builds the /api/*/data response for the selected sources.
+
+        Parameters:
+            sources (list): Selected subreddits or boards, in display order.
+
+        Returns:
+            dict: {'sentiment_trend', 'toxicity_distribution', 'average_scores', 'sentiment_score_trend'}
+        """
+        days_by_source = defaultdict(list)
+        for source, day in self.daily:
+            days_by_source[source].append(day)
+
+        sentiment_trend = {}
+        toxicity_distribution = {}
+        average_scores = {}
+        sentiment_score_trend = {}
+
+        for source in sources:
+            total = self.totals.get(source)
+            if not total or not total[3]:
+                logging.warning(f"No data found for {self.source_field}: {source}")
+                continue
+
+            days = sorted(days_by_source.get(source, []))
+            buckets = [self.daily[(source, day)] for day in days]
+            dates = [day.strftime('%Y-%m-%d') for day in days]
+
+            sentiment_trend[source] = {
+                'dates': dates,
+                'values': [bucket[0] / bucket[2] for bucket in buckets]
+            }
+            toxicity_distribution[source] = {'toxic': total[0], 'non_toxic': total[1]}
+            average_scores[source] = total[2] / total[3]
+            sentiment_score_trend[source] = {
+                'dates': dates,
+                'values': [bucket[1] / bucket[2] for bucket in buckets]
+            }
+
+        logging.debug(f"Calculated {self.platform} metrics for {len(sentiment_trend)} {self.source_field}s from {self.documents} documents")
+        return {
+            'sentiment_trend': sentiment_trend,
+            'toxicity_distribution': toxicity_distribution,
+            'average_scores': average_scores,
+            'sentiment_score_trend': sentiment_score_trend
+        }
@@ -2,10 +2,10 @@ import requests
 import logging
 import os
 import time
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 from dotenv import load_dotenv
-from itertools import cycle
-from threading import Semaphore
+from threading import Lock, Semaphore
 
 # Logger setup
 logger = logging.getLogger("RedditClient")
@@ -22,69 +22,338 @@ load_dotenv()
 MAX_CONCURRENT_REQUESTS = 10  # Adjust this value based on expected load
 semaphore = Semaphore(MAX_CONCURRENT_REQUESTS)
 
-class RedditClient:
-    def __init__(self):
-        # Load multiple Reddit API credentials from .env
-        self.credentials = [
-            {
-                "client_id": os.getenv(f"REDDIT_CLIENT_ID{i}"),
-                "client_secret": os.getenv(f"REDDIT_CLIENT_SECRET{i}"),
-                "username": os.getenv(f"REDDIT_USERNAME{i}"),
-                "password": os.getenv(f"REDDIT_PASSWORD{i}"),
-                "user_agent": f"jobtracker/1.0 (by /u/{os.getenv(f'REDDIT_USERNAME{i}')})",
-                "request_count": 0,
-                "reset_time": time.time() + 60  # Reset request count every minute
+# Tokens are refreshed this many seconds before Reddit expires them
+TOKEN_REFRESH_MARGIN = 300
+
+_session = None
+_session_pid = None
+_session_lock = Lock()
+
+def get_session():
+    """
+    Returns the keep-alive Session shared by every RedditClient of this process.
+
+    A Session inherited through fork is replaced, as its pooled sockets belong to the parent.
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=MAX_CONCURRENT_REQUESTS)
+            _session.mount("https://", adapter)
+            _session_pid = os.getpid()
+        return _session
+
+class TokenCache:
+    """
+    Process-wide OAuth token cache, one entry per credential.
+
+    Every RedditClient of the process reuses the same token until it is within
+    `refresh_margin` seconds of expiring. Only one thread fetches a new token for
+    a given credential; the others wait for it instead of issuing their own grant.
+    """
+
+    def __init__(self, refresh_margin=TOKEN_REFRESH_MARGIN):
+        self.refresh_margin = refresh_margin
+        self.tokens = {}  # credential key -> (access_token, expires_at)
+        self.locks = {}
+        self.lock = Lock()
+
+    @staticmethod
+    def _key(credential):
+        return (credential["client_id"], credential["username"])
+
+    def get(self, credential, fetch):
+        """
+        Returns a valid token for `credential`, calling `fetch(credential)` when none is cached.
+
+        `fetch` returns (access_token, expires_in) or None on failure.
+        """
+        key = self._key(credential)
+        cached = self.tokens.get(key)
+        if cached and time.time() < cached[1]:
+            return cached[0]
+
+        with self.lock:
+            credential_lock = self.locks.setdefault(key, Lock())
+        with credential_lock:
+            # Another thread may have refreshed it while we waited
+            cached = self.tokens.get(key)
+            if cached and time.time() < cached[1]:
+                return cached[0]
+            result = fetch(credential)
+            if result is None:
+                return None
+            access_token, expires_in = result
+            self.tokens[key] = (access_token, time.time() + max(expires_in - self.refresh_margin, 0))
+            return access_token
+
+    def invalidate(self, credential, access_token):
+        """Drops a token the API rejected, unless it was already replaced."""
+        key = self._key(credential)
+        with self.lock:
+            cached = self.tokens.get(key)
+            if cached and cached[0] == access_token:
+                del self.tokens[key]
+
+token_cache = TokenCache()
+
+# Budget assumed for a credential until Reddit's headers say otherwise
+DEFAULT_REQUESTS_PER_WINDOW = 100
+DEFAULT_WINDOW_SECONDS = 60
+
+# Seconds between two per-account utilization log lines of a process
+UTILIZATION_LOG_INTERVAL = int(os.getenv("REDDIT_UTILIZATION_LOG_INTERVAL", 60))
+
+class RateLimitExceeded(Exception):
+    """Raised instead of sleeping when every credential is out of requests until `reset_at`."""
+
+    def __init__(self, reset_at):
+        super().__init__(f"Reddit rate limit exhausted until {time.strftime('%H:%M:%S', time.localtime(reset_at))}")
+        self.reset_at = reset_at
+
+    @property
+    def delay_minutes(self):
+        """Minutes to wait before retrying (fractional, rounded up to the next second)."""
+        return (max(self.reset_at - time.time(), 0) + 1) / 60
+
+class RateLimiter:
+    """
+    Token bucket per credential, shared by every thread of the process.
+
+    Each request takes a token. The bucket is re-synchronized from the
+    X-Ratelimit-Remaining / X-Ratelimit-Reset headers of every response (minus
+    the requests still in flight), so the budget follows what Reddit actually
+    grants instead of a local guess. It refills when the reset time passes.
+    """
+
+    def __init__(self, capacity=DEFAULT_REQUESTS_PER_WINDOW, window=DEFAULT_WINDOW_SECONDS):
+        self.capacity = capacity
+        self.window = window
+        self.buckets = {}  # credential key -> {'tokens', 'reset_at', 'in_flight'}
+        self.lock = Lock()
+
+    def _bucket(self, key):
+        bucket = self.buckets.get(key)
+        if bucket is None or time.time() >= bucket['reset_at']:
+            in_flight = bucket['in_flight'] if bucket else 0
+            bucket = self.buckets[key] = {
+                'tokens': self.capacity,
+                'reset_at': time.time() + self.window,
+                'in_flight': in_flight
             }
-            for i in range(1, 5)
-            if os.getenv(f"REDDIT_CLIENT_ID{i}")
-        ]
+        return bucket
+
+    def try_acquire(self, credential):
+        """Takes a token for `credential`; returns None on success, or the reset time if the bucket is empty."""
+        with self.lock:
+            bucket = self._bucket(TokenCache._key(credential))
+            if bucket['tokens'] < 1:
+                return bucket['reset_at']
+            bucket['tokens'] -= 1
+            bucket['in_flight'] += 1
+            return None
+
+    def try_acquire_best(self, credentials):
+        """
+        Takes a token from whichever of `credentials` has the most budget left.
+
+        Returns:
+            tuple: (credential, None) on success, or (None, earliest reset time) if all are empty.
+        """
+        with self.lock:
+            best, best_bucket = None, None
+            for credential in credentials:
+                bucket = self._bucket(TokenCache._key(credential))
+                if bucket['tokens'] >= 1 and (best_bucket is None or bucket['tokens'] > best_bucket['tokens']):
+                    best, best_bucket = credential, bucket
+            if best is None:
+                return None, min(self._bucket(TokenCache._key(credential))['reset_at'] for credential in credentials)
+            best_bucket['tokens'] -= 1
+            best_bucket['in_flight'] += 1
+            return best, None
+
+    def update(self, credential, headers):
+        """Ends a request and re-synchronizes the bucket from its rate limit headers (if any)."""
+        with self.lock:
+            bucket = self._bucket(TokenCache._key(credential))
+            bucket['in_flight'] = max(bucket['in_flight'] - 1, 0)
+            try:
+                remaining = float(headers['X-Ratelimit-Remaining'])
+                reset = float(headers['X-Ratelimit-Reset'])
+            except (KeyError, TypeError, ValueError):
+                return
+            bucket['tokens'] = max(remaining - bucket['in_flight'], 0)
+            bucket['reset_at'] = time.time() + reset
+
+    def exhaust(self, credential, headers):
+        """Empties the bucket after a 429; returns its reset time."""
+        with self.lock:
+            bucket = self._bucket(TokenCache._key(credential))
+            bucket['in_flight'] = max(bucket['in_flight'] - 1, 0)
+            try:
+                reset = float(headers.get('X-Ratelimit-Reset'))
+            except (TypeError, ValueError):
+                reset = self.window
+            bucket['tokens'] = 0
+            bucket['reset_at'] = time.time() + reset
+            return bucket['reset_at']
+
+rate_limiter = RateLimiter()
+
+class CredentialPool:
+    """
+    Spreads requests over every configured Reddit account.
+
+    Each request goes to the account with the most budget left (see
+    RateLimiter.try_acquire_best), so concurrent workers use all accounts at
+    the same time instead of draining one before moving to the next. Tokens
+    stay in the shared TokenCache, budgets in the shared RateLimiter.
+
+    Also counts, per account, the requests this process sent and the 429s it
+    got, and keeps the account-wide usage Reddit reports in its headers.
+    """
+
+    def __init__(self, limiter=rate_limiter, log_interval=UTILIZATION_LOG_INTERVAL):
+        self.limiter = limiter
+        self.log_interval = log_interval
+        self.accounts = {}  # credential key -> counters and last rate limit headers
+        self.saturated = 0  # requests refused because every account was exhausted
+        self.lock = Lock()
+        self.last_log = time.monotonic()
+
+    def _account(self, credential):
+        key = TokenCache._key(credential)
+        if key not in self.accounts:
+            self.accounts[key] = {
+                'username': credential['username'], 'requests': 0, 'rate_limited': 0,
+                'used': None, 'remaining': None, 'reset_at': None
+            }
+        return self.accounts[key]
+
+    def acquire(self, credentials):
+        """
+        Reserves one request on the account of `credentials` with the most budget left.
+
+        Raises:
+            RateLimitExceeded: Every account is exhausted; carries the earliest reset time.
+        """
+        credential, reset_at = self.limiter.try_acquire_best(credentials)
+        with self.lock:
+            if credential is None:
+                self.saturated += 1
+            else:
+                self._account(credential)['requests'] += 1
+        if credential is None:
+            raise RateLimitExceeded(reset_at)
+        return credential
+
+    def record(self, credential, status_code, headers):
+        """Keeps the account-wide usage of a response's X-Ratelimit-* headers."""
+        with self.lock:
+            account = self._account(credential)
+            if status_code == 429:
+                account['rate_limited'] += 1
+            try:
+                account['used'] = float(headers['X-Ratelimit-Used'])
+                account['remaining'] = float(headers['X-Ratelimit-Remaining'])
+                account['reset_at'] = time.time() + float(headers['X-Ratelimit-Reset'])
+            except (KeyError, TypeError, ValueError):
+                pass
+        if time.monotonic() - self.last_log >= self.log_interval:
+            self.last_log = time.monotonic()
+            self.log_utilization()
+
+    def utilization(self):
+        """
+        Returns per-account usage.
+
+        'utilization' is the share of the account's current window Reddit counts
+        as used (across every process using the account). When every account is
+        close to 1 and 'saturated' keeps growing, more accounts would add
+        throughput; when accounts stay well below 1, they would not.
+
+        Returns:
+            dict: {'accounts': [per-account dict], 'saturated': refused requests}
+        """
+        with self.lock:
+            accounts = []
+            for account in self.accounts.values():
+                used, remaining = account['used'], account['remaining']
+                expired = account['reset_at'] is not None and time.time() >= account['reset_at']
+                accounts.append({
+                    'username': account['username'],
+                    'requests': account['requests'],
+                    'rate_limited': account['rate_limited'],
+                    'used': used,
+                    'remaining': remaining,
+                    'utilization': None if used is None or expired else used / max(used + remaining, 1)
+                })
+            return {'accounts': sorted(accounts, key=lambda a: a['username']), 'saturated': self.saturated}
+
+    def log_utilization(self):
+        report = self.utilization()
+        for account in report['accounts']:
+            share = f"{account['utilization']:.0%}" if account['utilization'] is not None else 'unknown'
+            logger.info(f"Account {account['username']}: {account['requests']} requests from this process, "
+                        f"{account['rate_limited']} rate limited, window {share} used")
+        logger.info(f"Requests refused with every account exhausted: {report['saturated']}")
+
+credential_pool = CredentialPool()
+
+def load_credentials():
+    """Reads the Reddit API credential sets (REDDIT_CLIENT_ID1..4 etc.) from the environment / .env."""
+    return [
+        {
+            "client_id": os.getenv(f"REDDIT_CLIENT_ID{i}"),
+            "client_secret": os.getenv(f"REDDIT_CLIENT_SECRET{i}"),
+            "username": os.getenv(f"REDDIT_USERNAME{i}"),
+            "password": os.getenv(f"REDDIT_PASSWORD{i}"),
+            "user_agent": f"jobtracker/1.0 (by /u/{os.getenv(f'REDDIT_USERNAME{i}')})"
+        }
+        for i in range(1, 5)
+        if os.getenv(f"REDDIT_CLIENT_ID{i}")
+    ]
+
+class RedditClient:
+    def __init__(self, credentials=None):
+        # Load multiple Reddit API credentials from .env, unless the caller pins a subset
+        # (e.g. one credential per backfill worker)
+        self.credentials = load_credentials() if credentials is None else list(credentials)
 
         if not self.credentials:
             logger.error("No Reddit API credentials found in .env file.")
             raise ValueError("API credentials are missing.")
 
-        # Rotate through the credentials to distribute requests
-        self.credentials_cycle = cycle(self.credentials)
-        self.current_credential = next(self.credentials_cycle)
+        self.current_credential = self.credentials[0]
         self.access_token = None
-        self.token_expiry = 0  # Unix timestamp
-
-    def _rotate_credential(self):
-        """Rotate to the next credential if rate limits are exceeded."""
-        self.current_credential = next(self.credentials_cycle)
-        logger.info(f"Switched to credential for {self.current_credential['username']}.")
-
-    def _check_and_reset_request_count(self):
-        """Check if the request count needs to be reset."""
-        for credential in self.credentials:
-            if time.time() > credential["reset_time"]:
-                credential["request_count"] = 0
-                credential["reset_time"] = time.time() + 60
 
-    def get_access_token(self):
-        self._check_and_reset_request_count()
-        if self.access_token and time.time() < self.token_expiry:
-            return self.access_token
+    def _acquire_credential(self):
+        """
+        Takes a request from the credential pool: the credential with the most
+        budget left becomes this request's credential.
 
-        # Rotate credential if the current one has hit the limit
-        if self.current_credential["request_count"] >= 60:
-            logger.warning(f"Rate limit reached for {self.current_credential['username']}. Rotating credentials.")
-            self._rotate_credential()
+        Raises:
+            RateLimitExceeded: Every credential is exhausted; carries the earliest reset time.
+        """
+        self.current_credential = credential_pool.acquire(self.credentials)
 
+    def _request_token(self, credential):
+        """Runs the password grant for a credential; returns (access_token, expires_in) or None."""
         try:
             auth = HTTPBasicAuth(
-                self.current_credential["client_id"], 
-                self.current_credential["client_secret"]
+                credential["client_id"], 
+                credential["client_secret"]
             )
             data = {
                 "grant_type": "password",
-                "username": self.current_credential["username"],
-                "password": self.current_credential["password"],
+                "username": credential["username"],
+                "password": credential["password"],
                 "scope": "read"
             }
-            headers = {"User-Agent": self.current_credential["user_agent"]}
+            headers = {"User-Agent": credential["user_agent"]}
 
-            response = requests.post(
+            response = get_session().post(
                 "https://www.reddit.com/api/v1/access_token",
                 auth=auth,
                 data=data,
@@ -94,30 +363,48 @@ class RedditClient:
 
             response.raise_for_status()
             token_data = response.json()
-            self.access_token = token_data["access_token"]
-            self.token_expiry = time.time() + token_data.get("expires_in", 3600) - 60
-            logger.info(f"Successfully retrieved access token for {self.current_credential['username']}")
-            return self.access_token
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to get access token for {self.current_credential['username']}: {e}")
+            logger.info(f"Successfully retrieved access token for {credential['username']}")
+            return token_data["access_token"], token_data.get("expires_in", 3600)
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            logger.error(f"Failed to get access token for {credential['username']}: {e}")
             return None
 
+    def get_access_token(self):
+        """Reserves one request on a credential with budget left and returns that credential's token."""
+        self._acquire_credential()
+        self.access_token = token_cache.get(self.current_credential, self._request_token)
+        if self.access_token is None:
+            rate_limiter.update(self.current_credential, {})
+        return self.access_token
+
     def _make_request(self, url, headers, params):
-        """Handle the actual request, with concurrency and backoff."""
-        with semaphore:
-            try:
-                response = requests.get(url, headers=headers, params=params, timeout=10)
-                response.raise_for_status()
-                self.current_credential["request_count"] += 1
-                return response
-            except requests.exceptions.RequestException as e:
-                if response.status_code == 429:  # Rate limit hit
-                    logger.warning(f"Rate limit encountered. Backing off for 1 minute.")
-                    time.sleep(60)  # Back off
-                    self._rotate_credential()
-                else:
-                    logger.error(f"Request failed: {e}")
-                return None
+        """
+        Handle the actual request, with concurrency limiting.
+
+        The semaphore is only held for the HTTP call itself; running out of budget
+        raises RateLimitExceeded so the caller can reschedule the job.
+        """
+        credential = self.current_credential
+        response = None
+        try:
+            with semaphore:
+                response = get_session().get(url, headers=headers, params=params, timeout=10)
+            credential_pool.record(credential, response.status_code, response.headers)
+            if response.status_code == 429:  # Rate limit hit
+                reset_at = rate_limiter.exhaust(credential, response.headers)
+                logger.warning(f"Rate limit encountered for {credential['username']}.")
+                raise RateLimitExceeded(reset_at)
+            rate_limiter.update(credential, response.headers)
+            response.raise_for_status()
+            return response
+        except requests.exceptions.RequestException as e:
+            if response is None:
+                rate_limiter.update(credential, {})
+            elif response.status_code == 401:
+                # Token revoked or expired early; the next call fetches a new one
+                token_cache.invalidate(credential, self.access_token)
+            logger.error(f"Request failed: {e}")
+            return None
 
     def fetch_new_posts(self, subreddit, after=None):
         token = self.get_access_token()
@@ -142,11 +429,14 @@ class RedditClient:
                 return data
             else:
                 return None
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Failed to fetch data from {subreddit}: {e}")
             return None
 
-    def fetch_posts_by_date(self, subreddit, after, before, limit=100):
+    def fetch_posts_by_date(self, subreddit, after, before, limit=100, page=None):
+        """Searches a subreddit for posts created between the `after` and `before` timestamps; `page` is the listing's 'after' cursor."""
         token = self.get_access_token()
         if not token:
             logger.error("Access token is not available.")
@@ -161,6 +451,8 @@ class RedditClient:
                 "syntax": "cloudsearch",
                 "limit": limit
             }
+            if page:
+                params["after"] = page
             headers = {
                 "Authorization": f"Bearer {token}",
                 "User-Agent": self.current_credential["user_agent"]
@@ -170,6 +462,8 @@ class RedditClient:
                 return response.json()
             else:
                 return None
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Failed to fetch posts by date from {subreddit}: {e}")
             return None
@@ -1,21 +1,18 @@
 # reddit_crawler.py
 
 import logging
-import os
-import time
-from pyfaktory import Client, Consumer, Job, Producer
-from reddit_client import RedditClient
+from pyfaktory import Client, Consumer, Job
+from faktory_producer import get_producer
+from reddit_client import RateLimitExceeded, RedditClient
 from datetime import datetime, timedelta
-from pymongo import MongoClient
-import requests
-import nltk
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-
-# Ensure NLTK data is downloaded
-nltk.download('vader_lexicon')
-
-# Initialize Sentiment Analyzer
-sia = SentimentIntensityAnalyzer()
+from db import LazyCollection
+from crawl_cadence import next_interval, record_new_items
+from crawl_leases import claim_job, hand_off, watch_expired_chains
+from comment_scheduler import due_comment_crawls
+from rollups import ROLLUP_COLLECTION, bulk_upsert_with_rollup
+from response_cache import SOURCE_VERSIONS_COLLECTION, record_source_write
+from toxicity_client import classify_texts
+from sentiment import score_texts
 
 # Logger setup
 logger = logging.getLogger("RedditCrawler")
@@ -25,58 +22,24 @@ formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(messag
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-# MongoDB setup
-mongo_client = MongoClient('mongodb://localhost:27017/')
-db = mongo_client['new_crawler_db']
-reddit_collection = db['reddit_posts']
-comments_collection = db['reddit_comments']
-
-# Ensure proper indexing on post_id to avoid duplicates
-reddit_collection.create_index([("post_id", 1)], unique=True)
-comments_collection.create_index([("comment_id", 1)], unique=True)
-
-# Toxicity Check Function
-def hs_check_comment(comment):
-    CONF_THRESHOLD = 0.9
-    api_token = os.getenv("MODERATEHATESPEECH_TOKEN")
-    if not api_token:
-        logger.error("ModerateHatespeech API token not set.")
-        return False
-
-    data = {
-        "token": api_token,
-        "text": comment
-    }
-
-    try:
-        response = requests.post("https://api.moderatehatespeech.com/api/v1/moderate/", json=data, timeout=10)
-        response.raise_for_status()
-        result = response.json()
-        if result.get("class") == "flag" and float(result.get("confidence", 0)) > CONF_THRESHOLD:
-            return True
-    except requests.exceptions.RequestException as e:
-        logger.error(f"ModerateHatespeech API error: {e}")
-
-    return False
-
-# Sentiment Analysis Function
-def compute_sentiment(text):
-    """
-    Compute the compound sentiment score for a given text.
-    Returns a float between -1 (most negative) and +1 (most positive).
-    """
-    if not text or not isinstance(text, str):
-        return None
-    sentiment = sia.polarity_scores(text)
-    return sentiment['compound']
+# MongoDB collections, connected on first use. Unique keys (to avoid duplicates)
+# and the dashboard query indexes are ensured before the first write.
+reddit_collection = LazyCollection('reddit_posts', indexed=True)
+comments_collection = LazyCollection('reddit_comments', indexed=True)
+rollups_collection = LazyCollection(ROLLUP_COLLECTION, indexed=True)
+source_versions_collection = LazyCollection(SOURCE_VERSIONS_COLLECTION, indexed=True)
 
 def store_data_reddit(data, subreddit):
     posts = data['data']['children']
-    for post in posts:
-        content = post['data'].get('selftext', '')
-        sentiment_score = compute_sentiment(content) if content else None  # Compute sentiment
 
-        post_data = {
+    # Compute sentiment and perform Toxicity Check on the whole page at once
+    contents = [post['data'].get('selftext', '') for post in posts]
+    sentiment_scores = score_texts(contents)
+    toxic_flags = classify_texts(contents)
+
+    post_docs = []
+    for post, content, sentiment_score, is_toxic in zip(posts, contents, sentiment_scores, toxic_flags):
+        post_docs.append({
             'subreddit': subreddit,
             'post_id': post['data']['id'],
             'title': post['data'].get('title', ''),
@@ -86,34 +49,32 @@ def store_data_reddit(data, subreddit):
             'comments_count': post['data'].get('num_comments', 0),
             'score': post['data'].get('score', 0),
             'url': post['data'].get('url', ''),
-            'is_toxic': False,  # Default value
+            'is_toxic': is_toxic,
             'sentiment': sentiment_score  # Add sentiment score
-        }
-        
-        # Perform Toxicity Check on Content
-        if content:
-            is_toxic = hs_check_comment(content)
-            post_data['is_toxic'] = is_toxic
-        
-        try:
-            logger.info(f"Storing post ID: {post_data['post_id']}")
-            reddit_collection.update_one(
-                {'post_id': post_data['post_id']},
-                {'$set': post_data},
-                upsert=True
-            )
-        except Exception as e:
-            logger.error(f"Error storing post {post_data['post_id']} in MongoDB: {e}")
-    
-        # Enqueue job to fetch comments for this post
-        enqueue_crawl_reddit_comments(subreddit, post_data['post_id'])
+        })
 
-def store_comments_reddit(comments, subreddit, post_id):
-    for comment in comments:
-        body = comment.get('body', '')
-        sentiment_score = compute_sentiment(body) if body else None  # Compute sentiment
+    # Write the whole page in one unordered bulk write
+    inserted, failed = bulk_upsert_with_rollup(reddit_collection, 'post_id', post_docs, 'reddit', rollups_collection)
+    logger.info(f"Stored {len(post_docs) - len(failed)} posts from r/{subreddit} ({inserted} new, {len(failed)} failed)")
+    record_new_items('reddit', subreddit, inserted)
+
+    # Enqueue comment jobs only for posts that are new, hot, or gained comments
+    for post_id in due_comment_crawls(post_docs):
+        enqueue_crawl_reddit_comments(subreddit, post_id)
+
+    if posts:
+        record_source_write(source_versions_collection, 'reddit', subreddit)
+    return inserted
 
-        comment_data = {
+def store_comments_reddit(comments, subreddit, post_id):
+    # Compute sentiment and perform Toxicity Check on all comments at once
+    bodies = [comment.get('body', '') for comment in comments]
+    sentiment_scores = score_texts(bodies)
+    toxic_flags = classify_texts(bodies)
+
+    comment_docs = []
+    for comment, body, sentiment_score, is_toxic in zip(comments, bodies, sentiment_scores, toxic_flags):
+        comment_docs.append({
             'subreddit': subreddit,
             'post_id': post_id,
             'comment_id': comment['id'],
@@ -121,33 +82,28 @@ def store_comments_reddit(comments, subreddit, post_id):
             'created_utc': datetime.utcfromtimestamp(comment.get('created_utc', 0)),
             'body': body,
             'score': comment.get('score', 0),
-            'is_toxic': False,  # Default value
+            'is_toxic': is_toxic,
             'sentiment': sentiment_score  # Add sentiment score
-        }
-        
-        # Perform Toxicity Check on Comment
-        if body:
-            is_toxic = hs_check_comment(body)
-            comment_data['is_toxic'] = is_toxic
-        
-        try:
-            logger.info(f"Storing comment ID: {comment_data['comment_id']} for post {post_id} in r/{subreddit}")
-            comments_collection.update_one(
-                {'comment_id': comment_data['comment_id']},
-                {'$set': comment_data},
-                upsert=True
-            )
-        except Exception as e:
-            logger.error(f"Error storing comment {comment_data['comment_id']} in MongoDB: {e}")
+        })
+
+    inserted, failed = bulk_upsert_with_rollup(comments_collection, 'comment_id', comment_docs, 'reddit', rollups_collection)
+    logger.info(f"Stored {len(comment_docs) - len(failed)} comments for post {post_id} in r/{subreddit} ({inserted} new, {len(failed)} failed)")
+
+    if comments:
+        record_source_write(source_versions_collection, 'reddit', subreddit)
 
 def crawl_subreddit(subreddit, after=None):
+    """
+    Fetch and store one page of a subreddit's new posts.
+    Returns the listing and the number of posts stored for the first time ((None, 0) on failure).
+    """
     reddit_client = RedditClient()
     data = reddit_client.fetch_new_posts(subreddit, after)
     if data is None:
         logger.error(f"Failed to fetch data for subreddit: {subreddit}")
-        return None
-    store_data_reddit(data, subreddit)
-    return data
+        return None, 0
+    inserted = store_data_reddit(data, subreddit)
+    return data, inserted
 
 def crawl_reddit_comments(subreddit, post_id, limit=10):
     reddit_client = RedditClient()
@@ -157,29 +113,54 @@ def crawl_reddit_comments(subreddit, post_id, limit=10):
         return
     store_comments_reddit(comments, subreddit, post_id)
 
+def continue_chain(subreddit, chain, after=None, delay_minutes=None):
+    """Schedules the single successor of a crawl-subreddit job, if the job still holds the subreddit's lease."""
+    next_chain = hand_off('reddit', subreddit, chain, delay_minutes)
+    if next_chain:
+        schedule_crawl_subreddit(subreddit, after=after, delay_minutes=delay_minutes, chain=next_chain)
+
 def handle_crawl_subreddit(*args):
     """
     Handler function for Faktory worker.
-    Expects args: [subreddit, after]
+    Expects args: [subreddit, after, chain]
+    (jobs queued before crawl chains had a lease carry no chain token, and start one if the subreddit has none)
+
+    Each subreddit has one chain of jobs: a job schedules either the next page
+    or, once it reaches posts that are already stored, the next poll from the top.
     """
     if not args:
         logger.error("No arguments provided for crawl-subreddit job.")
         return
     subreddit = args[0]
     after = args[1] if len(args) > 1 else None
+    chain = claim_job('reddit', subreddit, 'crawl-subreddit', args[2] if len(args) > 2 else None)
+    if chain is None:
+        logger.info(f"Dropping duplicate crawl-subreddit job for r/{subreddit}, after: {after}")
+        return
     logger.info(f"Starting crawl for subreddit: {subreddit}, after: {after}")
-    data = crawl_subreddit(subreddit, after)
+    try:
+        data, inserted = crawl_subreddit(subreddit, after)
+    except RateLimitExceeded as e:
+        # Out of API budget: retry this page once the limit resets instead of holding the worker
+        logger.warning(f"{e}; rescheduling r/{subreddit} (after: {after}) in {e.delay_minutes:.1f} minutes")
+        continue_chain(subreddit, chain, after=after, delay_minutes=e.delay_minutes)
+        get_producer().flush()
+        return
 
     if data is None:
         # Schedule retry after 5 minutes
-        schedule_crawl_subreddit(subreddit, after=after, delay_minutes=5)
+        continue_chain(subreddit, chain, after=after, delay_minutes=5)
     else:
         next_after = data['data']['after']
-        if next_after:
-            # Schedule job to fetch next page immediately
-            schedule_crawl_subreddit(subreddit, after=next_after)
-        # Schedule next crawl after delay
-        schedule_crawl_subreddit(subreddit, after=None, delay_minutes=5)
+        if next_after and inserted:
+            # Page still had new posts: fetch the next page immediately
+            continue_chain(subreddit, chain, after=next_after)
+        else:
+            # Caught up: poll from the top again after the subreddit's adaptive interval
+            continue_chain(subreddit, chain, after=None, delay_minutes=next_interval('reddit', subreddit))
+
+    # Send the comment and follow-up jobs before the job is acknowledged
+    get_producer().flush()
 
 def handle_crawl_reddit_comments(*args):
     """
@@ -191,52 +172,51 @@ def handle_crawl_reddit_comments(*args):
         return
     subreddit, post_id = args[0], args[1]
     logger.info(f"Starting crawl for comments of post {post_id} in r/{subreddit}")
-    crawl_reddit_comments(subreddit, post_id)
+    try:
+        crawl_reddit_comments(subreddit, post_id)
+    except RateLimitExceeded as e:
+        logger.warning(f"{e}; rescheduling comments of post {post_id} in {e.delay_minutes:.1f} minutes")
+        schedule_crawl_reddit_comments(subreddit, post_id, delay_minutes=e.delay_minutes)
+        get_producer().flush()
 
 def enqueue_crawl_reddit_comments(subreddit, post_id):
     logger.info(f"Enqueuing crawl-reddit-comments job for post {post_id} in r/{subreddit}")
-    with Client(faktory_url="tcp://:password@localhost:7419", role="producer") as client:
-        producer = Producer(client=client)
-        job = Job(
-            jobtype="crawl-reddit-comments",
-            args=[subreddit, post_id],
-            queue="crawl-reddit-comments",
-            retry=3,
-            backtrace=True
-        )
-        producer.push(job)
-
-def schedule_crawl_subreddit(subreddit, after=None, delay_minutes=None):
+    job = Job(
+        jobtype="crawl-reddit-comments",
+        args=[subreddit, post_id],
+        queue="crawl-reddit-comments",
+        retry=3,
+        backtrace=True
+    )
+    get_producer().push(job)
+
+def schedule_crawl_subreddit(subreddit, after=None, delay_minutes=None, chain=None):
     logger.info(f"Scheduling Reddit crawl job for r/{subreddit}, after: {after}")
-    with Client(faktory_url="tcp://:password@localhost:7419", role="producer") as client:
-        producer = Producer(client=client)
-        job = Job(
-            jobtype="crawl-subreddit",
-            args=[subreddit, after],
-            queue="crawl-subreddit",
-            retry=3,
-            backtrace=True
-        )
-        if delay_minutes:
-            run_at = datetime.utcnow() + timedelta(minutes=delay_minutes)
-            job.at = run_at.isoformat() + "Z"
-        producer.push(job)
+    job = Job(
+        jobtype="crawl-subreddit",
+        args=[subreddit, after, chain],
+        queue="crawl-subreddit",
+        retry=3,
+        backtrace=True
+    )
+    if delay_minutes:
+        run_at = datetime.utcnow() + timedelta(minutes=delay_minutes)
+        job.at = run_at.isoformat() + "Z"
+    get_producer().push(job)
 
 def schedule_crawl_reddit_comments(subreddit, post_id, delay_minutes=None):
     logger.info(f"Scheduling Reddit comments crawl job for post {post_id} in r/{subreddit}")
-    with Client(faktory_url="tcp://:password@localhost:7419", role="producer") as client:
-        producer = Producer(client=client)
-        job = Job(
-            jobtype="crawl-reddit-comments",
-            args=[subreddit, post_id],
-            queue="crawl-reddit-comments",
-            retry=3,
-            backtrace=True
-        )
-        if delay_minutes:
-            run_at = datetime.utcnow() + timedelta(minutes=delay_minutes)
-            job.at = run_at.isoformat() + "Z"
-        producer.push(job)
+    job = Job(
+        jobtype="crawl-reddit-comments",
+        args=[subreddit, post_id],
+        queue="crawl-reddit-comments",
+        retry=3,
+        backtrace=True
+    )
+    if delay_minutes:
+        run_at = datetime.utcnow() + timedelta(minutes=delay_minutes)
+        job.at = run_at.isoformat() + "Z"
+    get_producer().push(job)
 
 def start_consumer():
     with Client(faktory_url="tcp://:password@localhost:7419", role="consumer") as client:
@@ -245,6 +225,8 @@ def start_consumer():
             queues=["crawl-subreddit", "crawl-reddit-comments"],
             concurrency=10  # Increased concurrency for faster processing
         )
+        # Restart subreddit chains whose job was given up on
+        watch_expired_chains("crawl-subreddit", schedule_crawl_subreddit)
         consumer.register("crawl-subreddit", handle_crawl_subreddit)
         consumer.register("crawl-reddit-comments", handle_crawl_reddit_comments)
         consumer.run()
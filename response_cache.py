@@ -0,0 +1,171 @@
+# response_cache.py
+
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+SOURCE_VERSIONS_COLLECTION = 'source_versions'
+
+def record_source_write(versions, platform, source):
+    """
+    Bumps the write version of a source so cached responses covering it are invalidated.
+
+    Called by the crawlers and the backfill once per stored page/thread/comment batch.
+
+    Parameters:
+        versions (Collection): The source_versions collection.
+        platform (str): 'reddit' or '4chan'.
+        source (str): Subreddit or board.
+    """
+    versions.update_one(
+        {'platform': platform, 'source': source},
+        {'$inc': {'version': 1}, '$set': {'updated_at': datetime.utcnow()}},
+        upsert=True
+    )
+
+class ResponseCache:
+    """
+    Bounded LRU cache for API responses, shared by the Flask request threads.
+
+    Every entry remembers the write version of every source it covers and is
+    dropped as soon as a crawler or the backfill records a new write for one of
+    those sources (see record_source_write). Entries whose date range ends before
+    today only change through a backfill and live for `historical_ttl`; entries
+    touching the current day live for `live_ttl`.
+    """
+
+    def __init__(self, versions, max_bytes=64 * 1024 * 1024,
+                 historical_ttl=timedelta(hours=24), live_ttl=timedelta(minutes=10)):
+        self.versions = versions
+        self.max_bytes = max_bytes
+        self.historical_ttl = historical_ttl
+        self.live_ttl = live_ttl
+        self.entries = OrderedDict()  # key -> (value, size, expires_at, source_versions)
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(endpoint, start_date, end_date, selections):
+        """
+        Normalizes a request to a cache key.
+
+        Parameters:
+            endpoint (str): Endpoint (and metrics mode) being cached.
+            start_date (datetime): Start of the date range.
+            end_date (datetime): End of the date range.
+            selections (dict): {platform: [sources]}.
+        """
+        sources = tuple(sorted(
+            (platform, tuple(sorted(set(sources))))
+            for platform, sources in selections.items() if sources
+        ))
+        return (endpoint, start_date.isoformat(), end_date.isoformat(), sources)
+
+    def _current_versions(self, selections):
+        """Reads the current write version of every source covered by `selections`."""
+        current = {}
+        for platform, sources in selections.items():
+            if not sources:
+                continue
+            query = {'platform': platform}
+            if "all" not in sources:
+                query['source'] = {'$in': list(sources)}
+            for row in self.versions.find(query, {'_id': 0, 'source': 1, 'version': 1}):
+                current[(platform, row['source'])] = row.get('version', 0)
+        return current
+
+    def get(self, key, selections):
+        """Returns the cached value for `key`, or None on a miss."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at, source_versions = entry
+
+        if datetime.utcnow() >= expires_at or self._current_versions(selections) != source_versions:
+            with self.lock:
+                if self.entries.get(key) is entry:
+                    del self.entries[key]
+                    self.size -= size
+                    self.invalidations += 1
+                self.misses += 1
+            logging.debug(f"Invalidated cached response for {key}")
+            return None
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+            self.hits += 1
+        return value
+
+    def is_live(self, end_date):
+        """Returns True if a range ending at `end_date` touches the current day."""
+        return end_date.date() >= datetime.utcnow().date()
+
+    def set(self, key, value, end_date, source_versions):
+        """
+        Caches `value`, evicting least recently used entries beyond `max_bytes`.
+
+        `source_versions` must be read before `value` was computed, so a write
+        landing during the computation still invalidates the entry.
+        """
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+
+        expires_at = datetime.utcnow() + (self.live_ttl if self.is_live(end_date) else self.historical_ttl)
+
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self.entries[key] = (value, size, expires_at, source_versions)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted[1]
+                self.evictions += 1
+
+    def get_or_compute(self, endpoint, start_date, end_date, selections, compute):
+        """
+        Returns the cached response for a request, computing and caching it on a miss.
+
+        Parameters:
+            endpoint (str): Endpoint (and metrics mode) being cached.
+            start_date (datetime): Start of the date range.
+            end_date (datetime): End of the date range.
+            selections (dict): {platform: [sources]}.
+            compute (callable): Builds the response; falsy results are not cached.
+        """
+        key = self.make_key(endpoint, start_date, end_date, selections)
+        value = self.get(key, selections)
+        if value is not None:
+            return value
+
+        source_versions = self._current_versions(selections)
+        value = compute()
+        if value:
+            self.set(key, value, end_date, source_versions)
+        return value
+
+    def stats(self):
+        """Returns hit/miss counters and current size, for sizing the cache."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes
+            }
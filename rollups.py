@@ -0,0 +1,328 @@
+# rollups.py
+
+import logging
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from db import get_db
+from metrics import coerce_float, normalize_toxic, parse_date, sentiment_score_product
+
+# Logger setup
+logger = logging.getLogger("Rollups")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+ROLLUP_COLLECTION = 'daily_rollups'
+
+# Documents per bulk_write round trip in bulk_upsert_with_rollup
+BULK_BATCH_SIZE = int(os.getenv("MONGO_BULK_BATCH_SIZE", 500))
+
+# platform -> (raw collections, source field)
+PLATFORMS = {
+    'reddit': (['reddit_posts', 'reddit_comments'], 'subreddit'),
+    '4chan': (['chan_posts'], 'board'),
+}
+
+# Fields of a raw document that contribute to its rollup bucket
+ROLLUP_SOURCE_PROJECTION = {
+    '_id': 0, 'subreddit': 1, 'board': 1, 'created_utc': 1, 'created_at': 1,
+    'sentiment': 1, 'score': 1, 'is_toxic': 1
+}
+
+def rollup_contribution(doc, source_field):
+    """
+    Returns the rollup bucket key and the values a raw document adds to it.
+
+    Uses the same coercions as the dashboard metrics, so summing contributions
+    gives exactly what the calculate_* functions compute from raw documents.
+
+    Returns:
+        tuple or None: ((source, day), {field: value}), or None if the document has no valid date.
+    """
+    date = parse_date(doc.get('created_utc') or doc.get('created_at'))
+    if date is None:
+        return None
+    sentiment = coerce_float(doc.get('sentiment'))
+    score = coerce_float(doc.get('score'))
+    toxic = normalize_toxic(doc.get('is_toxic', False))
+    day = datetime(date.year, date.month, date.day)
+    return (doc.get(source_field), day), {
+        'sentiment_sum': sentiment,
+        'count': 1,
+        'sentiment_score_sum': sentiment_score_product(sentiment, score),
+        'score_sum': score,
+        'toxic': int(toxic),
+        'non_toxic': int(not toxic),
+    }
+
+def rollup_delta(old_doc, new_doc, source_field):
+    """
+    Computes the increments that turn old_doc's rollup contribution into new_doc's.
+
+    Either document may be None (insert or delete).
+
+    Returns:
+        dict: {(source, day): {field: delta}} with zero deltas dropped.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for doc, sign in ((old_doc, -1), (new_doc, 1)):
+        contribution = rollup_contribution(doc, source_field) if doc else None
+        if contribution is None:
+            continue
+        key, values = contribution
+        for field, value in values.items():
+            deltas[key][field] += sign * value
+
+    return {
+        key: {field: value for field, value in values.items() if value}
+        for key, values in deltas.items()
+        if any(values.values())
+    }
+
+def rollup_update_ops(platform, deltas):
+    """Builds the '$inc' upserts applying rollup deltas for one platform."""
+    return [
+        UpdateOne(
+            {'platform': platform, 'source': source, 'day': day},
+            {'$inc': values},
+            upsert=True
+        )
+        for (source, day), values in deltas.items()
+    ]
+
+def upsert_with_rollup(collection, key_field, doc, platform, rollups):
+    """
+    Upserts a raw document and adjusts its daily rollup by the change it caused.
+
+    The previous version of the document is returned atomically by the upsert,
+    so re-storing an unchanged post is a no-op for the rollup and a changed
+    sentiment/score/toxicity only moves the bucket by the difference.
+
+    Parameters:
+        collection (Collection): Raw collection (reddit_posts, reddit_comments, chan_posts).
+        key_field (str): Unique key of the raw collection ('post_id', 'comment_id', 'post_no').
+        doc (dict): Document to '$set'.
+        platform (str): 'reddit' or '4chan'.
+        rollups (Collection): The daily_rollups collection.
+    """
+    source_field = PLATFORMS[platform][1]
+    old_doc = collection.find_one_and_update(
+        {key_field: doc[key_field]},
+        {'$set': doc},
+        projection=ROLLUP_SOURCE_PROJECTION,
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
+    new_doc = {**old_doc, **doc} if old_doc else doc
+    ops = rollup_update_ops(platform, rollup_delta(old_doc, new_doc, source_field))
+    if ops:
+        rollups.bulk_write(ops, ordered=False)
+
+def _rollup_guard(old_doc):
+    """Filter conditions matching a document only while its rollup fields still hold old_doc's values."""
+    return {field: old_doc.get(field) for field in ROLLUP_SOURCE_PROJECTION if field != '_id'}
+
+def bulk_upsert_with_rollup(collection, key_field, docs, platform, rollups, batch_size=None):
+    """
+    Upserts a page/thread/comment batch with unordered bulk writes and adjusts the daily rollups.
+
+    The previous versions are read with one find() per chunk of `batch_size`
+    documents, and every delta is computed from the exact version its write replaced:
+    - new documents are inserted (InsertOne), which fails if another worker
+      inserted the same key in the meantime;
+    - documents whose rollup fields are unchanged are updated only while those
+      fields still hold the values read (UpdateOne with an equality guard);
+    - documents whose rollup fields changed go through find_one_and_update, as
+      in upsert_with_rollup, so their delta uses the exact previous version.
+    Inserts that lose a race, and guarded updates when any of them matched
+    nothing, are redone through find_one_and_update. Re-applying a '$set' that
+    already went through is harmless: its delta is then zero.
+
+    A document that fails to write is reported and left out of the rollups; the
+    rest of the batch is still written. If the rollup write itself fails, the
+    documents whose deltas it carried are already stored: their keys are reported
+    as failed too, and their buckets stay behind until 'rollups.py rebuild'.
+
+    Parameters:
+        collection (Collection): Raw collection (reddit_posts, reddit_comments, chan_posts).
+        key_field (str): Unique key of the raw collection ('post_id', 'comment_id', 'post_no').
+        docs (list): Documents to '$set'.
+        platform (str): 'reddit' or '4chan'.
+        rollups (Collection): The daily_rollups collection.
+        batch_size (int, optional): Documents per bulk_write. Defaults to MONGO_BULK_BATCH_SIZE.
+
+    Returns:
+        tuple: (number of newly inserted documents, list of keys that failed to write)
+    """
+    source_field = PLATFORMS[platform][1]
+    batch_size = batch_size or BULK_BATCH_SIZE
+    # A document repeated within the batch would have its delta counted twice; keep the last one
+    docs = list({doc[key_field]: doc for doc in docs}.values())
+    inserted = 0
+    failed = []
+
+    for start in range(0, len(docs), batch_size):
+        batch = docs[start:start + batch_size]
+        keys = [doc[key_field] for doc in batch]
+        try:
+            old_docs = {
+                old[key_field]: old
+                for old in collection.find({key_field: {'$in': keys}}, {**ROLLUP_SOURCE_PROJECTION, key_field: 1})
+            }
+        except Exception as e:
+            logger.error(f"Error reading {len(batch)} documents from {collection.name}: {e}")
+            failed.extend(keys)
+            continue
+
+        deltas = defaultdict(lambda: defaultdict(int))
+        contributors = defaultdict(list)
+
+        def add_delta(old_doc, doc):
+            new_doc = {**old_doc, **doc} if old_doc else doc
+            for key, values in rollup_delta(old_doc, new_doc, source_field).items():
+                contributors[key].append(doc[key_field])
+                for field, value in values.items():
+                    deltas[key][field] += value
+
+        # New documents and unchanged rollup fields in one bulk write; changed ones one by one
+        bulk_docs, changed_docs = [], []
+        for doc in batch:
+            old_doc = old_docs.get(doc[key_field])
+            if old_doc is not None and rollup_delta(old_doc, {**old_doc, **doc}, source_field):
+                changed_docs.append(doc)
+            else:
+                bulk_docs.append(doc)
+
+        ops = [
+            InsertOne(dict(doc)) if doc[key_field] not in old_docs
+            else UpdateOne({key_field: doc[key_field], **_rollup_guard(old_docs[doc[key_field]])}, {'$set': doc})
+            for doc in bulk_docs
+        ]
+        matched = 0
+        errors = {}
+        if ops:
+            try:
+                matched = collection.bulk_write(ops, ordered=False).matched_count
+            except BulkWriteError as e:
+                matched = e.details.get('nMatched', 0)
+                errors = {error['index']: error for error in e.details.get('writeErrors', [])}
+            except Exception as e:
+                logger.error(f"Error storing {len(bulk_docs)} documents in {collection.name}: {e}")
+                failed.extend(doc[key_field] for doc in bulk_docs)
+                bulk_docs = []
+
+        retry_docs = []
+        guarded_docs = []
+        for index, doc in enumerate(bulk_docs):
+            error = errors.get(index)
+            is_new = doc[key_field] not in old_docs
+            if error is None and is_new:
+                inserted += 1
+                add_delta(None, doc)
+            elif error is None:
+                guarded_docs.append(doc)  # unchanged rollup fields: no delta
+            elif is_new and error.get('code') == 11000:
+                retry_docs.append(doc)  # inserted by another worker since the find()
+            else:
+                logger.error(f"Error storing {key_field} {doc[key_field]} in {collection.name}: {error.get('errmsg')}")
+                failed.append(doc[key_field])
+        if matched < len(guarded_docs):
+            # Some guarded documents changed since the find(); redo them all to learn their previous versions
+            retry_docs.extend(guarded_docs)
+
+        for doc in changed_docs + retry_docs:
+            try:
+                old_doc = collection.find_one_and_update(
+                    {key_field: doc[key_field]},
+                    {'$set': doc},
+                    projection=ROLLUP_SOURCE_PROJECTION,
+                    upsert=True,
+                    return_document=ReturnDocument.BEFORE
+                )
+            except Exception as e:
+                logger.error(f"Error storing {key_field} {doc[key_field]} in {collection.name}: {e}")
+                failed.append(doc[key_field])
+                continue
+            if old_doc is None:
+                inserted += 1
+            add_delta(old_doc, doc)
+
+        bucket_deltas = {
+            key: {field: value for field, value in values.items() if value}
+            for key, values in deltas.items() if any(values.values())
+        }
+        buckets = list(bucket_deltas)
+        lost = []
+        if buckets:
+            try:
+                rollups.bulk_write(rollup_update_ops(platform, bucket_deltas), ordered=False)
+            except BulkWriteError as e:
+                lost = [buckets[error['index']] for error in e.details.get('writeErrors', [])]
+            except Exception as e:
+                logger.error(f"Error updating {platform} rollups: {e}")
+                lost = buckets
+        if lost:
+            # The documents are stored, so re-storing them will not bring these deltas back
+            lost_keys = list(dict.fromkeys(key for bucket in lost for key in contributors[bucket]))
+            logger.error(f"{len(lost)} {platform} rollup buckets missed the changes of {len(lost_keys)} documents; "
+                         f"run 'python rollups.py rebuild' to repair them")
+            failed.extend(key for key in lost_keys if key not in failed)
+
+    return inserted, failed
+
+def rebuild_rollups(db, platforms=None):
+    """
+    Regenerates daily_rollups from the raw collections.
+
+    Every rebuilt bucket is overwritten in place with '$set' upserts, then the
+    buckets with no documents left are deleted, so the dashboard never reads
+    an empty or half-built collection. Crawlers should be paused while this
+    runs, otherwise writes made during the rebuild may be counted twice or
+    not at all.
+
+    Parameters:
+        db (Database): Crawler database.
+        platforms (list, optional): Platforms to rebuild. Defaults to all.
+    """
+    rollups = db[ROLLUP_COLLECTION]
+    for platform in platforms or PLATFORMS:
+        collections, source_field = PLATFORMS[platform]
+        buckets = defaultdict(lambda: defaultdict(int))
+        documents = 0
+        for name in collections:
+            for doc in db[name].find({}, ROLLUP_SOURCE_PROJECTION, batch_size=1000):
+                documents += 1
+                contribution = rollup_contribution(doc, source_field)
+                if contribution is None:
+                    continue
+                key, values = contribution
+                for field, value in values.items():
+                    buckets[key][field] += value
+
+        ops = [
+            UpdateOne({'platform': platform, 'source': source, 'day': day}, {'$set': dict(values)}, upsert=True)
+            for (source, day), values in buckets.items()
+        ]
+        for start in range(0, len(ops), BULK_BATCH_SIZE):
+            rollups.bulk_write(ops[start:start + BULK_BATCH_SIZE], ordered=False)
+
+        stale = [
+            doc['_id'] for doc in rollups.find({'platform': platform}, {'source': 1, 'day': 1})
+            if (doc.get('source'), doc.get('day')) not in buckets
+        ]
+        for start in range(0, len(stale), BULK_BATCH_SIZE):
+            rollups.delete_many({'_id': {'$in': stale[start:start + BULK_BATCH_SIZE]}})
+        logger.info(f"Rebuilt {len(buckets)} {platform} rollups from {documents} documents ({len(stale)} stale removed)")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != 'rebuild':
+        print("Usage: python rollups.py rebuild [reddit|4chan]")
+        sys.exit(1)
+
+    rebuild_rollups(get_db(), sys.argv[2:] or None)
@@ -0,0 +1,131 @@
+# sentiment.py
+
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from analysis_cache import sentiment_cache
+
+# Logger setup
+logger = logging.getLogger("Sentiment")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Scoring processes per worker process. Every consumer process starts its own pool, so the
+# default only takes half the cores; lower it further when several consumers share a machine
+SENTIMENT_WORKERS = int(os.getenv("SENTIMENT_WORKERS", max(1, (os.cpu_count() or 1) // 2)))
+# Smaller batches are scored inline: shipping them to the pool costs more than it saves
+PARALLEL_MIN_BATCH = int(os.getenv("SENTIMENT_PARALLEL_MIN_BATCH", 64))
+CHUNK_SIZE = 64
+
+# Download the lexicon when it is not installed yet; off by default, so a worker never
+# reaches out to the network on its own (install it with: python -m nltk.downloader vader_lexicon)
+VADER_AUTO_DOWNLOAD = os.getenv("VADER_AUTO_DOWNLOAD", "0") == "1"
+
+MISSING_LEXICON_MESSAGE = (
+    "VADER lexicon not installed in any NLTK data directory. Install it with "
+    "'python -m nltk.downloader vader_lexicon', or set VADER_AUTO_DOWNLOAD=1 to download it on first use."
+)
+
+_sia = None
+_sia_lock = threading.Lock()
+
+def lexicon_available():
+    """Checks the local NLTK data directories for the VADER lexicon, without any network call."""
+    import nltk
+
+    try:
+        nltk.data.find('sentiment/vader_lexicon.zip')
+        return True
+    except LookupError:
+        return False
+
+def get_analyzer():
+    """
+    Returns the process's SentimentIntensityAnalyzer, loading NLTK and the lexicon on first use.
+
+    The lexicon is only downloaded if it is missing locally and VADER_AUTO_DOWNLOAD=1;
+    otherwise a missing lexicon is logged and raises LookupError with install instructions.
+    """
+    global _sia
+    with _sia_lock:
+        if _sia is None:
+            import nltk
+            from nltk.sentiment.vader import SentimentIntensityAnalyzer
+
+            if not lexicon_available():
+                if not VADER_AUTO_DOWNLOAD:
+                    logger.error(MISSING_LEXICON_MESSAGE)
+                    raise LookupError(MISSING_LEXICON_MESSAGE)
+                logger.info("VADER lexicon not found locally, downloading it once")
+                nltk.download('vader_lexicon', quiet=True)
+            _sia = SentimentIntensityAnalyzer()
+        return _sia
+
+# Sentiment Analysis Function
+def compute_sentiment(text):
+    """
+    Compute the compound sentiment score for a given text.
+    Returns a float between -1 (most negative) and +1 (most positive).
+    """
+    if not text or not isinstance(text, str):
+        return None
+    analyzer = _sia if _sia is not None else get_analyzer()
+    sentiment = analyzer.polarity_scores(text)
+    return sentiment['compound']
+
+def _score_chunk(texts):
+    return [compute_sentiment(text) for text in texts]
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Returns this process's scoring pool, creating it on first use (and again after fork)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=SENTIMENT_WORKERS)
+            _pool_pid = os.getpid()
+        return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False)
+        _pool = None
+
+def score_batch(texts):
+    """
+    Compute compound scores for a batch of texts, fanning large batches out to a
+    process pool so VADER runs on every core instead of under one GIL.
+
+    Results are identical to calling compute_sentiment on each text. If the pool
+    breaks, the batch is scored inline.
+    """
+    texts = list(texts)
+    if SENTIMENT_WORKERS <= 1 or len(texts) < PARALLEL_MIN_BATCH:
+        return _score_chunk(texts)
+
+    chunks = [texts[i:i + CHUNK_SIZE] for i in range(0, len(texts), CHUNK_SIZE)]
+    try:
+        return [score for chunk in get_pool().map(_score_chunk, chunks) for score in chunk]
+    except (BrokenProcessPool, OSError) as e:
+        logger.error(f"Sentiment pool failed, scoring {len(texts)} texts inline: {e}")
+        _reset_pool()
+        return _score_chunk(texts)
+
+def score_texts(texts):
+    """
+    Compute the compound sentiment score of every text of a page/thread in one call.
+    Texts scored before (same normalized content) are read from the analysis cache;
+    the rest are scored as one batch.
+    Returns one score (None for empty text) per text, in input order.
+    """
+    return sentiment_cache.lookup(texts, score_batch)
@@ -0,0 +1,235 @@
+# snapshots.py
+
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+import numpy as np
+from columnar import ColumnarBatch, concat_batches
+from db import LazyCollection
+from metrics import coerce_float, normalize_toxic, parse_date
+
+# Logger setup
+logger = logging.getLogger("Snapshots")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Partitions are written to <SNAPSHOT_DIR>/<collection>/<YYYY-MM-DD>.arrow
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots"))
+# Days younger than this are not snapshotted yet, as their posts and comments are still arriving
+SNAPSHOT_LAG_DAYS = int(os.getenv("SNAPSHOT_LAG_DAYS", 2))
+
+# Column types per collection: 'string', 'int', 'float' (coerced like the metrics, missing -> 0.0),
+# 'bool' (normalized is_toxic) or 'timestamp'
+SNAPSHOT_SCHEMAS = {
+    'reddit_posts': {
+        'date_field': 'created_utc',
+        'source_field': 'subreddit',
+        'columns': {
+            'subreddit': 'string', 'post_id': 'string', 'title': 'string', 'author': 'string',
+            'created_utc': 'timestamp', 'content': 'string', 'comments_count': 'int', 'score': 'float',
+            'url': 'string', 'is_toxic': 'bool', 'sentiment': 'float'
+        }
+    },
+    'reddit_comments': {
+        'date_field': 'created_utc',
+        'source_field': 'subreddit',
+        'columns': {
+            'subreddit': 'string', 'post_id': 'string', 'comment_id': 'string', 'author': 'string',
+            'created_utc': 'timestamp', 'body': 'string', 'score': 'float', 'is_toxic': 'bool',
+            'sentiment': 'float'
+        }
+    },
+    'chan_posts': {
+        'date_field': 'created_at',
+        'source_field': 'board',
+        'columns': {
+            'board': 'string', 'thread_no': 'int', 'post_no': 'int', 'created_at': 'timestamp',
+            'name': 'string', 'comment': 'string', 'replies': 'int', 'images': 'int',
+            'score': 'float', 'is_toxic': 'bool', 'sentiment': 'float'
+        }
+    },
+}
+
+# MongoDB collections, connected on first use
+snapshot_collections = {name: LazyCollection(name) for name in SNAPSHOT_SCHEMAS}
+
+def partition_path(collection_name, day, snapshot_dir=None):
+    return os.path.join(snapshot_dir or SNAPSHOT_DIR, collection_name, f"{day:%Y-%m-%d}.arrow")
+
+def written_days(collection_name, snapshot_dir=None):
+    """Returns the days that already have a partition, sorted."""
+    directory = os.path.join(snapshot_dir or SNAPSHOT_DIR, collection_name)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        datetime.strptime(name[:-len('.arrow')], '%Y-%m-%d')
+        for name in os.listdir(directory) if name.endswith('.arrow')
+    )
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_string(value):
+    return None if value is None else str(value)
+
+def _to_timestamp(value):
+    date = parse_date(value)
+    return None if date is None else date.replace(tzinfo=None)
+
+CONVERTERS = {
+    'string': _to_string,
+    'int': _to_int,
+    'float': coerce_float,
+    'bool': normalize_toxic,
+    'timestamp': _to_timestamp,
+}
+
+def _arrow_schema(columns):
+    import pyarrow as pa
+
+    types = {'string': pa.string(), 'int': pa.int64(), 'float': pa.float64(), 'bool': pa.bool_(), 'timestamp': pa.timestamp('ms')}
+    return pa.schema([(name, types[kind]) for name, kind in columns.items()])
+
+def write_partition(collection_name, day, collection=None, snapshot_dir=None, batch_size=1000):
+    """
+    Writes one day of a collection to an uncompressed Arrow IPC file, which
+    readers memory-map without copying.
+
+    The file is written under a temporary name and renamed, so readers never see
+    a partial partition.
+
+    Returns:
+        int: Number of documents written.
+    """
+    import pyarrow as pa
+
+    spec = SNAPSHOT_SCHEMAS[collection_name]
+    columns = spec['columns']
+    collection = collection if collection is not None else snapshot_collections[collection_name]
+    query = {spec['date_field']: {'$gte': day, '$lt': day + timedelta(days=1)}}
+    projection = dict.fromkeys(columns, 1)
+    projection['_id'] = 0
+
+    values = {name: [] for name in columns}
+    for doc in collection.find(query, projection, batch_size=batch_size):
+        for name, kind in columns.items():
+            values[name].append(CONVERTERS[kind](doc.get(name)))
+    table = pa.table(values, schema=_arrow_schema(columns))
+
+    path = partition_path(collection_name, day, snapshot_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with pa.OSFile(path + '.tmp', 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(path + '.tmp', path)
+    return table.num_rows
+
+def write_snapshots(collection_names=None, until=None, collection_overrides=None, snapshot_dir=None):
+    """
+    Appends the partitions that are missing, from the collection's first day (or
+    the day after the last partition) up to `until` (default: today minus
+    SNAPSHOT_LAG_DAYS). Existing partitions are never rewritten.
+
+    Returns:
+        dict: Collection -> number of partitions written.
+    """
+    until = until or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=SNAPSHOT_LAG_DAYS)
+    written = {}
+    for collection_name in collection_names or SNAPSHOT_SCHEMAS:
+        spec = SNAPSHOT_SCHEMAS[collection_name]
+        collection = (collection_overrides or {}).get(collection_name, snapshot_collections[collection_name])
+        days = written_days(collection_name, snapshot_dir)
+        if days:
+            day = days[-1] + timedelta(days=1)
+        else:
+            first = collection.find_one({spec['date_field']: {'$type': 'date'}}, {spec['date_field']: 1}, sort=[(spec['date_field'], 1)])
+            if first is None:
+                written[collection_name] = 0
+                continue
+            day = datetime.combine(first[spec['date_field']].date(), datetime.min.time())
+
+        written[collection_name] = 0
+        while day <= until:
+            rows = write_partition(collection_name, day, collection=collection, snapshot_dir=snapshot_dir)
+            written[collection_name] += 1
+            logger.info(f"Wrote {collection_name} {day:%Y-%m-%d}: {rows} documents")
+            day += timedelta(days=1)
+    return written
+
+def read_snapshot_batch(collection_name, start_date, end_date, sources=None, snapshot_dir=None):
+    """
+    Reads the analytics columns of a date range from memory-mapped partitions
+    into a ColumnarBatch.
+
+    Rows are filtered exactly like the MongoDB queries (start_date <= date <=
+    end_date, source in `sources` unless 'all'); only the source, date,
+    sentiment, score and is_toxic columns are touched.
+
+    Returns:
+        ColumnarBatch: Possibly empty; days without a partition are skipped.
+    """
+    import pyarrow as pa
+
+    spec = SNAPSHOT_SCHEMAS[collection_name]
+    date_field, source_field = spec['date_field'], spec['source_field']
+    start = np.datetime64(start_date, 'ms')
+    end = np.datetime64(end_date, 'ms')
+    wanted = None if not sources or "all" in sources else set(sources)
+
+    batches = []
+    day = datetime.combine(start_date.date(), datetime.min.time())
+    while day <= end_date:
+        path = partition_path(collection_name, day, snapshot_dir)
+        day += timedelta(days=1)
+        if not os.path.exists(path):
+            continue
+        with pa.memory_map(path, 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+        if not table.num_rows:
+            continue
+
+        timestamps = table.column(date_field).to_numpy().astype('datetime64[ms]')
+        encoded = table.column(source_field).combine_chunks().dictionary_encode()
+        names = encoded.dictionary.to_pylist()
+        codes = encoded.indices.to_numpy(zero_copy_only=False).astype(np.int32)
+        mask = (timestamps >= start) & (timestamps <= end)
+        if wanted is not None:
+            mask &= np.isin(codes, [code for code, name in enumerate(names) if name in wanted])
+        if not mask.any():
+            continue
+
+        batches.append(ColumnarBatch(
+            names,
+            codes[mask],
+            timestamps[mask],
+            table.column('sentiment').to_numpy()[mask],
+            table.column('score').to_numpy()[mask],
+            table.column('is_toxic').to_numpy(zero_copy_only=False)[mask]
+        ))
+
+    if not batches:
+        return ColumnarBatch([], np.array([], dtype=np.int32), np.array([], dtype='datetime64[ms]'),
+                             np.array([]), np.array([]), np.array([], dtype=bool))
+    return concat_batches(batches)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ('write', 'status'):
+        print("Usage: python snapshots.py write [collection ...] | status")
+        sys.exit(1)
+
+    if sys.argv[1] == 'write':
+        write_snapshots(sys.argv[2:] or None)
+    else:
+        for collection_name in SNAPSHOT_SCHEMAS:
+            days = written_days(collection_name)
+            if days:
+                logger.info(f"{collection_name}: {len(days)} partitions, {days[0]:%Y-%m-%d} to {days[-1]:%Y-%m-%d}")
+            else:
+                logger.info(f"{collection_name}: no partitions")
@@ -125,6 +125,10 @@ document.addEventListener('DOMContentLoaded', () => {
         let params = new URLSearchParams();
         params.append('start_date', startDate);
         params.append('end_date', endDate);
+        // Snapshots answer from the offline Arrow files; live uses the server's default metrics mode
+        if (document.getElementById('backend-select').value === 'snapshot') {
+            params.append('mode', 'snapshot');
+        }
 
         if (platform === 'reddit') {
             url = '/api/reddit/data';
@@ -0,0 +1,77 @@
+# conftest.py
+
+import os
+import sys
+from types import SimpleNamespace
+
+import mongomock
+import pytest
+from pymongo import InsertOne, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+# Scratch database on a real server, for what mongomock does not implement (e.g. $dateTrunc)
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI", "mongodb://localhost:27017/")
+MONGO_TEST_DB = os.getenv("MONGO_TEST_DB", "crawler_test_db")
+
+def _use_database(monkeypatch, database):
+    monkeypatch.setattr(db, 'get_db', lambda: database)
+    monkeypatch.setattr(db, 'ensure_indexes_once', lambda names: None)
+
+def _mock_bulk_write(self, requests, ordered=True, **kwargs):
+    """bulk_write for mongomock, whose own does not accept the installed pymongo's operations."""
+    result = SimpleNamespace(inserted_count=0, matched_count=0, modified_count=0, upserted_count=0, upserted_ids={})
+    errors = []
+    for index, request in enumerate(requests):
+        try:
+            if isinstance(request, InsertOne):
+                self.insert_one(dict(request._doc))
+                result.inserted_count += 1
+            elif isinstance(request, UpdateOne):
+                update = self.update_one(request._filter, request._doc, upsert=bool(request._upsert))
+                result.matched_count += update.matched_count
+                result.modified_count += update.modified_count
+                if update.upserted_id is not None:
+                    result.upserted_count += 1
+                    result.upserted_ids[index] = update.upserted_id
+            else:
+                raise NotImplementedError(type(request).__name__)
+        except DuplicateKeyError as e:
+            errors.append({'index': index, 'code': 11000, 'errmsg': str(e)})
+            if ordered:
+                break
+    if errors:
+        raise BulkWriteError({
+            'writeErrors': errors, 'nInserted': result.inserted_count, 'nMatched': result.matched_count,
+            'nModified': result.modified_count, 'nUpserted': result.upserted_count
+        })
+    return result
+
+@pytest.fixture
+def mock_db(monkeypatch):
+    """Points every LazyCollection at an in-memory mongomock database."""
+    monkeypatch.setattr(mongomock.Collection, 'bulk_write', _mock_bulk_write)
+    database = mongomock.MongoClient()['crawler_test_db']
+    _use_database(monkeypatch, database)
+    return database
+
+@pytest.fixture
+def mongod_db(monkeypatch):
+    """Points every LazyCollection at a scratch database on MONGO_TEST_URI; skipped without a server."""
+    client = MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=1000)
+    try:
+        version = tuple(client.server_info()['versionArray'][:2])
+    except PyMongoError as e:
+        pytest.skip(f"No MongoDB server at {MONGO_TEST_URI}: {e}")
+    if version < (5, 0):
+        pytest.skip(f"MongoDB {version} is older than 5.0 ($dateTrunc)")
+    client.drop_database(MONGO_TEST_DB)
+    database = client[MONGO_TEST_DB]
+    _use_database(monkeypatch, database)
+    yield database
+    client.drop_database(MONGO_TEST_DB)
+    client.close()
@@ -0,0 +1,71 @@
+# test_backfill.py
+
+from datetime import datetime
+
+import backfill
+import reddit_past
+
+class FakeRedditClient:
+    """Search listing with `pages` pages of one post each for every day."""
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def fetch_posts_by_date(self, subreddit, after, before, limit=100, page=None):
+        number = int(page or 0) + 1
+        return {'data': {
+            'children': [{'data': {'id': f"{subreddit}-{after}-{number}"}}],
+            'after': str(number) if number < self.pages else None
+        }}
+
+def run(monkeypatch, pages):
+    monkeypatch.setattr(backfill, 'RedditClient', lambda credentials: FakeRedditClient(pages))
+    monkeypatch.setattr(reddit_past, 'store_historical_data', lambda data, subreddit: len(data['data']['children']))
+    backfill.plan_units(['jobs'], datetime(2024, 12, 1), datetime(2024, 12, 2))
+    backfill.run_worker({'username': 'tester'})
+
+def test_days_within_the_page_limit_are_done(mock_db, monkeypatch):
+    run(monkeypatch, pages=backfill.MAX_PAGES_PER_UNIT)
+
+    units = list(mock_db.backfill_units.find())
+    assert [unit['status'] for unit in units] == ['done', 'done']
+    assert all('next_page' not in unit for unit in units)
+
+def test_days_over_the_page_limit_are_marked_partial(mock_db, monkeypatch):
+    run(monkeypatch, pages=backfill.MAX_PAGES_PER_UNIT + 5)
+
+    units = list(mock_db.backfill_units.find())
+    assert [unit['status'] for unit in units] == ['partial', 'partial']
+    assert {unit['pages'] for unit in units} == {backfill.MAX_PAGES_PER_UNIT}
+    assert {unit['next_page'] for unit in units} == {str(backfill.MAX_PAGES_PER_UNIT)}
+    # Not picked up again as if unfinished work were pending
+    assert backfill.claim_unit('another-worker') is None
+
+    report = backfill.backfill_report()
+    assert report['partial'] == 2
+    assert report['posts'] == 2 * backfill.MAX_PAGES_PER_UNIT
+    assert report['subreddits'] == {'jobs': (0, 2, 2)}
+
+def test_partial_days_resume_from_their_cursor(mock_db, monkeypatch):
+    run(monkeypatch, pages=backfill.MAX_PAGES_PER_UNIT + 5)
+    client = FakeRedditClient(backfill.MAX_PAGES_PER_UNIT + 5)
+    requested_pages = []
+    fetch_posts_by_date = client.fetch_posts_by_date
+
+    def record_page(subreddit, after, before, limit=100, page=None):
+        requested_pages.append(page)
+        return fetch_posts_by_date(subreddit, after, before, limit=limit, page=page)
+
+    client.fetch_posts_by_date = record_page
+    monkeypatch.setattr(backfill, 'RedditClient', lambda credentials: client)
+
+    # A plain run leaves them alone
+    assert backfill.claim_unit('another-worker') is None
+    backfill.run_worker({'username': 'tester'}, resume_partial=True)
+
+    units = list(mock_db.backfill_units.find())
+    assert [unit['status'] for unit in units] == ['done', 'done']
+    assert all('next_page' not in unit for unit in units)
+    assert {unit['pages'] for unit in units} == {backfill.MAX_PAGES_PER_UNIT + 5}
+    assert requested_pages[0] == str(backfill.MAX_PAGES_PER_UNIT)
+    assert backfill.backfill_report()['posts'] == 2 * (backfill.MAX_PAGES_PER_UNIT + 5)
@@ -0,0 +1,56 @@
+# test_chan_async_crawler.py
+
+import asyncio
+
+import chan_async_crawler
+from chan_crawler import load_catalog_state
+
+class FakeChanClient:
+    """threads.json and thread responses served from memory; threads in `failing` return None (fetch error)."""
+
+    def __init__(self, threads, board_last_modified, failing=()):
+        self.threads = threads
+        self.board_last_modified = board_last_modified
+        self.failing = set(failing)
+        self.catalog_requests = []
+        self.thread_requests = []
+
+    async def get_threads(self, board, if_modified_since=None):
+        self.catalog_requests.append(if_modified_since)
+        if if_modified_since == self.board_last_modified:
+            return chan_async_crawler.NOT_MODIFIED, if_modified_since
+        pages = [{'page': 1, 'threads': [{'no': no, 'last_modified': modified, 'replies': 0} for no, modified in self.threads.items()]}]
+        return pages, self.board_last_modified
+
+    async def get_thread(self, board, thread_no, if_modified_since=None):
+        self.thread_requests.append(thread_no)
+        if thread_no in self.failing:
+            return None, None
+        return {'posts': [{'no': thread_no}]}, 'thread-modified'
+
+def test_failed_threads_are_retried_by_the_next_sweep(mock_db, monkeypatch):
+    monkeypatch.setattr(chan_async_crawler, 'store_thread', lambda *args: None)
+    client = FakeChanClient({1: 100, 2: 200}, 'board-modified-1', failing={2})
+
+    assert asyncio.run(chan_async_crawler.sweep_board('biz', client)) == {'stored': 1, 'failed': 1}
+    state = load_catalog_state('biz')
+    assert set(state['threads']) == {'1'}
+    assert state.get('last_modified') is None  # threads.json is fetched again next time
+
+    client.failing.clear()
+    client.thread_requests.clear()
+    assert asyncio.run(chan_async_crawler.sweep_board('biz', client)) == {'stored': 1}
+    assert client.thread_requests == [2]
+    assert load_catalog_state('biz')['last_modified'] == 'board-modified-1'
+
+def test_failed_thread_keeps_its_previous_entry(mock_db, monkeypatch):
+    monkeypatch.setattr(chan_async_crawler, 'store_thread', lambda *args: None)
+    client = FakeChanClient({1: 100}, 'board-modified-1')
+    asyncio.run(chan_async_crawler.sweep_board('biz', client))
+
+    # Thread 1 is bumped but its fetch fails
+    client.threads, client.board_last_modified, client.failing = {1: 150}, 'board-modified-2', {1}
+    assert asyncio.run(chan_async_crawler.sweep_board('biz', client)) == {'failed': 1}
+    state = load_catalog_state('biz')
+    assert state['threads']['1']['last_modified'] == 100
+    assert state['last_modified'] == 'board-modified-1'
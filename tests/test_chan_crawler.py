@@ -0,0 +1,55 @@
+# test_chan_crawler.py
+
+import pytest
+
+import chan_crawler
+from chan_crawler import load_catalog_state, save_catalog_state
+
+class FakeChanClient:
+    """Serves one threads.json poll; every thread fetch fails."""
+
+    last_modified = 'board-modified'
+
+    def get_threads(self, board, if_modified_since=None):
+        return [{'page': 1, 'threads': [{'no': 1, 'last_modified': 20, 'replies': 2}]}]
+
+    def get_thread(self, board, thread_no, if_modified_since=None):
+        return None
+
+class FakeProducer:
+    def __init__(self, delivered):
+        self.delivered = delivered
+        self.jobs = []
+
+    def push_many(self, jobs):
+        self.jobs.extend(jobs)
+
+    def flush(self):
+        return self.delivered
+
+@pytest.fixture
+def fake_chan(mock_db, monkeypatch):
+    monkeypatch.setattr(chan_crawler, 'ChanClient', FakeChanClient)
+    save_catalog_state('biz', {'1': {'last_modified': 10, 'replies': 1}, '2': {'last_modified': 10, 'replies': 0}}, 'old')
+
+def test_failed_thread_fetch_is_retried_and_forgotten_by_the_catalog(fake_chan):
+    with pytest.raises(ConnectionError):
+        chan_crawler.crawl_thread('biz', 1)
+
+    state = load_catalog_state('biz')
+    assert state['threads'] == {'2': {'last_modified': 10, 'replies': 0}}
+    assert 'last_modified' not in state  # the next poll is not a 304
+
+def test_catalog_is_saved_only_after_the_thread_jobs_are_sent(fake_chan, monkeypatch):
+    producer = FakeProducer(delivered=False)
+    monkeypatch.setattr(chan_crawler, 'get_producer', lambda: producer)
+    with pytest.raises(ConnectionError):
+        chan_crawler.crawl_catalog('biz')
+    assert load_catalog_state('biz')['last_modified'] == 'old'
+
+    producer.delivered = True
+    chan_crawler.crawl_catalog('biz')
+    state = load_catalog_state('biz')
+    assert state['last_modified'] == 'board-modified'
+    assert state['threads'] == {'1': {'last_modified': 20, 'replies': 2}}
+    assert [job.args for job in producer.jobs] == [['biz', 1], ['biz', 1]]
@@ -0,0 +1,36 @@
+# test_crawl_leases.py
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import crawl_leases
+from crawl_leases import claim_job, restart_expired_chains, start_chain
+from indexes import ensure_indexes
+
+NOW = datetime(2024, 12, 1, 12)
+
+@pytest.fixture
+def leases(mock_db):
+    ensure_indexes(mock_db, [crawl_leases.CRAWL_LEASE_COLLECTION])
+    return mock_db[crawl_leases.CRAWL_LEASE_COLLECTION]
+
+def test_expired_chains_are_restarted_once(leases):
+    dead = start_chain('reddit', 'jobs', 'crawl-subreddit', now=NOW)
+    start_chain('reddit', 'layoffs', 'crawl-subreddit', now=NOW + timedelta(hours=1))
+    start_chain('4chan', 'biz', 'crawl-catalog', now=NOW)
+    scheduled = []
+
+    def schedule(source, chain=None):
+        scheduled.append((source, chain))
+
+    later = NOW + timedelta(minutes=crawl_leases.LEASE_GRACE_MINUTES + 1)
+    assert restart_expired_chains('crawl-subreddit', schedule, now=later) == [('reddit', 'jobs')]
+    assert [source for source, _ in scheduled] == ['jobs']
+    assert scheduled[0][1] not in (None, dead)
+
+    # The new chain holds the lease: a late retry of the dead chain's job is dropped, and the next check does nothing
+    assert claim_job('reddit', 'jobs', 'crawl-subreddit', dead) is None
+    assert claim_job('reddit', 'jobs', 'crawl-subreddit', scheduled[0][1]) == scheduled[0][1]
+    assert restart_expired_chains('crawl-subreddit', schedule, now=later) == []
+    assert len(scheduled) == 1
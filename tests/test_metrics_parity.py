@@ -0,0 +1,88 @@
+# test_metrics_parity.py
+
+from datetime import datetime
+
+import mongomock
+import pytest
+
+import utils
+
+START = datetime(2024, 12, 1)
+END = datetime(2024, 12, 3, 23, 59, 59)
+
+REDDIT_POSTS = [
+    {'subreddit': 'jobs', 'created_utc': datetime(2024, 12, 1, 8), 'sentiment': 0.5, 'score': 10, 'is_toxic': False},
+    {'subreddit': 'jobs', 'created_utc': datetime(2024, 12, 1, 23, 59), 'sentiment': -0.4, 'score': -3, 'is_toxic': 'true'},
+    {'subreddit': 'jobs', 'created_utc': datetime(2024, 12, 2), 'score': '12', 'is_toxic': 'no'},  # missing sentiment
+    {'subreddit': 'layoffs', 'created_utc': datetime(2024, 12, 2, 12), 'sentiment': -0.9, 'score': '-7', 'is_toxic': 'Yes'},
+    {'subreddit': 'layoffs', 'created_utc': datetime(2024, 12, 3, 1), 'sentiment': None, 'score': 'n/a', 'is_toxic': 1},
+    {'subreddit': 'jobs', 'created_utc': datetime(2024, 12, 5), 'sentiment': 0.9, 'score': 100, 'is_toxic': True},  # out of range
+    {'subreddit': 'politics', 'created_utc': datetime(2024, 12, 2), 'sentiment': 0.1, 'score': 1, 'is_toxic': True},  # not selected
+]
+REDDIT_COMMENTS = [
+    {'subreddit': 'jobs', 'created_utc': datetime(2024, 12, 1, 9), 'sentiment': -0.2, 'score': -5, 'is_toxic': '1'},
+    {'subreddit': 'jobs', 'created_utc': datetime(2024, 12, 3, 18), 'sentiment': '0.3', 'score': 4},  # no is_toxic
+    {'subreddit': 'layoffs', 'created_utc': datetime(2024, 12, 2, 13), 'sentiment': -0.6, 'score': -2.5, 'is_toxic': 'False'},
+]
+CHAN_POSTS = [
+    {'board': 'biz', 'created_at': datetime(2024, 12, 1, 3), 'sentiment': -0.7, 'score': -1, 'is_toxic': 'TRUE'},
+    {'board': 'biz', 'created_at': datetime(2024, 12, 2, 4), 'score': '3.5', 'is_toxic': 0},
+    {'board': 'g', 'created_at': datetime(2024, 12, 3, 5), 'sentiment': 0.25, 'score': None, 'is_toxic': None},
+]
+
+def _rounded(value):
+    """Rounds floats in a response so both paths compare despite summation order."""
+    if isinstance(value, float):
+        return round(value, 9)
+    if isinstance(value, dict):
+        return {key: _rounded(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_rounded(item) for item in value]
+    return value
+
+def _insert(database):
+    # Copies, as insert_many adds _id to the documents
+    database.reddit_posts.insert_many([dict(doc) for doc in REDDIT_POSTS])
+    database.reddit_comments.insert_many([dict(doc) for doc in REDDIT_COMMENTS])
+    database.chan_posts.insert_many([dict(doc) for doc in CHAN_POSTS])
+
+def _python_metrics():
+    return {
+        'reddit': utils.calculate_source_metrics(
+            utils.iter_reddit_data(START, END, ['jobs', 'layoffs']), ['jobs', 'layoffs'], 'subreddit', platform='reddit'
+        ),
+        '4chan': utils.calculate_source_metrics(
+            utils.iter_4chan_data(START, END, ['biz', 'g']), ['biz', 'g'], 'board', platform='4chan'
+        ),
+    }
+
+def test_python_metrics_coerce_like_the_pipeline(mock_db):
+    _insert(mock_db)
+    metrics = _python_metrics()
+
+    reddit = metrics['reddit']
+    assert reddit['toxicity_distribution'] == {'jobs': {'toxic': 2, 'non_toxic': 3}, 'layoffs': {'toxic': 2, 'non_toxic': 1}}
+    assert reddit['average_scores']['jobs'] == pytest.approx((10 - 3 + 12 - 5 + 4) / 5)
+    assert reddit['sentiment_trend']['jobs'] == {
+        'dates': ['2024-12-01', '2024-12-02', '2024-12-03'],
+        'values': [pytest.approx((0.5 - 0.4 - 0.2) / 3), 0.0, pytest.approx(0.3)]
+    }
+    # Negative x negative products keep the sentiment's sign
+    assert reddit['sentiment_score_trend']['jobs']['values'][0] == pytest.approx((5.0 - 1.2 - 1.0) / 3)
+    assert reddit['sentiment_score_trend']['layoffs']['values'][0] == pytest.approx((-6.3 - 1.5) / 2)
+    assert metrics['4chan']['sentiment_score_trend']['biz']['values'] == [pytest.approx(-0.7), 0.0]
+
+def test_pipeline_matches_python_metrics(mongod_db, monkeypatch):
+    _insert(mongod_db)
+    pipeline = {
+        'reddit': utils.aggregate_reddit_metrics(START, END, ['jobs', 'layoffs']),
+        '4chan': utils.aggregate_4chan_metrics(START, END, ['biz', 'g']),
+    }
+
+    # Same documents, read back through mongomock for the Python fallback
+    database = mongomock.MongoClient()['crawler_test_db']
+    for name in ('reddit_posts', 'reddit_comments', 'chan_posts'):
+        monkeypatch.setattr(utils, name, database[name])
+    _insert(database)
+
+    assert _rounded(pipeline) == _rounded(_python_metrics())
@@ -0,0 +1,28 @@
+# test_response_cache.py
+
+from datetime import datetime, timedelta
+
+from response_cache import ResponseCache, record_source_write
+
+def test_backfill_writes_invalidate_historical_responses(mock_db):
+    versions = mock_db.source_versions
+    cache = ResponseCache(versions)
+    start = datetime.utcnow() - timedelta(days=30)
+    end = start + timedelta(days=7)
+    selections = {'reddit': ['jobs']}
+    computed = []
+
+    def compute():
+        computed.append(1)
+        return {'posts': len(computed)}
+
+    assert cache.get_or_compute('reddit', start, end, selections, compute) == {'posts': 1}
+    assert cache.get_or_compute('reddit', start, end, selections, compute) == {'posts': 1}
+
+    # A backfill stores posts into that past week
+    record_source_write(versions, 'reddit', 'jobs')
+    assert cache.get_or_compute('reddit', start, end, selections, compute) == {'posts': 2}
+
+    # Writes to other sources leave it cached
+    record_source_write(versions, 'reddit', 'politics')
+    assert cache.get_or_compute('reddit', start, end, selections, compute) == {'posts': 2}
@@ -0,0 +1,117 @@
+# test_rollups.py
+
+from collections import defaultdict
+from datetime import datetime
+
+import pytest
+from pymongo.errors import PyMongoError
+
+import utils
+from rollups import ROLLUP_COLLECTION, bulk_upsert_with_rollup, rebuild_rollups, rollup_contribution
+
+class RaceAfterFind:
+    """Collection wrapper running `race` (another worker's write) right after the first find()."""
+
+    def __init__(self, collection, race):
+        self.collection = collection
+        self.race = race
+
+    def find(self, *args, **kwargs):
+        docs = list(self.collection.find(*args, **kwargs))
+        if self.race:
+            race, self.race = self.race, None
+            race()
+        return docs
+
+    def __getattr__(self, attr):
+        return getattr(self.collection, attr)
+
+class FailingWrites:
+    """Collection wrapper whose bulk_write fails, as on a lost connection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def bulk_write(self, *args, **kwargs):
+        raise PyMongoError("connection closed")
+
+    def __getattr__(self, attr):
+        return getattr(self.collection, attr)
+
+def post(post_no, sentiment, day=1):
+    return {'board': 'biz', 'post_no': post_no, 'created_at': datetime(2024, 12, day, 12), 'sentiment': sentiment,
+            'score': 0, 'is_toxic': False}
+
+def expected_rollups(collection):
+    """Rollup buckets recomputed from the raw documents."""
+    buckets = defaultdict(lambda: defaultdict(float))
+    for doc in collection.find():
+        (source, day), values = rollup_contribution(doc, 'board')
+        for field, value in values.items():
+            buckets[(source, day)][field] += value
+    return {key: {field: pytest.approx(value) for field, value in values.items() if value} for key, values in buckets.items()}
+
+def stored_rollups(database):
+    buckets = {
+        (doc['source'], doc['day']): {field: value for field, value in doc.items() if field not in ('_id', 'platform', 'source', 'day') and value}
+        for doc in database[ROLLUP_COLLECTION].find()
+    }
+    return {key: values for key, values in buckets.items() if values}  # emptied buckets are left at zero
+
+@pytest.fixture
+def chan_posts(mock_db):
+    mock_db.chan_posts.create_index('post_no', unique=True)
+    return mock_db.chan_posts
+
+def store(collection, docs, database):
+    return bulk_upsert_with_rollup(collection, 'post_no', docs, '4chan', database[ROLLUP_COLLECTION])
+
+def test_concurrent_insert_of_the_same_post_counts_once(chan_posts, mock_db):
+    racing = RaceAfterFind(chan_posts, lambda: store(chan_posts, [post(1, 0.5)], mock_db))
+
+    assert store(racing, [post(1, 0.5), post(2, 0.1)], mock_db) == (1, [])
+    assert stored_rollups(mock_db) == expected_rollups(chan_posts)
+    assert stored_rollups(mock_db)[('biz', datetime(2024, 12, 1))]['count'] == 2
+
+def test_concurrent_change_of_an_unchanged_post_is_not_lost(chan_posts, mock_db):
+    store(chan_posts, [post(1, 0.5)], mock_db)
+    # This worker re-stores the post as it read it; another worker changes it in between
+    racing = RaceAfterFind(chan_posts, lambda: store(chan_posts, [post(1, -0.5, day=2)], mock_db))
+
+    assert store(racing, [post(1, 0.5)], mock_db) == (0, [])
+    assert chan_posts.find_one({'post_no': 1})['sentiment'] == 0.5
+    assert stored_rollups(mock_db) == expected_rollups(chan_posts)
+
+def test_concurrent_changes_of_the_same_post_are_not_double_counted(chan_posts, mock_db):
+    store(chan_posts, [post(1, 0.5), post(2, 0.2)], mock_db)
+    racing = RaceAfterFind(chan_posts, lambda: store(chan_posts, [post(1, -0.5)], mock_db))
+
+    assert store(racing, [post(1, 0.9), post(2, 0.2), post(3, 0.3)], mock_db) == (1, [])
+    assert stored_rollups(mock_db) == expected_rollups(chan_posts)
+    assert stored_rollups(mock_db)[('biz', datetime(2024, 12, 1))]['count'] == 3
+
+def test_failed_rollup_write_reports_the_documents(chan_posts, mock_db):
+    store(chan_posts, [post(1, 0.5)], mock_db)
+    rollups = FailingWrites(mock_db[ROLLUP_COLLECTION])
+
+    inserted, failed = bulk_upsert_with_rollup(chan_posts, 'post_no', [post(1, 0.5), post(2, 0.1), post(3, 0.2, day=2)],
+                                               '4chan', rollups)
+    assert inserted == 2
+    assert sorted(failed) == [2, 3]  # post 1 is unchanged and needs no rollup write
+
+def test_rebuild_overwrites_buckets_and_drops_stale_ones(chan_posts, mock_db):
+    store(chan_posts, [post(1, 0.5), post(2, -0.2, day=2)], mock_db)
+    rollups = mock_db[ROLLUP_COLLECTION]
+    rollups.update_one({'platform': '4chan', 'source': 'biz', 'day': datetime(2024, 12, 1)}, {'$inc': {'count': 5}})
+    rollups.insert_one({'platform': '4chan', 'source': 'g', 'day': datetime(2024, 12, 1), 'count': 3})
+
+    rebuild_rollups(mock_db)
+    assert stored_rollups(mock_db) == expected_rollups(chan_posts)
+
+def test_rollup_metrics_stop_before_a_midnight_end_date(chan_posts, mock_db):
+    store(chan_posts, [post(1, 0.5), post(2, -0.2, day=2), post(3, 0.4, day=3)], mock_db)
+
+    metrics = utils.rollup_metrics('4chan', datetime(2024, 12, 1), datetime(2024, 12, 3), ['biz'])
+    assert metrics['sentiment_trend']['biz']['dates'] == ['2024-12-01', '2024-12-02']
+    metrics = utils.rollup_metrics('4chan', datetime(2024, 12, 1), datetime(2024, 12, 3, 23, 59, 59), ['biz'])
+    assert metrics['sentiment_trend']['biz']['dates'] == ['2024-12-01', '2024-12-02', '2024-12-03']
@@ -0,0 +1,17 @@
+# test_sentiment.py
+
+import nltk
+import pytest
+
+import sentiment
+
+def test_missing_lexicon_is_reported_instead_of_downloaded(monkeypatch):
+    downloads = []
+    monkeypatch.setattr(sentiment, '_sia', None)
+    monkeypatch.setattr(sentiment, 'lexicon_available', lambda: False)
+    monkeypatch.setattr(nltk, 'download', lambda *args, **kwargs: downloads.append(args))
+
+    assert not sentiment.VADER_AUTO_DOWNLOAD
+    with pytest.raises(LookupError, match="nltk.downloader vader_lexicon"):
+        sentiment.compute_sentiment("Got the offer today!")
+    assert downloads == []
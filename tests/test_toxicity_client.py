@@ -0,0 +1,93 @@
+# test_toxicity_client.py
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import toxicity_client
+from toxicity_client import ToxicityClient
+
+class StubModerationHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for the ModerateHateSpeech API. The text drives the response:
+    "sleep <seconds> ..." delays it, "error" returns a 500, "toxic" is flagged.
+    """
+
+    def do_POST(self):
+        server = self.server
+        text = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['text']
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if text.startswith('sleep '):
+                time.sleep(float(text.split()[1]))
+            if 'error' in text:
+                self.send_response(500)
+                self.end_headers()
+                return
+            body = json.dumps({'class': 'flag' if 'toxic' in text else 'normal', 'confidence': 0.95}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub_url(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubModerationHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.in_flight = server.max_in_flight = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv('MODERATEHATESPEECH_TOKEN', 'test-token')
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/v1/moderate/"
+    yield url, server
+    server.shutdown()
+    server.server_close()
+
+def test_in_flight_requests_are_bounded(stub_url):
+    url, server = stub_url
+    client = ToxicityClient(api_url=url, max_in_flight=3)
+
+    started = time.perf_counter()
+    results = client.check_many([f"sleep 0.2 text {i}" for i in range(9)])
+    elapsed = time.perf_counter() - started
+
+    assert results == [False] * 9
+    assert server.max_in_flight == 3
+    assert elapsed >= 0.6  # three waves of three
+
+def test_results_follow_input_order(stub_url):
+    url, _ = stub_url
+    client = ToxicityClient(api_url=url, max_in_flight=4)
+
+    # Earlier texts answer last
+    texts = [f"sleep {0.05 * (6 - i)} {'toxic' if i % 2 else 'fine'} {i}" for i in range(6)]
+    assert client.check_many(texts) == [i % 2 == 1 for i in range(6)]
+
+def test_server_errors_and_timeouts_count_as_non_toxic(stub_url, mock_db, monkeypatch):
+    url, _ = stub_url
+    monkeypatch.setenv('MODERATEHATESPEECH_URL', url)
+    monkeypatch.setenv('TOXICITY_TIMEOUT', '0.2')
+    monkeypatch.setattr(toxicity_client, '_client', None)
+
+    texts = ['server error', 'sleep 1 toxic but too slow', 'toxic', '']
+    assert toxicity_client.classify_texts(texts) == [False, False, True, False]
+    assert toxicity_client.get_toxicity_client().api_url == url
+
+    # Failures are not cached, so they are retried on the next call
+    cached = {doc['value'] for doc in mock_db.analysis_cache.find()}
+    assert cached == {True}
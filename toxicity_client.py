@@ -0,0 +1,106 @@
+# toxicity_client.py
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from analysis_cache import toxicity_cache
+
+# Logger setup
+logger = logging.getLogger("ToxicityClient")
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+MODERATEHATESPEECH_URL = "https://api.moderatehatespeech.com/api/v1/moderate/"
+CONF_THRESHOLD = 0.9
+
+class ToxicityClient:
+    """
+    ModerateHateSpeech client shared by every crawler thread of a worker process.
+
+    Requests go through one keep-alive connection pool, and at most
+    `max_in_flight` classifications run at the same time across all callers.
+    """
+
+    def __init__(self, api_url=MODERATEHATESPEECH_URL, max_in_flight=8, timeout=10):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="toxicity")
+
+    def check(self, text):
+        """
+        Classifies a single text.
+
+        Returns:
+            bool or None: True if flagged above CONF_THRESHOLD, None if the API call failed.
+        """
+        if not text:
+            return False
+
+        api_token = os.getenv("MODERATEHATESPEECH_TOKEN")
+        if not api_token:
+            logger.error("ModerateHatespeech API token not set.")
+            return None
+
+        data = {
+            "token": api_token,
+            "text": text
+        }
+
+        try:
+            response = self.session.post(self.api_url, json=data, timeout=self.timeout)
+            response.raise_for_status()
+            result = response.json()
+            return result.get("class") == "flag" and float(result.get("confidence", 0)) > CONF_THRESHOLD
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"ModerateHatespeech API error: {e}")
+            return None
+
+    def check_many(self, texts):
+        """
+        Classifies a batch of texts concurrently (e.g. a whole subreddit page or 4chan thread).
+
+        Returns:
+            list: One bool (or None on API failure) per text, in input order.
+        """
+        texts = list(texts)
+        if sum(1 for text in texts if text) <= 1:
+            return [self.check(text) for text in texts]
+        return list(self.executor.map(self.check, texts))
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_toxicity_client():
+    """Returns the process-wide ToxicityClient, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ToxicityClient(
+                api_url=os.getenv("MODERATEHATESPEECH_URL", MODERATEHATESPEECH_URL),
+                max_in_flight=int(os.getenv("TOXICITY_MAX_IN_FLIGHT", 8)),
+                timeout=float(os.getenv("TOXICITY_TIMEOUT", 10))
+            )
+        return _client
+
+def classify_texts(texts):
+    """
+    Classifies a batch of texts concurrently; empty texts and API failures count as non-toxic.
+
+    Texts classified before (same normalized content, same model version) are
+    read from the analysis cache instead of calling the API again.
+
+    Returns:
+        list: One bool per text, in input order.
+    """
+    results = toxicity_cache.lookup(texts, get_toxicity_client().check_many)
+    return [bool(result) for result in results]
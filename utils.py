@@ -1,28 +1,160 @@
 
 
-import pymongo
-from pymongo import MongoClient
-from datetime import datetime
 import logging
-import re
 from collections import defaultdict
+from metrics import MetricsAccumulator, coerce_float, normalize_toxic, parse_date, sentiment_score_product
+from columnar import ColumnarBatch, concat_batches
+from db import LazyCollection
+from snapshots import read_snapshot_batch
+from keyword_matcher import get_matcher
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
-# MongoDB Connection URI
-MONGO_URI = "mongodb://localhost:27017/"  # Replace with your MongoDB URI
+# Collections, connected on first use (MONGO_URI / MONGO_DB, see db.py)
+reddit_posts = LazyCollection('reddit_posts')
+reddit_comments = LazyCollection('reddit_comments')
+chan_posts = LazyCollection('chan_posts')
+daily_rollups = LazyCollection('daily_rollups')
+source_versions = LazyCollection('source_versions', indexed=True)
+
+# Only the fields the dashboard metrics read, so the large text fields
+# (content, body, comment, title) never leave MongoDB for analytics queries.
+REDDIT_ANALYTICS_PROJECTION = {'_id': 0, 'subreddit': 1, 'created_utc': 1, 'sentiment': 1, 'score': 1, 'is_toxic': 1}
+CHAN_ANALYTICS_PROJECTION = {'_id': 0, 'board': 1, 'created_at': 1, 'sentiment': 1, 'score': 1, 'is_toxic': 1}
+# Text fields scanned by calculate_keyword_counts: post titles and bodies (content),
+# Reddit comments (body), 4chan posts (comment) and legacy documents (text)
+KEYWORD_TEXT_FIELDS = ('title', 'content', 'body', 'comment', 'text')
+KEYWORD_PROJECTION = {'_id': 0, 'created_utc': 1, 'created_at': 1, **dict.fromkeys(KEYWORD_TEXT_FIELDS, 1)}
+
+def _reddit_query(start_date, end_date, selected_subreddits=None):
+    """Builds the date range / subreddit filter shared by every Reddit query."""
+    query = {
+        'created_utc': {'$gte': start_date, '$lte': end_date}
+    }
+    if selected_subreddits and "all" not in selected_subreddits:
+        query['subreddit'] = {'$in': selected_subreddits}
+        logging.debug(f"Filtering Reddit data for subreddits: {selected_subreddits}")
+    return query
 
-# Initialize MongoDB Client
-client = MongoClient(MONGO_URI)
-db = client['new_crawler_db']  # Replace with your database name
+def _chan_query(start_date, end_date, selected_boards=None):
+    """Builds the date range / board filter shared by every 4chan query."""
+    query = {
+        'created_at': {'$gte': start_date, '$lte': end_date}
+    }
+    if selected_boards and "all" not in selected_boards:
+        query['board'] = {'$in': selected_boards}
+        logging.debug(f"Filtering 4chan data for boards: {selected_boards}")
+    return query
+
+def iter_reddit_data(start_date, end_date, selected_subreddits=None, batch_size=1000, projection=REDDIT_ANALYTICS_PROJECTION):
+    """
+    Streams Reddit posts and then comments within the date range without materializing them.
+
+    Parameters:
+        start_date (datetime): Start of the date range.
+        end_date (datetime): End of the date range.
+        selected_subreddits (list, optional): List of subreddits to filter. Defaults to None.
+        batch_size (int): Cursor batch size.
+        projection (dict, optional): Fields to return. Defaults to the analytics fields only.
 
-# Collections
-reddit_posts = db['reddit_posts']
-reddit_comments = db['reddit_comments']
-chan_posts = db['chan_posts']
+    Yields:
+        dict: Reddit post or comment documents.
+    """
+    query = _reddit_query(start_date, end_date, selected_subreddits)
+    yield from reddit_posts.find(query, projection, batch_size=batch_size)
+    yield from reddit_comments.find(query, projection, batch_size=batch_size)
 
-def fetch_reddit_data(start_date, end_date, selected_subreddits=None):
+def iter_4chan_data(start_date, end_date, selected_boards=None, batch_size=1000, projection=CHAN_ANALYTICS_PROJECTION):
+    """
+    Streams 4chan posts within the date range without materializing them.
+
+    Parameters:
+        start_date (datetime): Start of the date range.
+        end_date (datetime): End of the date range.
+        selected_boards (list, optional): List of boards to filter. Defaults to None.
+        batch_size (int): Cursor batch size.
+        projection (dict, optional): Fields to return. Defaults to the analytics fields only.
+
+    Yields:
+        dict: 4chan post documents.
+    """
+    query = _chan_query(start_date, end_date, selected_boards)
+    yield from chan_posts.find(query, projection, batch_size=batch_size)
+
+def fetch_reddit_columns(start_date, end_date, selected_subreddits=None, batch_size=1000):
+    """
+    Fetches the analytics fields of Reddit posts and comments as a columnar batch.
+
+    Parameters:
+        start_date (datetime): Start of the date range.
+        end_date (datetime): End of the date range.
+        selected_subreddits (list, optional): List of subreddits to filter. Defaults to None.
+        batch_size (int): Cursor batch size.
+
+    Returns:
+        ColumnarBatch: Posts and comments decoded into NumPy arrays.
+    """
+    query = _reddit_query(start_date, end_date, selected_subreddits)
+    return concat_batches([
+        ColumnarBatch.from_documents(
+            collection.find(query, REDDIT_ANALYTICS_PROJECTION, batch_size=batch_size), 'subreddit'
+        )
+        for collection in (reddit_posts, reddit_comments)
+    ])
+
+def fetch_4chan_columns(start_date, end_date, selected_boards=None, batch_size=1000):
+    """
+    Fetches the analytics fields of 4chan posts as a columnar batch.
+
+    Parameters:
+        start_date (datetime): Start of the date range.
+        end_date (datetime): End of the date range.
+        selected_boards (list, optional): List of boards to filter. Defaults to None.
+        batch_size (int): Cursor batch size.
+
+    Returns:
+        ColumnarBatch: Posts decoded into NumPy arrays.
+    """
+    query = _chan_query(start_date, end_date, selected_boards)
+    cursor = chan_posts.find(query, CHAN_ANALYTICS_PROJECTION, batch_size=batch_size)
+    return concat_batches([ColumnarBatch.from_documents(cursor, 'board')])
+
+def fetch_reddit_snapshot_columns(start_date, end_date, selected_subreddits=None, snapshot_dir=None):
+    """
+    Reads the analytics fields of Reddit posts and comments from the snapshot
+    files (see snapshots.py) instead of MongoDB.
+
+    Parameters:
+        start_date (datetime): Start of the date range.
+        end_date (datetime): End of the date range.
+        selected_subreddits (list, optional): List of subreddits to filter. Defaults to None.
+        snapshot_dir (str, optional): Snapshot directory. Defaults to SNAPSHOT_DIR.
+
+    Returns:
+        ColumnarBatch: Posts and comments of the snapshotted days in the range.
+    """
+    return concat_batches([
+        read_snapshot_batch(name, start_date, end_date, selected_subreddits, snapshot_dir=snapshot_dir)
+        for name in ('reddit_posts', 'reddit_comments')
+    ])
+
+def fetch_4chan_snapshot_columns(start_date, end_date, selected_boards=None, snapshot_dir=None):
+    """
+    Reads the analytics fields of 4chan posts from the snapshot files instead of MongoDB.
+
+    Parameters:
+        start_date (datetime): Start of the date range.
+        end_date (datetime): End of the date range.
+        selected_boards (list, optional): List of boards to filter. Defaults to None.
+        snapshot_dir (str, optional): Snapshot directory. Defaults to SNAPSHOT_DIR.
+
+    Returns:
+        ColumnarBatch: Posts of the snapshotted days in the range.
+    """
+    return read_snapshot_batch('chan_posts', start_date, end_date, selected_boards, snapshot_dir=snapshot_dir)
+
+def fetch_reddit_data(start_date, end_date, selected_subreddits=None, projection=None):
     """
     Fetches Reddit posts and comments within the specified date range and selected subreddits.
 
@@ -30,25 +162,20 @@ def fetch_reddit_data(start_date, end_date, selected_subreddits=None):
         start_date (datetime): Start of the date range.
         end_date (datetime): End of the date range.
         selected_subreddits (list, optional): List of subreddits to filter. Defaults to None.
+        projection (dict, optional): Fields to return. Defaults to whole documents.
 
     Returns:
         list: Combined list of Reddit posts and comments.
     """
-    query = {
-        'created_utc': {'$gte': start_date, '$lte': end_date}
-    }
-
-    if selected_subreddits and "all" not in selected_subreddits:
-        query['subreddit'] = {'$in': selected_subreddits}
-        logging.debug(f"Filtering Reddit data for subreddits: {selected_subreddits}")
+    query = _reddit_query(start_date, end_date, selected_subreddits)
 
     # Fetch Posts
-    cursor_posts = reddit_posts.find(query)
+    cursor_posts = reddit_posts.find(query, projection)
     posts = list(cursor_posts)
     logging.debug(f"Fetched {len(posts)} Reddit posts between {start_date} and {end_date}")
 
     # Fetch Comments
-    cursor_comments = reddit_comments.find(query)
+    cursor_comments = reddit_comments.find(query, projection)
     comments = list(cursor_comments)
     logging.debug(f"Fetched {len(comments)} Reddit comments between {start_date} and {end_date}")
 
@@ -58,7 +185,7 @@ def fetch_reddit_data(start_date, end_date, selected_subreddits=None):
 
     return combined_data
 
-def fetch_4chan_sentiment(start_date, end_date, selected_boards=None):
+def fetch_4chan_sentiment(start_date, end_date, selected_boards=None, projection=None):
     """
     Fetches 4chan posts within the specified date range and selected boards.
 
@@ -66,18 +193,14 @@ def fetch_4chan_sentiment(start_date, end_date, selected_boards=None):
         start_date (datetime): Start of the date range.
         end_date (datetime): End of the date range.
         selected_boards (list, optional): List of boards to filter. Defaults to None.
+        projection (dict, optional): Fields to return. Defaults to whole documents.
 
     Returns:
         list: List of 4chan posts.
     """
-    query = {
-        'created_at': {'$gte': start_date, '$lte': end_date}
-    }
-    if selected_boards and "all" not in selected_boards:
-        query['board'] = {'$in': selected_boards}
-        logging.debug(f"Filtering 4chan data for boards: {selected_boards}")
+    query = _chan_query(start_date, end_date, selected_boards)
 
-    cursor = chan_posts.find(query)
+    cursor = chan_posts.find(query, projection)
     data = list(cursor)
     logging.debug(f"Fetched {len(data)} 4chan posts between {start_date} and {end_date}")
     return data
@@ -87,41 +210,23 @@ def calculate_sentiment_trend(data):
     Calculates the average sentiment score per day.
 
     Parameters:
-        data (list): List of documents (posts/comments).
+        data (list or ColumnarBatch): List of documents (posts/comments) or a columnar batch.
 
     Returns:
         tuple: (sorted_dates, average_sentiments)
     """
+    if isinstance(data, ColumnarBatch):
+        return data.sentiment_trend()
+
     trend = defaultdict(list)
     for doc in data:
-        date = doc.get('created_utc') or doc.get('created_at')
-        sentiment = doc.get('sentiment')
         # Ensure sentiment is a float, default to 0.0 if None or invalid
-        if sentiment is None:
-            sentiment = 0.0
-        elif not isinstance(sentiment, (int, float)):
-            try:
-                sentiment = float(sentiment)
-            except (ValueError, TypeError):
-                sentiment = 0.0
-
-        if not date:
-            logging.warning("Skipping document due to missing date")
-            continue  # Skip documents with missing date
-        try:
-            if isinstance(date, (int, float)):
-                date = datetime.utcfromtimestamp(date)
-            elif isinstance(date, str):
-                # Attempt to parse ISO format first
-                try:
-                    date = datetime.fromisoformat(date)
-                except ValueError:
-                    date = datetime.strptime(date, '%Y-%m-%d')
-        except Exception as date_e:
-            logging.warning(f"Invalid date format: {date}. Error: {str(date_e)}")
-            continue
-        date = date.date()
-        trend[date].append(sentiment)
+        sentiment = coerce_float(doc.get('sentiment'))
+
+        date = parse_date(doc.get('created_utc') or doc.get('created_at'))
+        if date is None:
+            continue  # Skip documents with missing or invalid date
+        trend[date.date()].append(sentiment)
 
     if not trend:
         logging.warning("No valid data found to calculate sentiment trend.")
@@ -138,27 +243,19 @@ def calculate_toxicity_distribution(data, platform='reddit'):
     Calculates the toxicity distribution in the data.
 
     Parameters:
-        data (list): List of documents (posts/comments).
+        data (list or ColumnarBatch): List of documents (posts/comments) or a columnar batch.
         platform (str): 'reddit' or '4chan'.
 
     Returns:
         dict: {'toxic': count, 'non_toxic': count}
     """
+    if isinstance(data, ColumnarBatch):
+        return data.toxicity_distribution()
+
     toxicity = defaultdict(int)
     for doc in data:
-        is_toxic = doc.get('is_toxic', False)
-        
         # Normalize different representations of toxic content
-        if isinstance(is_toxic, str):
-            is_toxic_normalized = is_toxic.lower() in ['true', '1', 'yes']
-        elif isinstance(is_toxic, (int, float)):
-            is_toxic_normalized = bool(is_toxic)
-        elif isinstance(is_toxic, bool):
-            is_toxic_normalized = is_toxic
-        else:
-            is_toxic_normalized = False  # Default to False if unknown type
-        
-        if is_toxic_normalized:
+        if normalize_toxic(doc.get('is_toxic', False)):
             toxicity['toxic'] += 1
         else:
             toxicity['non_toxic'] += 1
@@ -177,24 +274,17 @@ def calculate_average_scores(data, platform='reddit'):
     Calculates the average score across all documents.
 
     Parameters:
-        data (list): List of documents (posts/comments).
+        data (list or ColumnarBatch): List of documents (posts/comments) or a columnar batch.
         platform (str): 'reddit' or '4chan'.
 
     Returns:
         float: Average score.
     """
-    scores = []
-    for doc in data:
-        score = doc.get('score')
-        # Ensure score is a float, default to 0.0 if None or invalid
-        if score is None:
-            score = 0.0
-        elif not isinstance(score, (int, float)):
-            try:
-                score = float(score)
-            except (ValueError, TypeError):
-                score = 0.0
-        scores.append(score)
+    if isinstance(data, ColumnarBatch):
+        return data.average_score()
+
+    # Ensure score is a float, default to 0.0 if None or invalid
+    scores = [coerce_float(doc.get('score')) for doc in data]
 
     if scores:
         avg_score = sum(scores) / len(scores)
@@ -208,56 +298,25 @@ def calculate_sentiment_score_trend(data, platform='reddit'):
     Calculates the average sentiment * score per day.
 
     Parameters:
-        data (list): List of documents (posts/comments).
+        data (list or ColumnarBatch): List of documents (posts/comments) or a columnar batch.
         platform (str): 'reddit' or '4chan'.
 
     Returns:
         tuple: (sorted_dates, average_sentiment_scores)
     """
+    if isinstance(data, ColumnarBatch):
+        return data.sentiment_score_trend()
+
     trend = defaultdict(list)
     for doc in data:
-        date = doc.get('created_utc') or doc.get('created_at')
-        sentiment = doc.get('sentiment')
-        score = doc.get('score')
+        # Ensure sentiment and score are floats, default to 0.0 if None or invalid
+        sentiment = coerce_float(doc.get('sentiment'))
+        score = coerce_float(doc.get('score'))
 
-        # Ensure sentiment is a float, default to 0.0 if None or invalid
-        if sentiment is None:
-            sentiment = 0.0
-        elif not isinstance(sentiment, (int, float)):
-            try:
-                sentiment = float(sentiment)
-            except (ValueError, TypeError):
-                sentiment = 0.0
-
-        # Ensure score is a float, default to 0.0 if None or invalid
-        if score is None:
-            score = 0.0
-        elif not isinstance(score, (int, float)):
-            try:
-                score = float(score)
-            except (ValueError, TypeError):
-                score = 0.0
-
-        if not date:
-            logging.warning("Skipping document due to missing date")
-            continue  # Skip documents with missing date
-        try:
-            if isinstance(date, (int, float)):
-                date = datetime.utcfromtimestamp(date)
-            elif isinstance(date, str):
-                # Attempt to parse ISO format first
-                try:
-                    date = datetime.fromisoformat(date)
-                except ValueError:
-                    date = datetime.strptime(date, '%Y-%m-%d')
-        except Exception as date_e:
-            logging.warning(f"Invalid date format: {date}. Error: {str(date_e)}")
-            continue
-        date = date.date()
-        sentiment_score = sentiment * score
-        if sentiment < 0 and score < 0:
-            sentiment_score = -sentiment_score
-        trend[date].append(sentiment_score)
+        date = parse_date(doc.get('created_utc') or doc.get('created_at'))
+        if date is None:
+            continue  # Skip documents with missing or invalid date
+        trend[date.date()].append(sentiment_score_product(sentiment, score))
 
     if not trend:
         logging.warning("No valid data found to calculate sentiment score trend.")
@@ -291,63 +350,280 @@ def get_available_boards():
     logging.debug(f"Available boards: {boards}")
     return boards
 
-def calculate_keyword_counts(data, positive_synonyms, negative_synonyms):
+def calculate_keyword_counts(data, lexicons=None):
     """
-    Calculates the count of positive and negative keywords in the provided data.
+    Counts lexicon phrase matches per day across every text field of the documents.
 
     Parameters:
-        data (list): List of documents (posts/comments).
-        positive_synonyms (list): List of positive keyword synonyms.
-        negative_synonyms (list): List of negative keyword synonyms.
+        data (iterable): Documents (posts/comments), e.g. a cursor.
+        lexicons (dict, optional): {category: [phrases]}. Defaults to the lexicon config file.
 
     Returns:
-        dict: A dictionary with dates as keys and counts of positive and negative keywords.
+        dict: A dictionary with dates as keys and a count per lexicon category.
               Format: {
-                  'YYYY-MM-DD': {'positive': count, 'negative': count},
+                  'YYYY-MM-DD': {'positive': count, 'negative': count, ...},
                   ...
               }
     """
-    keyword_counts = defaultdict(lambda: {'positive': 0, 'negative': 0})
-    
-    # Compile regex patterns for efficiency
-    positive_pattern = re.compile(r'\b(' + '|'.join(re.escape(word) for word in positive_synonyms) + r')\b', re.IGNORECASE)
-    negative_pattern = re.compile(r'\b(' + '|'.join(re.escape(word) for word in negative_synonyms) + r')\b', re.IGNORECASE)
-    
+    matcher = get_matcher(lexicons)
+    daily_counts = {}
+
     for doc in data:
         # Extract date
-        date = doc.get('created_utc') or doc.get('created_at')
-        if not date:
-            logging.warning("Skipping document due to missing date")
-            continue  # Skip documents without a date
-        try:
-            if isinstance(date, (int, float)):
-                date = datetime.utcfromtimestamp(date)
-            elif isinstance(date, str):
-                # Attempt to parse ISO format first
-                try:
-                    date = datetime.fromisoformat(date)
-                except ValueError:
-                    date = datetime.strptime(date, '%Y-%m-%d')
-        except Exception as date_e:
-            logging.warning(f"Invalid date format: {date}. Error: {str(date_e)}")
-            continue
+        date = parse_date(doc.get('created_utc') or doc.get('created_at'))
+        if date is None:
+            continue  # Skip documents without a valid date
         date_str = date.date().strftime('%Y-%m-%d')
-        
-        # Extract text content
-        text = doc.get('title') or doc.get('body') or doc.get('text') or ''
-        if not isinstance(text, str):
-            text = str(text)
-        
-        # Find all positive and negative matches
-        positive_matches = positive_pattern.findall(text)
-        negative_matches = negative_pattern.findall(text)
-        
-        # Update counts
-        keyword_counts[date_str]['positive'] += len(positive_matches)
-        keyword_counts[date_str]['negative'] += len(negative_matches)
-    
-    # Convert defaultdict to regular dict for JSON serialization
-    keyword_counts = dict(keyword_counts)
-    
+
+        counts = daily_counts.get(date_str)
+        if counts is None:
+            counts = daily_counts[date_str] = [0] * len(matcher.categories)
+
+        # Fields are scanned separately so a phrase never spans a title and a body
+        for field in KEYWORD_TEXT_FIELDS:
+            text = doc.get(field)
+            if text:
+                matcher.count(text if isinstance(text, str) else str(text), counts)
+
+    keyword_counts = {
+        date_str: dict(zip(matcher.categories, counts))
+        for date_str, counts in daily_counts.items()
+    }
+
     logging.debug(f"Calculated keyword counts for {len(keyword_counts)} days")
     return keyword_counts
+
+def calculate_source_metrics(data, sources, source_field, platform='reddit'):
+    """
+    Calculates every dashboard metric for each selected source in a single pass.
+
+    This is the fallback for the aggregation pipeline and produces the exact
+    response shape returned by the /api/*/data endpoints. `data` may be a list
+    or a live cursor; documents are folded into per-(source, day) sums as they
+    are read, so memory does not grow with the number of documents.
+
+    Parameters:
+        data (iterable): Documents (posts/comments), e.g. from iter_reddit_data.
+        sources (list): Selected subreddits or boards, in display order.
+        source_field (str): 'subreddit' or 'board'.
+        platform (str): 'reddit' or '4chan'.
+
+    Returns:
+        dict or None: {'sentiment_trend', 'toxicity_distribution', 'average_scores', 'sentiment_score_trend'},
+                      or None if `data` was empty.
+    """
+    accumulator = MetricsAccumulator(source_field, platform=platform).consume(data)
+    if not accumulator.documents:
+        return None
+    return accumulator.to_response(sources)
+
+def calculate_columnar_metrics(batch, sources, platform='reddit'):
+    """
+    Calculates every dashboard metric for each selected source from a columnar batch.
+
+    Parameters:
+        batch (ColumnarBatch): Batch from fetch_reddit_columns / fetch_4chan_columns.
+        sources (list): Selected subreddits or boards, in display order.
+        platform (str): 'reddit' or '4chan'.
+
+    Returns:
+        dict or None: Same shape as calculate_source_metrics, or None if the batch is empty.
+    """
+    if not len(batch):
+        return None
+
+    sentiment_trend = {}
+    toxicity_distribution = {}
+    average_scores = {}
+    sentiment_score_trend = {}
+
+    for source in sources:
+        source_batch = batch.select(source)
+        if not len(source_batch):
+            logging.warning(f"No data found for source: {source}")
+            continue
+
+        dates, avg_sentiments = calculate_sentiment_trend(source_batch)
+        dates_ss, avg_sentiment_scores = calculate_sentiment_score_trend(source_batch, platform=platform)
+        sentiment_trend[source] = {
+            'dates': [date.strftime('%Y-%m-%d') for date in dates],
+            'values': avg_sentiments
+        }
+        toxicity_distribution[source] = calculate_toxicity_distribution(source_batch, platform=platform)
+        average_scores[source] = calculate_average_scores(source_batch, platform=platform)
+        sentiment_score_trend[source] = {
+            'dates': [date.strftime('%Y-%m-%d') for date in dates_ss],
+            'values': avg_sentiment_scores
+        }
+
+    return {
+        'sentiment_trend': sentiment_trend,
+        'toxicity_distribution': toxicity_distribution,
+        'average_scores': average_scores,
+        'sentiment_score_trend': sentiment_score_trend
+    }
+
+def _to_double(field):
+    """Aggregation expression mirroring the Python float coercion (None/invalid -> 0.0)."""
+    return {'$convert': {'input': field, 'to': 'double', 'onError': 0.0, 'onNull': 0.0}}
+
+def _metrics_pipeline(query, date_field, source_field, union_with=None):
+    """
+    Builds the aggregation pipeline computing per-day and per-source metrics.
+
+    The '$project' stage applies the same coercions as the calculate_* functions:
+    sentiment and score default to 0.0, is_toxic accepts booleans, numbers and
+    'true'/'1'/'yes' strings, and sentiment * score is negated when both are negative.
+    """
+    pipeline = [{'$match': query}]
+    if union_with:
+        pipeline.append({'$unionWith': {'coll': union_with, 'pipeline': [{'$match': query}]}})
+
+    pipeline.append({'$project': {
+        '_id': 0,
+        'source': '$' + source_field,
+        'date': '$' + date_field,
+        'sentiment': _to_double('$sentiment'),
+        'score': _to_double('$score'),
+        'is_toxic': {'$switch': {
+            'branches': [
+                {'case': {'$eq': [{'$type': '$is_toxic'}, 'string']},
+                 'then': {'$in': [{'$toLower': '$is_toxic'}, ['true', '1', 'yes']]}},
+                {'case': {'$in': [{'$type': '$is_toxic'}, ['bool', 'int', 'long', 'double', 'decimal']]},
+                 'then': {'$toBool': '$is_toxic'}},
+            ],
+            'default': False
+        }}
+    }})
+    pipeline.append({'$addFields': {
+        'sentiment_score': {'$cond': [
+            {'$and': [{'$lt': ['$sentiment', 0]}, {'$lt': ['$score', 0]}]},
+            {'$multiply': [-1, '$sentiment', '$score']},
+            {'$multiply': ['$sentiment', '$score']}
+        ]}
+    }})
+    pipeline.append({'$facet': {
+        'daily': [
+            {'$match': {'date': {'$type': 'date'}}},
+            {'$group': {
+                '_id': {
+                    'source': '$source',
+                    'day': {'$dateTrunc': {'date': '$date', 'unit': 'day'}}
+                },
+                'sentiment_sum': {'$sum': '$sentiment'},
+                'sentiment_score_sum': {'$sum': '$sentiment_score'},
+                'count': {'$sum': 1}
+            }},
+            {'$sort': {'_id.day': 1}}
+        ],
+        'totals': [
+            {'$group': {
+                '_id': '$source',
+                'toxic': {'$sum': {'$cond': ['$is_toxic', 1, 0]}},
+                'non_toxic': {'$sum': {'$cond': ['$is_toxic', 0, 1]}},
+                'score_sum': {'$sum': '$score'},
+                'count': {'$sum': 1}
+            }}
+        ]
+    }})
+    return pipeline
+
+def _aggregate_source_metrics(collection, query, date_field, source_field, sources, platform, union_with=None):
+    """
+    Runs the metrics pipeline and reshapes the facets into the dashboard response.
+
+    Returns:
+        dict or None: Same shape as calculate_source_metrics, or None if nothing matched.
+    """
+    pipeline = _metrics_pipeline(query, date_field, source_field, union_with=union_with)
+    result = next(collection.aggregate(pipeline, allowDiskUse=True), None)
+    if not result or not result['totals']:
+        return None
+
+    accumulator = MetricsAccumulator(source_field, platform=platform)
+    for row in result['totals']:
+        accumulator.add_totals(row['_id'], row['toxic'], row['non_toxic'], row['score_sum'])
+    for row in result['daily']:
+        accumulator.add_daily(
+            row['_id']['source'], row['_id']['day'].date(),
+            row['sentiment_sum'], row['sentiment_score_sum'], row['count']
+        )
+
+    logging.debug(f"Aggregated metrics for {len(result['totals'])} {source_field}s in MongoDB")
+    return accumulator.to_response(sources)
+
+def aggregate_reddit_metrics(start_date, end_date, selected_subreddits):
+    """
+    Computes the Reddit dashboard metrics server-side with an aggregation pipeline.
+
+    Posts and comments are combined with '$unionWith', so only the per-day and
+    per-subreddit aggregates leave MongoDB. Requires MongoDB 5.0+ for '$dateTrunc'.
+
+    Parameters:
+        start_date (datetime): Start of the date range.
+        end_date (datetime): End of the date range.
+        selected_subreddits (list): List of subreddits to report on.
+
+    Returns:
+        dict or None: Dashboard response, or None if no data matched.
+    """
+    query = _reddit_query(start_date, end_date, selected_subreddits)
+    return _aggregate_source_metrics(
+        reddit_posts, query, 'created_utc', 'subreddit', selected_subreddits, 'reddit',
+        union_with=reddit_comments.name
+    )
+
+def aggregate_4chan_metrics(start_date, end_date, selected_boards):
+    """
+    Computes the 4chan dashboard metrics server-side with an aggregation pipeline.
+
+    Parameters:
+        start_date (datetime): Start of the date range.
+        end_date (datetime): End of the date range.
+        selected_boards (list): List of boards to report on.
+
+    Returns:
+        dict or None: Dashboard response, or None if no data matched.
+    """
+    query = _chan_query(start_date, end_date, selected_boards)
+    return _aggregate_source_metrics(chan_posts, query, 'created_at', 'board', selected_boards, '4chan')
+
+def rollup_metrics(platform, start_date, end_date, selected_sources):
+    """
+    Computes the dashboard metrics from the daily_rollups collection maintained at ingest time.
+
+    Reads one small document per (source, day) instead of scanning raw posts.
+    Rollups are day-granular: a day is included if it starts before end_date, so an
+    end_date at midnight excludes that day like the other modes, while a later
+    end_date includes the whole of its day.
+
+    Parameters:
+        platform (str): 'reddit' or '4chan'.
+        start_date (datetime): Start of the date range.
+        end_date (datetime): End of the date range.
+        selected_sources (list): Subreddits or boards to report on.
+
+    Returns:
+        dict or None: Dashboard response, or None if no rollups matched.
+    """
+    source_field = 'subreddit' if platform == 'reddit' else 'board'
+    query = {
+        'platform': platform,
+        'day': {'$gte': start_date.replace(hour=0, minute=0, second=0, microsecond=0), '$lt': end_date}
+    }
+    if selected_sources and "all" not in selected_sources:
+        query['source'] = {'$in': selected_sources}
+
+    accumulator = MetricsAccumulator(source_field, platform=platform)
+    for row in daily_rollups.find(query, {'_id': 0}):
+        accumulator.add_totals(row['source'], row.get('toxic', 0), row.get('non_toxic', 0), row.get('score_sum', 0.0))
+        if row.get('count'):
+            accumulator.add_daily(
+                row['source'], row['day'].date(),
+                row.get('sentiment_sum', 0.0), row.get('sentiment_score_sum', 0.0), row['count']
+            )
+
+    if not accumulator.documents:
+        return None
+    logging.debug(f"Read {platform} metrics from daily rollups between {start_date} and {end_date}")
+    return accumulator.to_response(selected_sources)